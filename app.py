@@ -1,12 +1,35 @@
-from flask import render_template, request, redirect, url_for, flash, abort
+from flask import render_template, request, redirect, url_for, flash, abort, Response, stream_with_context, jsonify, \
+    send_file
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
 from bioterio import app, db
-from bioterio.models import Cruza, Camada, Macho, Hembra, Observacion, User
+from bioterio.models import Cepa, Cruza, Camada, Macho, Hembra, Observacion, User, Trabajo, usuarios_cache
 from bioterio.forms import RegistrationForm, LoginForm
-from flask_login import login_user, login_required, logout_user
-
-cepa_list = ['C57B6/J', 'CD45.1', 'RAG1+/-']
+from bioterio.cajas import verificar_caja, regresar_letra_cepa, siguiente_caja, apartar_caja
+from bioterio.cepas import cepas as lista_cepas, edad_destete
+from bioterio.censo import censo, edades as reporte_edades, tabla_edades, TOPE_SEMANAS, SEXOS
+from bioterio.contadores import contadores
+from bioterio.paginacion import pagina, leer_filtros, filtrar, argumentos
+from bioterio.importar import TIPOS, importar_archivo
+from bioterio.exportar import TABLAS, generar_csv
+from bioterio.busqueda import buscar as buscar_observaciones
+from bioterio.destete import camadas_pendientes, destetar_lote
+from bioterio.linaje import MODELOS, MAXIMO_GENERACIONES, GENERACIONES, ancestros, descendientes, leer_cajas, \
+    enlazar_progenitores, nombres_progenitores, olvidar_caja
+from bioterio.pronostico import SEMANAS, MAXIMO_SEMANAS, pronosticar
+from bioterio.respuestas import cachear_pagina, paginas_cache
+from bioterio.metricas import histograma, CUBETAS
+from bioterio.permisos import admin_requerido, es_admin
+from bioterio.api import api
+from bioterio.archivo import HISTORIAL, retirar, cerrar, historial as consultar_historial
+from bioterio.respaldo import ErrorRespaldo, respaldar, respaldos as lista_respaldos
+from bioterio.en_vivo import publicador, admite_flujos
+from bioterio.trabajos import TIPOS as TIPOS_TRABAJO, TERMINADOS, encolar, cancelar as cancelar_trabajo, \
+    ruta_resultado, datos_trabajo
+from flask_login import login_user, login_required, logout_user, current_user
+from sqlalchemy.exc import IntegrityError
+
+app.register_blueprint(api)
 
 
 @app.route('/')
@@ -16,6 +39,7 @@ def index():
 
 @app.route("/cruza", methods=['POST', 'GET'])
 @login_required
+@cachear_pagina
 def cruza():
     if request.method == 'POST':
         caja = request.form['caja'].upper()
@@ -25,19 +49,37 @@ def cruza():
         hembras = int(request.form['hembras'])
         new_cruza = Cruza(caja=caja, cepa=cepa, fecha_cruza=fecha_cruza, machos=machos, hembras=hembras)
 
-        if verificar_caja(caja, cepa) and existe_caja(caja) == False:
+        if verificar_caja(caja, cepa) and apartar_caja(caja, current_user.id):
             try:
                 db.session.add(new_cruza)
+                enlazar_progenitores(new_cruza, leer_cajas(request.form.get('cajas_machos')),
+                                     leer_cajas(request.form.get('cajas_hembras')))
                 db.session.commit()
                 return redirect(url_for('cruza'))
+            except ValueError as error:
+                db.session.rollback()
+                return render_template("error.html", error=str(error))
             except:
                 return redirect(url_for('user_error'))
         else:
             return render_template("error.html",
                                    error="El nombre de la caja no coincide con el tipo de la cepa o la caja ya existe.")
     else:
-        cruzas = Cruza.query.order_by(Cruza.fecha_cruza.desc()).all()
-        return render_template("cruza.html", cruzas=cruzas, cepa_list=cepa_list)
+        try:
+            filtros = leer_filtros(request.args)
+            consulta = filtrar(Cruza.query.filter(Cruza.fecha_cierre.is_(None)), filtros, Cruza.caja, Cruza.cepa,
+                               Cruza.fecha_cruza)
+            cruzas, siguiente = pagina(consulta, [Cruza.fecha_cruza, Cruza.id], request.args.get('cursor'),
+                                       descendente=True)
+        except ValueError:
+            return redirect(url_for('user_error'))
+
+        # Número de camadas sólo de las cruzas de esta página, en una consulta
+        camadas = dict(db.session.query(Camada.cruza_id, db.func.count(Camada.id))
+                       .filter(Camada.cruza_id.in_([x.id for x in cruzas]))
+                       .group_by(Camada.cruza_id).all())
+        return render_template("cruza.html", cruzas=cruzas, camadas=camadas, cepa_list=lista_cepas(),
+                               siguiente=siguiente, args=argumentos(request.args))
 
 
 @app.route("/camada/<int:id>", methods=['POST', 'GET'])
@@ -45,8 +87,10 @@ def cruza():
 def camada(id):
     cruza = Cruza.query.get_or_404(id)
     if request.method == 'POST':
+        if cruza.fecha_cierre is not None:
+            return render_template("error.html", error="La cruza {} está cerrada.".format(cruza.caja))
         fecha_nacimiento = datetime.strptime(request.form['fecha_cruza'], "%Y-%m-%d")
-        fecha_destete = fecha_nacimiento + relativedelta(days=+28)
+        fecha_destete = fecha_nacimiento + relativedelta(days=+edad_destete(cruza.cepa))
         machos = int(request.form['machos'])
         hembras = int(request.form['hembras'])
         new_camada = Camada(fecha_nacimiento=fecha_nacimiento, fecha_destete=fecha_destete, machos=machos,
@@ -68,7 +112,11 @@ def macho(id):
     camada = Camada.query.get_or_404(id)
     cruza = Cruza.query.get_or_404(camada.cruza_id)
 
-    if request.method == 'POST' and camada.macho_is_created == False:
+    if camada.macho_is_created:
+        # Ya se destetó: no hay que ofrecer otra caja
+        return redirect(url_for('destete'))
+
+    if request.method == 'POST':
         caja = request.form['caja'].upper()
         try:
             fecha_destete = datetime.strptime(request.form['fecha_destete'], "%Y-%m-%d")
@@ -77,25 +125,29 @@ def macho(id):
         if caja and camada.fecha_destete:
             padres = cruza.caja
 
-            if verificar_caja(caja, cruza.cepa) and existe_caja(caja) == False:
-                macho = Macho(caja=caja, fecha_nacimiento=camada.fecha_nacimiento, fecha_destete=fecha_destete,
-                              cantidad=camada.machos, cepa=cruza.cepa, cruza=cruza, padres=padres)
-                try:
-                    db.session.add(macho)
-                    db.session.commit()
-                    camada.macho_is_created = True
-                    db.session.commit()
-                    return redirect(url_for('destete'))
-                except Exception as e:
-                    return str(e)
-            else:
-                return render_template("error.html",
-                                       error="El nombre de la caja no coincide con el tipo de la cepa o la caja ya existe.")
+            if not verificar_caja(caja, cruza.cepa):
+                return render_template("error.html", error="El nombre de la caja no coincide con el tipo de la cepa.")
+            if not apartar_caja(caja, current_user.id):
+                # Alguien la registró o la apartó desde que se sugirió: se ofrece la siguiente
+                return render_template("macho.html", cruza=cruza, camada=camada, caja=siguiente_caja(cruza.cepa),
+                                       aviso="La caja {} ya existe o está apartada.".format(caja))
+            macho = Macho(caja=caja, fecha_nacimiento=camada.fecha_nacimiento, fecha_destete=fecha_destete,
+                          cantidad=camada.machos, cepa=cruza.cepa, cruza=cruza, padres=padres)
+            try:
+                db.session.add(macho)
+                camada.macho_is_created = True
+                db.session.commit()
+                return redirect(url_for('destete'))
+            except Exception as e:
+                return str(e)
         else:
             return redirect(url_for('user_error'))
     else:
-        caja = siguiente_caja(cruza.cepa)
-        return render_template("macho.html", cruza=cruza, camada=camada, caja=caja)
+        # Sólo se sugiere la siguiente caja libre; se aparta al enviar el formulario, así
+        # recargar, precargar o abandonar la página no gasta reservas
+        if regresar_letra_cepa(cruza.cepa) is None:
+            return render_template("error.html", error="La cepa {} no tiene prefijo de cajas.".format(cruza.cepa))
+        return render_template("macho.html", cruza=cruza, camada=camada, caja=siguiente_caja(cruza.cepa))
 
 
 @app.route("/hembra/<int:id>", methods=['POST', 'GET'])
@@ -104,7 +156,11 @@ def hembra(id):
     camada = Camada.query.get_or_404(id)
     cruza = Cruza.query.get_or_404(camada.cruza_id)
 
-    if request.method == 'POST' and camada.hembra_is_created == False:
+    if camada.hembra_is_created:
+        # Ya se destetó: no hay que ofrecer otra caja
+        return redirect(url_for('destete'))
+
+    if request.method == 'POST':
         caja = request.form['caja'].upper()
         try:
             fecha_destete = datetime.strptime(request.form['fecha_destete'], "%Y-%m-%d")
@@ -113,61 +169,44 @@ def hembra(id):
         if caja and camada.fecha_destete:
             padres = cruza.caja
 
-            if verificar_caja(caja, cruza.cepa) and existe_caja(caja) == False:
-                hembra = Hembra(caja=caja, fecha_nacimiento=camada.fecha_nacimiento, fecha_destete=fecha_destete,
-                                cantidad=camada.hembras, cepa=cruza.cepa, cruza=cruza, padres=padres)
-                try:
-                    db.session.add(hembra)
-                    db.session.commit()
-                    camada.hembra_is_created = True
-                    db.session.commit()
-                    return redirect(url_for('destete'))
-                except Exception as e:
-                    return str(e)
-            else:
-                return render_template("error.html",
-                                       error="El nombre de la caja no coincide con el tipo de la cepa o la caja ya existe.")
+            if not verificar_caja(caja, cruza.cepa):
+                return render_template("error.html", error="El nombre de la caja no coincide con el tipo de la cepa.")
+            if not apartar_caja(caja, current_user.id):
+                # Alguien la registró o la apartó desde que se sugirió: se ofrece la siguiente
+                return render_template("hembra.html", cruza=cruza, camada=camada, caja=siguiente_caja(cruza.cepa),
+                                       aviso="La caja {} ya existe o está apartada.".format(caja))
+            hembra = Hembra(caja=caja, fecha_nacimiento=camada.fecha_nacimiento, fecha_destete=fecha_destete,
+                            cantidad=camada.hembras, cepa=cruza.cepa, cruza=cruza, padres=padres)
+            try:
+                db.session.add(hembra)
+                camada.hembra_is_created = True
+                db.session.commit()
+                return redirect(url_for('destete'))
+            except Exception as e:
+                return str(e)
         else:
             return redirect(url_for('user_error'))
     else:
-        caja = siguiente_caja(cruza.cepa)
-        return render_template("hembra.html", cruza=cruza, camada=camada, caja=caja)
-
-
-def calculate_age(born):
-    today = date.today()
-    diferencia = today - born
-
-    return str(round(diferencia.days // 7, 0)) + " semanas y " + str((round(diferencia.days % 7, 0))) + " días"
+        # Sólo se sugiere la siguiente caja libre; se aparta al enviar el formulario, así
+        # recargar, precargar o abandonar la página no gasta reservas
+        if regresar_letra_cepa(cruza.cepa) is None:
+            return render_template("error.html", error="La cepa {} no tiene prefijo de cajas.".format(cruza.cepa))
+        return render_template("hembra.html", cruza=cruza, camada=camada, caja=siguiente_caja(cruza.cepa))
 
 
 @app.route("/macho-hembra/", methods=['GET'])
 @login_required
+@cachear_pagina
 def macho_hembra_get():
-    machos_a = Macho.query.filter(Macho.caja.contains('A')).order_by(Macho.fecha_destete).all()
-    hembras_a = Hembra.query.filter(Hembra.caja.contains('A')).order_by(Hembra.fecha_destete).all()
-    machos_b = Macho.query.filter(Macho.caja.contains('B')).order_by(Macho.fecha_destete).all()
-    hembras_b = Hembra.query.filter(Hembra.caja.contains('B')).order_by(Hembra.fecha_destete).all()
-    machos_c = Macho.query.filter(Macho.caja.contains('C')).order_by(Macho.fecha_destete).all()
-    hembras_c = Hembra.query.filter(Hembra.caja.contains('C')).order_by(Hembra.fecha_destete).all()
-
-    total_macho_a = sum([x.cantidad for x in machos_a])
-    total_macho_b = sum([x.cantidad for x in machos_b])
-    total_macho_c = sum([x.cantidad for x in machos_c])
-
-    total_hembra_a = sum([x.cantidad for x in hembras_a])
-    total_hembra_b = sum([x.cantidad for x in hembras_b])
-    total_hembra_c = sum([x.cantidad for x in hembras_c])
-
-    calculate = calculate_age
+    try:
+        filtros = leer_filtros(request.args)
+        secciones, siguiente = censo(lista_cepas(), filtros, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('user_error'))
 
-    return render_template("macho-hembra.html", machos_a=machos_a, total_macho_a=total_macho_a,
-                           hembras_a=hembras_a, total_hembra_a=total_hembra_a,
-                           machos_b=machos_b, total_macho_b=total_macho_b,
-                           hembras_b=hembras_b, total_hembra_b=total_hembra_b,
-                           machos_c=machos_c, total_macho_c=total_macho_c,
-                           hembras_c=hembras_c, total_hembra_c=total_hembra_c,
-                           calculateage=calculate)
+    return render_template("macho-hembra.html", censo=secciones, resumen=contadores(lista_cepas()),
+                           letra=regresar_letra_cepa, cepa_list=lista_cepas(),
+                           siguiente=siguiente, args=argumentos(request.args))
 
 
 @app.route("/observacion-macho/<int:id>", methods=['POST', 'GET'])
@@ -208,6 +247,34 @@ def observacion_hembra(id):
         return render_template("observacion-hembra.html", hembra=hembra)
 
 
+@app.route("/buscar", methods=['GET'])
+@login_required
+def buscar():
+    texto = request.args.get('q', '').strip()
+    pagina = request.args.get('pagina', 1, type=int)
+    if pagina < 1:
+        return redirect(url_for('user_error'))
+
+    resultados, hay_siguiente = buscar_observaciones(texto, pagina)
+    return render_template("buscar.html", texto=texto, resultados=resultados, pagina=pagina,
+                           hay_siguiente=hay_siguiente)
+
+
+@app.route("/pedigri/<sexo>/<int:id>", methods=['GET'])
+@login_required
+def pedigri(sexo, id):
+    if sexo not in MODELOS:
+        abort(404)
+    caja = MODELOS[sexo].query.get_or_404(id)
+    generaciones = request.args.get('generaciones', GENERACIONES, type=int)
+    if not 1 <= generaciones <= MAXIMO_GENERACIONES:
+        return redirect(url_for('user_error'))
+
+    return render_template("pedigri.html", sexo=sexo, caja=caja, generaciones=generaciones,
+                           maximo=MAXIMO_GENERACIONES, ancestros=ancestros(caja, generaciones),
+                           descendientes=descendientes(sexo, caja, generaciones))
+
+
 @app.route('/delete/<int:id>')
 @login_required
 def delete(id):
@@ -226,6 +293,7 @@ def delete(id):
 def delete_macho(id):
     macho_to_delete = Macho.query.get_or_404(id)
     try:
+        olvidar_caja('macho', macho_to_delete.id)
         db.session.delete(macho_to_delete)
         db.session.commit()
         return redirect(url_for('macho_hembra_get'))
@@ -239,6 +307,7 @@ def delete_hembra(id):
     hembra_to_delete = Hembra.query.get_or_404(id)
 
     try:
+        olvidar_caja('hembra', hembra_to_delete.id)
         db.session.delete(hembra_to_delete)
         db.session.commit()
         return redirect(url_for('macho_hembra_get'))
@@ -246,6 +315,49 @@ def delete_hembra(id):
         return redirect(url_for('user_error'))
 
 
+@app.route('/cerrar/<int:id>')
+@login_required
+def cerrar_cruza(id):
+    cruza = Cruza.query.get_or_404(id)
+    try:
+        cerrar(cruza)
+    except ValueError as error:
+        return render_template("error.html", error=str(error))
+    db.session.commit()
+    return redirect(url_for('cruza'))
+
+
+@app.route('/retirar-<sexo>/<int:id>')
+@login_required
+def retirar_caja(sexo, id):
+    if sexo not in MODELOS:
+        abort(404)
+    caja = MODELOS[sexo].query.get_or_404(id)
+    try:
+        retirar(caja)
+    except ValueError as error:
+        return render_template("error.html", error=str(error))
+    db.session.commit()
+    return redirect(url_for('macho_hembra_get'))
+
+
+@app.route('/historial', methods=['GET'])
+@login_required
+def historial():
+    # Sólo lectura: lo que `flask archivar` sacó de las tablas activas
+    tabla = request.args.get('tabla', 'macho')
+    if tabla not in HISTORIAL:
+        abort(404)
+    try:
+        filtros = leer_filtros(request.args)
+        filas, observaciones, siguiente = consultar_historial(tabla, filtros, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('user_error'))
+    return render_template("historial.html", tabla=tabla, tablas=list(HISTORIAL), filas=filas,
+                           observaciones=observaciones, cepa_list=lista_cepas(), siguiente=siguiente,
+                           args=argumentos(request.args))
+
+
 @app.route('/update/<int:id>', methods=['POST', 'GET'])
 @login_required
 def update(id):
@@ -258,6 +370,13 @@ def update(id):
         cruza.machos = int(request.form['machos'])
         cruza.hembras = int(request.form['hembras'])
 
+        try:
+            enlazar_progenitores(cruza, leer_cajas(request.form.get('cajas_machos')),
+                                 leer_cajas(request.form.get('cajas_hembras')))
+        except ValueError as error:
+            db.session.rollback()
+            return render_template("error.html", error=str(error))
+
         try:
             db.session.commit()
             return redirect(url_for('cruza'))
@@ -265,7 +384,8 @@ def update(id):
             return redirect(url_for('user_error'))
 
     else:
-        return render_template('update.html', cruza=cruza, cepa_list=cepa_list)
+        return render_template('update.html', cruza=cruza, cepa_list=lista_cepas(),
+                               progenitores=nombres_progenitores(cruza))
 
 
 @app.route('/user-error', methods=['GET'])
@@ -274,17 +394,48 @@ def user_error():
     return render_template('user-error.html')
 
 
-def find_cruza(query):
-    cruza = Cruza.query.filter_by(id=query).first()
-    return cruza.cepa
-
-
 @app.route("/destete", methods=['GET'])
 @login_required
+@cachear_pagina
 def destete():
-    camadas = Camada.query.order_by(Camada.fecha_destete.desc()).all()
-    cepa = find_cruza
-    return render_template("destete.html", camadas=camadas, cepa=cepa)
+    return render_template("destete.html", camadas=camadas_pendientes())
+
+
+@app.route("/en-vivo", methods=['GET'])
+@login_required
+def en_vivo():
+    # Server-sent events para /destete y /macho-hembra/ (static/js/en_vivo.js). Con un
+    # trabajador síncrono el flujo lo ocuparía mientras la pestaña siga abierta: 204 hace
+    # que el navegador no vuelva a intentar (ver bioterio/en_vivo.py)
+    if not admite_flujos(request.environ):
+        return Response(status=204)
+    try:
+        desde = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        desde = None
+    cola, atrasados = publicador.suscribir(desde)
+    return Response(publicador.flujo(cola, atrasados), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route("/destete-lote", methods=['POST', 'GET'])
+@login_required
+def destete_lote():
+    if request.method == 'POST':
+        try:
+            fecha_destete = datetime.strptime(request.form['fecha_destete'], "%Y-%m-%d")
+            seleccion = {'macho': {int(x) for x in request.form.getlist('macho')},
+                         'hembra': {int(x) for x in request.form.getlist('hembra')}}
+        except (KeyError, ValueError):
+            return redirect(url_for('user_error'))
+
+        try:
+            creadas, omitidas = destetar_lote(seleccion, fecha_destete, current_user.id)
+        except Exception as e:
+            return str(e)
+        return render_template("destete-lote.html", creadas=creadas, omitidas=omitidas)
+    else:
+        return render_template("destete-lote.html", camadas=camadas_pendientes(), hoy=date.today())
 
 
 @app.route('/update-camada/<int:id>', methods=['POST', 'GET'])
@@ -308,6 +459,211 @@ def update_camada(id):
         return render_template('update-camada.html', camada=camada)
 
 
+@app.route('/importar', methods=['POST', 'GET'])
+@login_required
+def importar():
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        tipo = request.form.get('tipo')
+        formato = request.form.get('formato')
+        if not archivo or tipo not in TIPOS or formato not in ('csv', 'json'):
+            return redirect(url_for('user_error'))
+
+        resultado = importar_archivo(archivo.stream, tipo, formato, usuario_id=current_user.id)
+        return render_template('importar.html', tipos=TIPOS, resultado=resultado)
+    else:
+        return render_template('importar.html', tipos=TIPOS)
+
+
+@app.route('/cepas', methods=['GET', 'POST'])
+@login_required
+def cepas():
+    if request.method == 'POST':
+        if not es_admin(current_user):
+            abort(403)
+        try:
+            edad = int(request.form['edad_destete'])
+        except ValueError:
+            return redirect(url_for('user_error'))
+        if not 1 <= edad <= 120:
+            return render_template("error.html", error="La edad de destete debe estar entre 1 y 120 días.")
+
+        if request.form.get('id'):
+            cepa = Cepa.query.get_or_404(int(request.form['id']))
+            cepa.edad_destete = edad
+        else:
+            nombre = request.form['nombre'].strip()
+            prefijo = request.form['prefijo'].strip().upper()
+            if not nombre or not prefijo.isalpha():
+                return render_template("error.html", error="El prefijo de las cajas debe llevar sólo letras.")
+            db.session.add(Cepa(nombre=nombre, prefijo=prefijo, edad_destete=edad))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return render_template("error.html", error="Ya existe una cepa con ese nombre o ese prefijo.")
+        return redirect(url_for('cepas'))
+
+    return render_template('cepas.html', cepas=Cepa.query.order_by(Cepa.id).all(), admin=es_admin(current_user))
+
+
+@app.route('/exportar', methods=['GET'])
+@login_required
+def exportar():
+    return render_template('exportar.html', tablas=TABLAS, cepa_list=lista_cepas())
+
+
+@app.route('/pronostico', methods=['GET'])
+@login_required
+def pronostico():
+    semanas = request.args.get('semanas', SEMANAS, type=int)
+    if not 1 <= semanas <= MAXIMO_SEMANAS:
+        return redirect(url_for('user_error'))
+    try:
+        resultado = pronosticar(semanas)
+    except ImportError as error:
+        return render_template("error.html", error=str(error))
+    return render_template('pronostico.html', pronostico=resultado, semanas=semanas, maximo=MAXIMO_SEMANAS)
+
+
+@app.route('/edades', methods=['GET'])
+@login_required
+@cachear_pagina
+def edades():
+    cepa = request.args.get('cepa') or None
+    sexo = request.args.get('sexo') or None
+    desde = request.args.get('desde', None, type=int)
+    hasta = request.args.get('hasta', None, type=int)
+    cepas = lista_cepas()
+    if (cepa and cepa not in cepas) or (sexo and sexo not in dict(SEXOS)) \
+            or any(semanas is not None and semanas < 0 for semanas in (desde, hasta)):
+        return redirect(url_for('user_error'))
+
+    filas = reporte_edades([cepa] if cepa else cepas, date.today(), sexo, desde, hasta)
+    if request.args.get('formato') == 'json':
+        return jsonify(edades=filas, tope=TOPE_SEMANAS)
+    semanas, grupos = tabla_edades(filas)
+    return render_template('edades.html', semanas=semanas, grupos=grupos, tope=TOPE_SEMANAS, cepa_list=cepas,
+                           cepa=cepa, sexo=sexo, desde=desde, hasta=hasta)
+
+
+@app.route('/estadisticas', methods=['GET'])
+@login_required
+@admin_requerido
+def estadisticas():
+    resumen = {'endpoints': histograma.resumen(),
+               'caches': {'usuarios': usuarios_cache.estadisticas(), 'paginas': paginas_cache.estadisticas()}}
+    if request.args.get('formato') == 'json':
+        return jsonify(resumen)
+    return render_template('estadisticas.html', cubetas=CUBETAS, **resumen)
+
+
+@app.route('/respaldos', methods=['GET', 'POST'])
+@login_required
+@admin_requerido
+def respaldos():
+    if request.method == 'POST':
+        try:
+            respaldo = respaldar(incremental=bool(request.form.get('incremental')))
+        except ErrorRespaldo as error:
+            return render_template("error.html", error=str(error))
+        if request.args.get('formato') == 'json':
+            return jsonify(respaldo=respaldo)
+        return redirect(url_for('respaldos'))
+
+    lista = lista_respaldos()
+    if request.args.get('formato') == 'json':
+        return jsonify(respaldos=lista)
+    return render_template('respaldos.html', respaldos=lista)
+
+
+@app.route('/trabajos', methods=['GET', 'POST'])
+@login_required
+def trabajos():
+    admin = es_admin(current_user)
+    if request.method == 'POST':
+        # El tipo va en `trabajo` para no chocar con los campos de los formularios de
+        # importar y exportar, que se envían aquí tal cual
+        tipo = request.form.get('trabajo')
+        if tipo not in TIPOS_TRABAJO:
+            return redirect(url_for('user_error'))
+        if TIPOS_TRABAJO[tipo].admin and not admin:
+            abort(403)
+        parametros = {clave: request.form.getlist(clave) if clave == 'tablas' else request.form.get(clave)
+                      for clave in request.form if clave != 'trabajo'}
+        archivo = request.files.get('archivo')
+        if tipo == 'importar' and not archivo:
+            return redirect(url_for('user_error'))
+        try:
+            trabajo = encolar(tipo, parametros, current_user.id, entrada=archivo.stream if archivo else None)
+        except ValueError:
+            return redirect(url_for('user_error'))
+        if request.args.get('formato') == 'json':
+            return jsonify(trabajo=datos_trabajo(trabajo)), 202
+        return redirect(url_for('trabajo', id=trabajo.id))
+
+    consulta = Trabajo.query if admin else Trabajo.query.filter(Trabajo.usuario_id == current_user.id)
+    lista = consulta.order_by(Trabajo.id.desc()).limit(100).all()
+    if request.args.get('formato') == 'json':
+        return jsonify(trabajos=[datos_trabajo(trabajo) for trabajo in lista])
+    return render_template('trabajos.html', trabajos=lista, tipos=TIPOS_TRABAJO, admin=admin,
+                           terminados=TERMINADOS, cepa_list=lista_cepas(),
+                           activos=any(trabajo.estado not in TERMINADOS for trabajo in lista))
+
+
+def trabajo_visible(id):
+    trabajo = Trabajo.query.get_or_404(id)
+    if trabajo.usuario_id != current_user.id and not es_admin(current_user):
+        abort(404)
+    return trabajo
+
+
+@app.route('/trabajos/<int:id>', methods=['GET'])
+@login_required
+def trabajo(id):
+    trabajo = trabajo_visible(id)
+    if request.args.get('formato') == 'json':
+        return jsonify(trabajo=datos_trabajo(trabajo))
+    return render_template('trabajo.html', trabajo=trabajo, datos=datos_trabajo(trabajo), tipos=TIPOS_TRABAJO,
+                           terminados=TERMINADOS)
+
+
+@app.route('/trabajos/<int:id>/cancelar', methods=['POST'])
+@login_required
+def cancelar_trabajo_route(id):
+    trabajo = trabajo_visible(id)
+    cancelado = cancelar_trabajo(trabajo)
+    if request.args.get('formato') == 'json':
+        return jsonify(trabajo=datos_trabajo(trabajo), cancelado=cancelado)
+    return redirect(url_for('trabajo', id=id))
+
+
+@app.route('/trabajos/<int:id>/resultado', methods=['GET'])
+@login_required
+def resultado_trabajo(id):
+    ruta = ruta_resultado(trabajo_visible(id))
+    if ruta is None:
+        abort(404)
+    return send_file(ruta, as_attachment=True)
+
+
+@app.route('/exportar/csv', methods=['GET'])
+@login_required
+def exportar_csv():
+    tabla = request.args.get('tabla')
+    try:
+        filtros = leer_filtros(request.args)
+    except ValueError:
+        return redirect(url_for('user_error'))
+    if tabla not in TABLAS:
+        return redirect(url_for('user_error'))
+
+    nombre = '{}.csv'.format(tabla)
+    archivo = bool(request.args.get('archivo'))
+    return Response(stream_with_context(generar_csv(tabla, filtros, archivo=archivo)), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename={}'.format(nombre)})
+
+
 @app.route('/logout')
 @login_required
 def logout():
@@ -362,85 +718,5 @@ def register():
     return render_template('register.html', form=form, empty_list=len(User.query.order_by(User.id).all()) == 0)
 
 
-def verificar_caja(caja, cepa):
-    if cepa == cepa_list[0]:
-        return "A" == str(caja[:1])
-    if cepa == cepa_list[1]:
-        return "B" == str(caja[:1])
-    if cepa == cepa_list[2]:
-        return "C" == str(caja[:1])
-
-    return False
-
-
-def regresar_letra_cepa(cepa):
-    if cepa == cepa_list[0]:
-        return "A"
-    if cepa == cepa_list[1]:
-        return "B"
-    if cepa == cepa_list[2]:
-        return "C"
-
-
-def siguiente_caja(cepa):
-    lista = []
-    machos = Macho.query.order_by(Macho.cepa).all()
-    hembras = Hembra.query.order_by(Hembra.cepa).all()
-    cruzas = Cruza.query.order_by(Cruza.fecha_cruza.desc()).all()
-
-    letra = regresar_letra_cepa(cepa)
-
-    for macho in machos:
-        if letra == macho.caja[:1]:
-            lista.append(macho.caja)
-
-    for hembra in hembras:
-        if letra == hembra.caja[:1]:
-            lista.append(hembra.caja)
-
-    for cruza in cruzas:
-        if letra == cruza.caja[:1]:
-            lista.append(cruza.caja)
-
-    values = sorted([int(x[1:]) for x in lista])
-    print(values)
-
-    numero = 0
-
-    if len(values) == 0:
-        numero = 1
-    elif len(values) == 1:
-        numero = values[-1] + 1
-    else:
-        for i in range(len(values) - 1):
-            if values[i] + 1 != values[i + 1]:
-                numero = values[i] + 1
-                break
-            elif i == len(values) - 2:
-                numero = values[-1] + 1
-
-    return letra + str(numero)
-
-
-def existe_caja(caja):
-    lista = []
-    machos = Macho.query.order_by(Macho.cepa).all()
-    hembras = Hembra.query.order_by(Hembra.cepa).all()
-    cruzas = Cruza.query.order_by(Cruza.fecha_cruza.desc()).all()
-    for macho in machos:
-        if caja == macho.caja:
-            lista.append(macho.caja)
-
-    for hembra in hembras:
-        if caja == hembra.caja:
-            lista.append(hembra.caja)
-
-    for cruza in cruzas:
-        if caja == cruza.caja:
-            lista.append(cruza.caja)
-
-    return len(lista) > 0
-
-
 if __name__ == "__main__":
     app.run(host='0.0.0.0', debug=True)
@@ -0,0 +1,63 @@
+"""Tiempo de arranque: desde importar la aplicación hasta responder la primera petición.
+
+Cada repetición corre en un intérprete nuevo, como un worker de gunicorn recién creado.
+
+    python benchmarks/arranque.py --repeticiones 20 --maximo-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEDIR = """
+import time
+inicio = time.perf_counter()
+import app
+importado = time.perf_counter()
+respuesta = app.app.test_client().get('/')
+fin = time.perf_counter()
+assert respuesta.status_code == 200, respuesta.status_code
+print(importado - inicio, fin - inicio)
+"""
+
+
+def medir(repeticiones):
+    importar, primera = [], []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, '-c', MEDIR], cwd=RAIZ, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+        tiempo_importar, tiempo_primera = (float(x) * 1000 for x in salida.split())
+        importar.append(tiempo_importar)
+        primera.append(tiempo_primera)
+    return {'repeticiones': repeticiones,
+            'importar_ms': _resumen(importar),
+            'primera_peticion_ms': _resumen(primera)}
+
+
+def _resumen(tiempos):
+    return {'min': round(min(tiempos), 2),
+            'mediana': round(statistics.median(tiempos), 2),
+            'max': round(max(tiempos), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--maximo-ms', type=float,
+                        help='Termina con error si la mediana hasta la primera petición lo supera')
+    args = parser.parse_args()
+
+    resultado = medir(args.repeticiones)
+    print(json.dumps(resultado, indent=2))
+
+    if args.maximo_ms is not None and resultado['primera_peticion_ms']['mediana'] > args.maximo_ms:
+        sys.exit('Arranque lento: {} ms > {} ms'.format(resultado['primera_peticion_ms']['mediana'],
+                                                        args.maximo_ms))
+
+
+if __name__ == '__main__':
+    main()
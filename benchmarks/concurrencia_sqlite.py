@@ -0,0 +1,144 @@
+"""Lecturas y escrituras concurrentes contra SQLite, sin y con los ajustes de base_datos.py.
+
+Varios procesos leen (el censo por cepa y una página de cajas) mientras otros escriben
+observaciones, cada una en su propia transacción, durante unos segundos. Se corre dos
+veces sobre la misma base: con la configuración por omisión de SQLite y con WAL,
+busy_timeout, mmap, caché y pool de conexiones.
+
+    python benchmarks/concurrencia_sqlite.py --lectores 6 --escritores 2 --segundos 5
+"""
+import argparse
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from sqlalchemy import create_engine, event, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+
+# base_datos.py se carga como archivo suelto: importar el paquete bioterio crearía la
+# aplicación y su engine, y nada de eso debe tocar el brazo base
+_spec = importlib.util.spec_from_file_location('base_datos', os.path.join(RAIZ, 'bioterio', 'base_datos.py'))
+base_datos = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(base_datos)
+PRAGMAS, aplicar_pragmas, opciones_engine = base_datos.PRAGMAS, base_datos.aplicar_pragmas, base_datos.opciones_engine
+
+LEER = [text("SELECT cepa, SUM(cantidad) FROM macho GROUP BY cepa"),
+        text("SELECT * FROM macho ORDER BY fecha_destete, id LIMIT 50")]
+ESCRIBIR = text("INSERT INTO observacion (observacion, fecha, macho_id) "
+                "VALUES ('prueba de concurrencia', CURRENT_TIMESTAMP, :macho)")
+
+
+def crear_base(ruta, cajas):
+    engine = create_engine('sqlite:///' + ruta)
+    with engine.begin() as conexion:
+        conexion.execute(text("CREATE TABLE cruza (id INTEGER PRIMARY KEY, caja VARCHAR(20), cepa VARCHAR(20))"))
+        conexion.execute(text("CREATE TABLE macho (id INTEGER PRIMARY KEY, caja VARCHAR(20), cepa VARCHAR(20), "
+                              "fecha_destete DATETIME, cantidad INTEGER, cruza_id INTEGER)"))
+        conexion.execute(text("CREATE INDEX ix_macho_cepa ON macho (cepa, fecha_destete)"))
+        conexion.execute(text("CREATE TABLE observacion (id INTEGER PRIMARY KEY, observacion TEXT, "
+                              "fecha DATETIME, macho_id INTEGER)"))
+        conexion.execute(text("INSERT INTO cruza (caja, cepa) VALUES ('A1', 'C57B6/J')"))
+        conexion.execute(text("INSERT INTO macho (caja, cepa, fecha_destete, cantidad, cruza_id) "
+                              "VALUES (:caja, :cepa, date('2020-01-01', :dias), 4, 1)"),
+                         [{'caja': 'ABC'[i % 3] + str(i), 'cepa': 'C57B6/J CD45.1 RAG1+/-'.split()[i % 3],
+                           'dias': '+{} days'.format(i % 700)} for i in range(cajas)])
+    engine.dispose()
+
+
+def _engine(ruta, ajustada):
+    if not ajustada:
+        # crear_base deja el archivo en modo rollback; pedirlo de nuevo en cada conexión
+        # fallaría con SQLITE_BUSY bajo contención y contaría como error del brazo base
+        engine = create_engine('sqlite:///' + ruta, poolclass=NullPool)
+        pragmas = {}
+    else:
+        engine = create_engine('sqlite:///' + ruta, **opciones_engine())
+        pragmas = PRAGMAS
+    event.listen(engine, 'connect', lambda conexion, registro: aplicar_pragmas(conexion, pragmas))
+    return engine
+
+
+def ajustes(ruta, ajustada):
+    # Lo que de verdad usó cada brazo, para que el reporte lo muestre
+    engine = _engine(ruta, ajustada)
+    with engine.connect() as conexion:
+        valores = {nombre: conexion.execute(text('PRAGMA ' + nombre)).scalar()
+                   for nombre in ('journal_mode', 'busy_timeout', 'synchronous')}
+    engine.dispose()
+    return valores
+
+
+def trabajador(ruta, ajustada, escritor, segundos, resultados):
+    engine = _engine(ruta, ajustada)
+    hechas, bloqueadas = 0, 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        try:
+            with engine.begin() as conexion:
+                if escritor:
+                    conexion.execute(ESCRIBIR, {'macho': hechas % 100 + 1})
+                else:
+                    for consulta in LEER:
+                        conexion.execute(consulta).fetchall()
+            hechas += 1
+        except OperationalError:
+            # "database is locked": la espera de pysqlite (5 s) o busy_timeout se agotó
+            bloqueadas += 1
+    engine.dispose()
+    resultados.put((escritor, hechas, bloqueadas))
+
+
+def correr(ruta, ajustada, lectores, escritores, segundos):
+    contexto = multiprocessing.get_context('spawn')
+    resultados = contexto.Queue()
+    procesos = [contexto.Process(target=trabajador, args=(ruta, ajustada, i < escritores, segundos, resultados))
+                for i in range(lectores + escritores)]
+    for p in procesos:
+        p.start()
+    totales = {'lecturas': 0, 'escrituras': 0, 'lecturas_fallidas': 0, 'escrituras_fallidas': 0}
+    for _ in procesos:
+        escritor, hechas, bloqueadas = resultados.get()
+        tipo = 'escrituras' if escritor else 'lecturas'
+        totales[tipo] += hechas
+        totales[tipo + '_fallidas'] += bloqueadas
+    for p in procesos:
+        p.join()
+    totales['lecturas_por_segundo'] = round(totales['lecturas'] / segundos, 1)
+    totales['escrituras_por_segundo'] = round(totales['escrituras'] / segundos, 1)
+    return totales
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lectores', type=int, default=6)
+    parser.add_argument('--escritores', type=int, default=2)
+    parser.add_argument('--segundos', type=float, default=5)
+    parser.add_argument('--cajas', type=int, default=5000)
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bioterio-concurrencia-')
+    plantilla = os.path.join(directorio, 'plantilla.db')
+    crear_base(plantilla, args.cajas)
+
+    reporte = {'lectores': args.lectores, 'escritores': args.escritores, 'segundos': args.segundos}
+    for nombre, ajustada in (('por_omision', False), ('ajustada', True)):
+        ruta = os.path.join(directorio, nombre + '.db')
+        shutil.copy(plantilla, ruta)
+        reporte[nombre] = correr(ruta, ajustada, args.lectores, args.escritores, args.segundos)
+        reporte[nombre]['pragmas'] = ajustes(ruta, ajustada)
+    shutil.rmtree(directorio)
+
+    print(json.dumps(reporte, indent=2))
+
+
+if __name__ == '__main__':
+    main()
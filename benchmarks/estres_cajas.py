@@ -0,0 +1,110 @@
+"""Prueba de estrés de la asignación de cajas con muchos procesos e hilos a la vez.
+
+Crea una base SQLite nueva, y cada hilo repite lo que hace el destete: reserva la
+siguiente caja libre (GET /macho/<id>), la aparta y registra una cruza con ella (POST).
+Al final revisa que ningún nombre se haya entregado dos veces y que los números
+asignados no tengan huecos.
+
+    python benchmarks/estres_cajas.py --procesos 4 --hilos 8 --cajas 25
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CEPA = 'C57B6/J'
+
+
+def _preparar(ruta):
+    os.environ['BIOTERIO_DATABASE_URI'] = 'sqlite:///' + ruta
+    sys.path.insert(0, RAIZ)
+    from bioterio import app
+    return app
+
+
+def crear_base(ruta):
+    app = _preparar(ruta)
+    from flask_migrate import upgrade
+    with app.app_context():
+        upgrade(directory=os.path.join(RAIZ, 'migrations'))
+
+
+def trabajador(ruta, proceso, hilos, cajas, resultados):
+    app = _preparar(ruta)
+    from bioterio import db
+    from bioterio.models import Cruza
+    from bioterio.cajas import reservar_caja, apartar_caja
+
+    def hilo(numero):
+        obtenidas, rechazadas = [], 0
+        usuario = proceso * 1000 + numero
+        for i in range(cajas):
+            with app.app_context():
+                caja = reservar_caja(CEPA, usuario, 'estres-{}'.format(i))
+                if apartar_caja(caja, usuario):
+                    db.session.add(Cruza(caja=caja, cepa=CEPA, machos=1, hembras=1))
+                    db.session.commit()
+                    obtenidas.append(caja)
+                else:
+                    rechazadas += 1
+        resultados.put((obtenidas, rechazadas))
+
+    corriendo = [threading.Thread(target=hilo, args=(n,)) for n in range(hilos)]
+    for t in corriendo:
+        t.start()
+    for t in corriendo:
+        t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--procesos', type=int, default=4)
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos por proceso')
+    parser.add_argument('--cajas', type=int, default=25, help='Cajas por hilo')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bioterio-estres-')
+    ruta = os.path.join(directorio, 'estres.db')
+    crear_base(ruta)
+
+    # spawn: cada proceso arranca la aplicación desde cero, como un worker de gunicorn
+    contexto = multiprocessing.get_context('spawn')
+    resultados = contexto.Queue()
+    inicio = time.perf_counter()
+    procesos = [contexto.Process(target=trabajador, args=(ruta, p, args.hilos, args.cajas, resultados))
+                for p in range(args.procesos)]
+    for p in procesos:
+        p.start()
+    entregadas, rechazadas = [], 0
+    for _ in range(args.procesos * args.hilos):
+        obtenidas, fallidas = resultados.get()
+        entregadas.extend(obtenidas)
+        rechazadas += fallidas
+    for p in procesos:
+        p.join()
+    duracion = time.perf_counter() - inicio
+
+    numeros = sorted(int(caja[1:]) for caja in entregadas)
+    reporte = {
+        'procesos': args.procesos,
+        'hilos_por_proceso': args.hilos,
+        'cajas_entregadas': len(entregadas),
+        'nombres_repetidos': len(entregadas) - len(set(entregadas)),
+        'rechazadas_al_apartar': rechazadas,
+        'sin_huecos': numeros == list(range(1, len(numeros) + 1)),
+        'segundos': round(duracion, 2),
+        'cajas_por_segundo': round(len(entregadas) / duracion, 1),
+        'base': ruta,
+    }
+    print(json.dumps(reporte, indent=2))
+    if reporte['nombres_repetidos'] or not reporte['sin_huecos']:
+        sys.exit('Se entregó una caja más de una vez o quedaron huecos')
+
+
+if __name__ == '__main__':
+    main()
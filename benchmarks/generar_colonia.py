@@ -0,0 +1,157 @@
+"""Genera una colonia sintética en una base SQLite nueva para pruebas de rendimiento.
+
+Crea el esquema con las migraciones y llena cruzas, camadas (algunas sin destetar),
+cajas de machos y hembras, observaciones y enlaces de linaje hasta llegar al número
+de cajas pedido, repartidas entre las cepas (las de la migración más las que se pidan
+con --cepas). Con la misma semilla y el mismo --hoy la colonia sale idéntica.
+
+    python benchmarks/generar_colonia.py /tmp/colonia.db --cajas 10000 --cepas 12
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USUARIO = ('bench@bioterio.mx', 'bench')
+LOTE = 5000
+
+FRASES = ['pelea entre machos', 'herida en la cola', 'pérdida de peso', 'pelo erizado',
+          'se separó un animal', 'cambio de cama', 'dermatitis leve', 'hembra gestante',
+          'se tomó muestra de sangre', 'ojos irritados', 'buen estado general', 'crías muy pequeñas',
+          'se marcó con arete', 'genotipificación pendiente', 'animal encorvado', 'se sacrificó uno']
+
+
+def _preparar(ruta):
+    os.environ['BIOTERIO_DATABASE_URI'] = 'sqlite:///' + ruta
+    sys.path.insert(0, RAIZ)
+    from bioterio import app
+    return app
+
+
+def prefijos(usados):
+    # D, E, ..., Z, AA, AB, ... sin repetir los que ya existen
+    for largo in itertools.count(1):
+        for letras in itertools.product(string.ascii_uppercase, repeat=largo):
+            if ''.join(letras) not in usados:
+                yield ''.join(letras)
+
+
+def colonia(cajas, cepas, letras, semilla=0, hoy=None):
+    # Regresa {tabla: [filas]} con ids asignados aquí, listo para insertar en una base vacía
+    azar = random.Random(semilla)
+    hoy = hoy or datetime.combine(datetime.today(), datetime.min.time())
+    tablas = {nombre: [] for nombre in ('cruza', 'camada', 'macho', 'hembra', 'observacion', 'progenitor')}
+    numeros = dict.fromkeys(letras.values(), 0)
+    destetadas = {cepa: {'macho': [], 'hembra': []} for cepa in cepas}
+
+    def nueva_caja(letra):
+        numeros[letra] += 1
+        return '{}{}'.format(letra, numeros[letra])
+
+    total = 0
+    while total < cajas:
+        cepa = cepas[len(tablas['cruza']) % len(cepas)]
+        letra = letras[cepa]
+        cruza = {'id': len(tablas['cruza']) + 1, 'caja': nueva_caja(letra), 'cepa': cepa,
+                 'fecha_cruza': hoy - timedelta(days=azar.randint(0, 720)),
+                 'machos': 1, 'hembras': azar.randint(1, 2)}
+        tablas['cruza'].append(cruza)
+        total += 1
+
+        for sexo in ('macho', 'hembra'):
+            if destetadas[cepa][sexo] and azar.random() < 0.8:
+                tablas['progenitor'].append({'cruza_id': cruza['id'], 'sexo': sexo,
+                                             'caja_id': azar.choice(destetadas[cepa][sexo])})
+
+        nacimiento = cruza['fecha_cruza'] + timedelta(days=azar.randint(19, 26))
+        for _ in range(azar.randint(0, 5)):
+            if nacimiento > hoy or total >= cajas:
+                break
+            camada = {'id': len(tablas['camada']) + 1, 'cruza_id': cruza['id'],
+                      'fecha_nacimiento': nacimiento, 'fecha_destete': nacimiento + timedelta(days=28),
+                      'machos': azar.randint(0, 8), 'hembras': azar.randint(0, 8)}
+            # Las camadas de las últimas semanas quedan pendientes de destetar
+            destetar = camada['fecha_destete'] < hoy - timedelta(days=azar.randint(0, 14))
+            for sexo in ('macho', 'hembra'):
+                camada[sexo + '_is_created'] = destetar
+                if not destetar or not camada[sexo + 's'] or total >= cajas:
+                    continue
+                caja = {'id': len(tablas[sexo]) + 1, 'caja': nueva_caja(letra), 'cepa': cepa,
+                        'fecha_nacimiento': nacimiento, 'fecha_destete': camada['fecha_destete'],
+                        'cantidad': camada[sexo + 's'], 'padres': cruza['caja'], 'cruza_id': cruza['id']}
+                tablas[sexo].append(caja)
+                destetadas[cepa][sexo].append(caja['id'])
+                total += 1
+                for _ in range(azar.choice((0, 0, 1, 1, 2, 3))):
+                    tablas['observacion'].append({
+                        'observacion': ' y '.join(azar.sample(FRASES, azar.randint(1, 2))),
+                        'fecha': caja['fecha_destete'] + timedelta(days=azar.randint(0, 60)),
+                        'macho_id': caja['id'] if sexo == 'macho' else None,
+                        'hembra_id': caja['id'] if sexo == 'hembra' else None})
+            tablas['camada'].append(camada)
+            nacimiento += timedelta(days=azar.randint(21, 35))
+    return tablas
+
+
+def generar(ruta, cajas, semilla=0, hoy=None, n_cepas=None):
+    if os.path.exists(ruta):
+        raise SystemExit('{} ya existe; el generador sólo llena bases nuevas'.format(ruta))
+    app = _preparar(ruta)
+    from flask_migrate import upgrade
+    from bioterio import db
+    from bioterio.models import User, Caja, Cepa, separar_caja
+    from bioterio.cepas import registro
+    from bioterio.contadores import reconciliar
+
+    inicio = time.perf_counter()
+    with app.app_context():
+        upgrade(directory=os.path.join(RAIZ, 'migrations'))
+        existentes = Cepa.query.count()
+        nuevos = prefijos(set(registro().por_prefijo))
+        for numero in range(existentes + 1, (n_cepas or existentes) + 1):
+            db.session.add(Cepa(nombre='Cepa {}'.format(numero), prefijo=next(nuevos), edad_destete=28))
+        db.session.commit()
+        cepas = registro()
+        tablas = colonia(cajas, cepas.nombres, {cepa: fila.prefijo for cepa, fila in cepas.por_nombre.items()},
+                         semilla, hoy)
+
+        # Inserciones por lote con Core: los eventos del ORM no corren, así que el
+        # registro de cajas y los contadores se llenan aparte (el índice de búsqueda
+        # de observaciones lo mantienen los triggers de SQLite).
+        metadatos = db.Model.metadata.tables
+        for nombre in ('cruza', 'camada', 'macho', 'hembra', 'observacion', 'progenitor'):
+            for i in range(0, len(tablas[nombre]), LOTE):
+                db.session.execute(metadatos[nombre].insert(), tablas[nombre][i:i + LOTE])
+        registro = [dict(zip(('letra', 'numero'), separar_caja(fila['caja'])), caja=fila['caja'],
+                         tabla=nombre, registro_id=fila['id'])
+                    for nombre in ('cruza', 'macho', 'hembra') for fila in tablas[nombre]]
+        for i in range(0, len(registro), LOTE):
+            db.session.execute(Caja.__table__.insert(), registro[i:i + LOTE])
+        db.session.add(User(*USUARIO))
+        db.session.commit()
+        reconciliar(corregir=True)
+
+    return {'base': ruta, 'semilla': semilla, 'segundos': round(time.perf_counter() - inicio, 2),
+            'cepas': len(cepas.nombres), **{nombre: len(filas) for nombre, filas in tablas.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('ruta', help='Archivo SQLite a crear')
+    parser.add_argument('--cajas', type=int, default=1000, help='Cajas en total (cruzas, machos y hembras)')
+    parser.add_argument('--cepas', type=int, help='Total de cepas; se agregan las que falten')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--hoy', type=lambda texto: datetime.strptime(texto, '%Y-%m-%d'),
+                        help='Fecha de referencia (AAAA-MM-DD); por omisión hoy')
+    args = parser.parse_args()
+    print(json.dumps(generar(os.path.abspath(args.ruta), args.cajas, args.semilla, args.hoy, args.cepas), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Latencia y número de consultas de cada ruta de app.py sobre colonias de varios tamaños.
+
+Para cada escala genera una colonia sintética nueva (generar_colonia.py) y, en un
+proceso aparte, recorre las rutas con el cliente de pruebas de Flask: tableros,
+destete GET/POST, observaciones, búsqueda, pedigrí, pronóstico y exportación. La
+salida es JSON para poder comparar entre commits.
+
+    python benchmarks/rutas.py --escalas 1000,10000,100000 --repeticiones 20 > resultado.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.dirname(DIRECTORIO)
+
+
+def _percentil(ordenados, p):
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100.0 * (len(ordenados) - 1))))]
+
+
+def medir_escala(escala, repeticiones, semilla, directorio, con_cache, n_cepas):
+    sys.path.insert(0, DIRECTORIO)
+    from generar_colonia import generar, USUARIO
+    colonia = generar(os.path.join(directorio, 'colonia-{}.db'.format(escala)), escala, semilla,
+                      n_cepas=n_cepas)
+
+    import app as aplicacion
+    from sqlalchemy import event
+    from bioterio import app, db
+    from bioterio.models import Camada, Cruza, Macho, Hembra
+    from bioterio.respuestas import paginas_cache
+    app.config['WTF_CSRF_ENABLED'] = False
+    assert aplicacion.app is app
+
+    consultas = [0]
+
+    def contar(*args):
+        consultas[0] += 1
+
+    cliente = app.test_client()
+    cliente.post('/login', data={'email': USUARIO[0], 'password': USUARIO[1]})
+
+    with app.app_context():
+        event.listen(db.engine, 'after_cursor_execute', contar)
+        sin_macho = [id for id, in db.session.query(Camada.id).filter(Camada.macho_is_created == False)
+                     .order_by(Camada.id)]
+        sin_hembra = [id for id, in db.session.query(Camada.id).filter(Camada.hembra_is_created == False)
+                      .order_by(Camada.id)]
+        cruza = db.session.query(db.func.max(Cruza.id)).scalar()
+        macho = db.session.query(db.func.max(Macho.id)).scalar()
+        hembra = db.session.query(db.func.max(Hembra.id)).scalar()
+    hoy = date.today().isoformat()
+
+    def destetar(sexo, pendientes):
+        # Prepara (sin medir) la caja que ofrece el GET y regresa la petición del POST
+        def preparar():
+            id = pendientes.pop(0)
+            caja = re.search(r'name="caja"[^>]*value="([^"]*)"',
+                             cliente.get('/{}/{}'.format(sexo, id)).get_data(as_text=True)).group(1)
+            return 'POST', '/{}/{}'.format(sexo, id), {'caja': caja, 'fecha_destete': hoy}
+        return preparar
+
+    rutas = [
+        ('inicio', lambda: ('GET', '/', None)),
+        ('cruza', lambda: ('GET', '/cruza', None)),
+        ('cruza_por_cepa', lambda: ('GET', '/cruza?cepa=CD45.1', None)),
+        ('destete', lambda: ('GET', '/destete', None)),
+        ('destete_lote', lambda: ('GET', '/destete-lote', None)),
+        ('macho_hembra', lambda: ('GET', '/macho-hembra/', None)),
+        ('macho_hembra_por_cepa', lambda: ('GET', '/macho-hembra/?cepa=C57B6/J', None)),
+        ('destete_macho_get', lambda: ('GET', '/macho/{}'.format(sin_macho[-1]), None)),
+        ('destete_hembra_get', lambda: ('GET', '/hembra/{}'.format(sin_hembra[-1]), None)),
+        ('destete_macho_post', destetar('macho', sin_macho)),
+        ('destete_hembra_post', destetar('hembra', sin_hembra)),
+        ('camada', lambda: ('GET', '/camada/{}'.format(cruza), None)),
+        ('actualizar_cruza', lambda: ('GET', '/update/{}'.format(cruza), None)),
+        ('observacion_macho', lambda: ('GET', '/observacion-macho/{}'.format(macho), None)),
+        ('observacion_hembra', lambda: ('GET', '/observacion-hembra/{}'.format(hembra), None)),
+        ('observacion_macho_post', lambda: ('POST', '/observacion-macho/{}'.format(macho),
+                                            {'observacion': 'revisión de rutina'})),
+        ('buscar', lambda: ('GET', '/buscar?q=pelea', None)),
+        ('pedigri', lambda: ('GET', '/pedigri/macho/{}?generaciones=5'.format(macho), None)),
+        ('pronostico', lambda: ('GET', '/pronostico', None)),
+        ('exportar_csv', lambda: ('GET', '/exportar/csv?tabla=macho', None)),
+    ]
+
+    resultados = {}
+    for nombre, peticion in rutas:
+        latencias, cuentas, estados = [], [], set()
+        for _ in range(repeticiones):
+            try:
+                metodo, url, datos = peticion()
+            except IndexError:
+                break  # ya no quedan camadas pendientes que destetar
+            if not con_cache:
+                paginas_cache.limpiar()
+            antes = consultas[0]
+            inicio = time.perf_counter()
+            respuesta = cliente.open(url, method=metodo, data=datos)
+            respuesta.get_data()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            cuentas.append(consultas[0] - antes)
+            estados.add(respuesta.status_code)
+        if not latencias:
+            continue
+        latencias.sort()
+        resultados[nombre] = {
+            'n': len(latencias),
+            'p50_ms': round(_percentil(latencias, 50), 2),
+            'p90_ms': round(_percentil(latencias, 90), 2),
+            'p99_ms': round(_percentil(latencias, 99), 2),
+            'maximo_ms': round(latencias[-1], 2),
+            'consultas': statistics.median(cuentas),
+            'consultas_maximo': max(cuentas),
+            'estados': sorted(estados),
+        }
+    return {'colonia': colonia, 'rutas': resultados}
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--escalas', default='1000,10000', help='Número de cajas por colonia, separados por comas')
+    parser.add_argument('--repeticiones', type=int, default=20, help='Peticiones por ruta')
+    parser.add_argument('--cepas', type=int, help='Total de cepas en cada colonia')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--con-cache', action='store_true',
+                        help='No vaciar la cache de páginas entre peticiones')
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix='bioterio-rutas-')
+    # spawn: cada escala arranca la aplicación desde cero contra su propia base
+    contexto = multiprocessing.get_context('spawn')
+    escalas = {}
+    for escala in (int(texto) for texto in args.escalas.split(',')):
+        with contexto.Pool(1) as proceso:
+            escalas[escala] = proceso.apply(medir_escala, (escala, args.repeticiones, args.semilla,
+                                                           directorio, args.con_cache, args.cepas))
+
+    print(json.dumps({'commit': _commit(), 'repeticiones': args.repeticiones, 'semilla': args.semilla,
+                      'con_cache': args.con_cache, 'escalas': escalas}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
+from bioterio.base_datos import configurar as configurar_sqlite
+from bioterio.metricas import configurar as configurar_metricas
 
 # Create a login manager object
 login_manager = LoginManager()
@@ -13,13 +15,20 @@ app.url_map.strict_slashes = False
 # Often people will also separate these into a separate config.py file
 app.config['SECRET_KEY'] = 'mysecretkey'
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'bioterio.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BIOTERIO_DATABASE_URI',
+                                                        'sqlite:///' + os.path.join(basedir, 'bioterio.db'))
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.debug = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=180)
 
 db = SQLAlchemy(app)
-Migrate(app, db)
+
+# WAL, busy timeout, cache and a connection pool for SQLite; see bioterio/base_datos.py
+configurar_sqlite(app, db)
+Migrate(app, db, render_as_batch=True)
+
+# Consultas, tiempo en SQL y en plantillas por endpoint; ver bioterio/metricas.py
+configurar_metricas(app)
 
 # We can now pass in our app to the login manager
 login_manager.init_app(app)
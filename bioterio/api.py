@@ -0,0 +1,325 @@
+from collections import namedtuple
+from datetime import datetime
+from functools import wraps
+from flask import Blueprint, jsonify, request
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+from bioterio import db
+from bioterio.models import Cruza, Camada, Macho, Hembra, Observacion
+from bioterio.cajas import apartar_caja
+from bioterio.importar import Importacion, ErrorFila, valor_fecha, valor_entero
+from bioterio.paginacion import pagina, leer_filtros, filtrar
+
+# API JSON para scripts e instrumentos. Las lecturas seleccionan sólo las columnas
+# pedidas y las serializan directo de las filas, sin crear objetos del ORM; las
+# escrituras reciben arreglos y hacen un solo commit (todo o nada).
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+POR_PAGINA = 100
+MAXIMO_PAGINA = 1000
+MAXIMO_LOTE = 1000
+
+# consulta: función que regresa la consulta base para las columnas dadas; caja, cepa y
+# fecha: columnas para los filtros comunes (None si el recurso no tiene ese filtro);
+# tipo: el de Importacion para crear; editables: {campo: función que lee el valor}
+Recurso = namedtuple('Recurso', 'modelo columnas consulta caja cepa fecha tipo editables')
+
+
+def _texto(valor):
+    if not isinstance(valor, str) or not valor.strip():
+        raise ErrorFila('Texto vacío')
+    return valor.strip()
+
+
+def _es_id(valor):
+    # Los ids del cuerpo JSON: enteros de verdad (True también es int en Python)
+    return isinstance(valor, int) and not isinstance(valor, bool)
+
+
+def _es_fecha(valor):
+    if not isinstance(valor, str):
+        return False
+    try:
+        valor_fecha(valor)
+    except ValueError:
+        return False
+    return True
+
+
+def _es_entero(valor):
+    if not isinstance(valor, str):
+        return _es_id(valor)
+    try:
+        int(valor)
+    except ValueError:
+        return False
+    return True
+
+
+def _es_texto(valor):
+    return isinstance(valor, str)
+
+
+def _es_booleano(valor):
+    return isinstance(valor, bool)
+
+
+# Lo que debe ser cada campo del cuerpo, para responder por campo y no con la excepción
+# de Python que saldría al convertirlo (p. ej. "'int' object has no attribute 'strip'")
+TIPOS_CAMPOS = {
+    'fecha_cruza': (_es_fecha, 'una fecha AAAA-MM-DD'),
+    'fecha_nacimiento': (_es_fecha, 'una fecha AAAA-MM-DD'),
+    'fecha_destete': (_es_fecha, 'una fecha AAAA-MM-DD'),
+    'fecha': (_es_fecha, 'una fecha AAAA-MM-DD'),
+    'machos': (_es_entero, 'un número entero'),
+    'hembras': (_es_entero, 'un número entero'),
+    'cantidad': (_es_entero, 'un número entero'),
+    'macho_is_created': (_es_booleano, 'true o false'),
+    'hembra_is_created': (_es_booleano, 'true o false'),
+    'caja': (_es_texto, 'texto'),
+    'cepa': (_es_texto, 'texto'),
+    'cruza': (_es_texto, 'texto'),
+    'padres': (_es_texto, 'texto'),
+    'observacion': (_es_texto, 'texto'),
+}
+
+
+def _revisar_campos(fila):
+    # ErrorFila con el primer campo que no tiene el tipo esperado
+    for campo in sorted(fila):
+        if campo in TIPOS_CAMPOS:
+            es_valido, tipo = TIPOS_CAMPOS[campo]
+            if not es_valido(fila[campo]):
+                raise ErrorFila('{} debe ser {}'.format(campo, tipo))
+
+
+def _destetados(modelo):
+    return Recurso(modelo,
+                   {'id': modelo.id, 'caja': modelo.caja, 'cepa': modelo.cepa,
+                    'fecha_nacimiento': modelo.fecha_nacimiento, 'fecha_destete': modelo.fecha_destete,
+                    'cantidad': modelo.cantidad, 'padres': modelo.padres, 'cruza_id': modelo.cruza_id,
+                    'fecha_baja': modelo.fecha_baja},
+                   lambda columnas: db.session.query(*columnas),
+                   modelo.caja, modelo.cepa, modelo.fecha_destete, modelo.__tablename__,
+                   {'fecha_destete': valor_fecha, 'cantidad': valor_entero})
+
+
+RECURSOS = {
+    'cruzas': Recurso(Cruza,
+                      {'id': Cruza.id, 'caja': Cruza.caja, 'cepa': Cruza.cepa, 'fecha_cruza': Cruza.fecha_cruza,
+                       'machos': Cruza.machos, 'hembras': Cruza.hembras, 'fecha_cierre': Cruza.fecha_cierre},
+                      lambda columnas: db.session.query(*columnas),
+                      Cruza.caja, Cruza.cepa, Cruza.fecha_cruza, 'cruza',
+                      {'fecha_cruza': valor_fecha, 'machos': valor_entero, 'hembras': valor_entero}),
+    'camadas': Recurso(Camada,
+                       {'id': Camada.id, 'cruza_id': Camada.cruza_id, 'cruza': Cruza.caja, 'cepa': Cruza.cepa,
+                        'fecha_nacimiento': Camada.fecha_nacimiento, 'fecha_destete': Camada.fecha_destete,
+                        'machos': Camada.machos, 'hembras': Camada.hembras,
+                        'macho_is_created': Camada.macho_is_created,
+                        'hembra_is_created': Camada.hembra_is_created},
+                       lambda columnas: db.session.query(*columnas).select_from(Camada)
+                       .join(Cruza, Camada.cruza_id == Cruza.id),
+                       Cruza.caja, Cruza.cepa, Camada.fecha_nacimiento, 'camada',
+                       {'fecha_nacimiento': valor_fecha, 'fecha_destete': valor_fecha,
+                        'machos': valor_entero, 'hembras': valor_entero}),
+    'machos': _destetados(Macho),
+    'hembras': _destetados(Hembra),
+    'observaciones': Recurso(Observacion,
+                             {'id': Observacion.id, 'fecha': Observacion.fecha,
+                              'observacion': Observacion.observacion, 'macho_id': Observacion.macho_id,
+                              'hembra_id': Observacion.hembra_id},
+                             lambda columnas: db.session.query(*columnas),
+                             None, None, Observacion.fecha, None,
+                             {'observacion': _texto}),
+}
+
+
+def _error(mensaje, estado=400, **extra):
+    return jsonify(error=mensaje, **extra), estado
+
+
+def autenticado(vista):
+    # Como login_required pero con 401 en JSON (y HTTP Basic) en lugar de mandar al login
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not current_user.is_authenticated:
+            respuesta, estado = _error('Se requiere autenticación', 401)
+            respuesta.headers['WWW-Authenticate'] = 'Basic realm="bioterio"'
+            return respuesta, estado
+        return vista(*args, **kwargs)
+    return envoltura
+
+
+def _recurso(nombre):
+    return RECURSOS.get(nombre)
+
+
+def _serializar(valor):
+    return valor.isoformat() if isinstance(valor, datetime) else valor
+
+
+def _lote():
+    # El cuerpo de una escritura: un arreglo de objetos (o None si no lo es)
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, list) or not all(isinstance(fila, dict) for fila in datos):
+        return None
+    return datos
+
+
+@api.route('/<nombre>', methods=['GET'])
+@autenticado
+def listar(nombre):
+    # ?campos=id,caja&cepa=...&prefijo=...&desde=AAAA-MM-DD&hasta=...&limite=N&cursor=...
+    recurso = _recurso(nombre)
+    if recurso is None:
+        return _error('Recurso desconocido: {}'.format(nombre), 404)
+
+    campos = [campo for campo in request.args.get('campos', '').split(',') if campo] or list(recurso.columnas)
+    desconocidos = [campo for campo in campos if campo not in recurso.columnas]
+    if desconocidos:
+        return _error('Campos desconocidos: {}'.format(', '.join(desconocidos)),
+                      campos=list(recurso.columnas))
+    # El id siempre va: es la llave del cursor
+    if 'id' not in campos:
+        campos.insert(0, 'id')
+
+    try:
+        limite = int(request.args.get('limite', POR_PAGINA))
+    except ValueError:
+        return _error('limite debe ser un número entero')
+    if not 1 <= limite <= MAXIMO_PAGINA:
+        return _error('limite debe estar entre 1 y {}'.format(MAXIMO_PAGINA))
+    try:
+        filtros = leer_filtros(request.args)
+        if (filtros['cepa'] and recurso.cepa is None) or (filtros['prefijo'] and recurso.caja is None):
+            return _error('{} no se puede filtrar por cepa ni por prefijo'.format(nombre))
+        consulta = recurso.consulta([recurso.columnas[campo].label(campo) for campo in campos])
+        consulta = filtrar(consulta, filtros, recurso.caja, recurso.cepa, recurso.fecha)
+        filas, siguiente = pagina(consulta, [recurso.modelo.id], request.args.get('cursor'), limite)
+    except ValueError:
+        return _error('Filtro o cursor inválido')
+
+    return jsonify(datos=[dict(zip(campos, map(_serializar, fila))) for fila in filas], siguiente=siguiente)
+
+
+@api.route('/<nombre>', methods=['POST'])
+@autenticado
+def crear(nombre):
+    # Arreglo de objetos con los mismos campos que la importación; si alguno tiene
+    # error no se guarda ninguno. Regresa los ids en el mismo orden.
+    recurso = _recurso(nombre)
+    if recurso is None:
+        return _error('Recurso desconocido: {}'.format(nombre), 404)
+    filas = _lote()
+    if filas is None:
+        return _error('Se esperaba un arreglo de objetos JSON')
+    if len(filas) > MAXIMO_LOTE:
+        return _error('Máximo {} registros por petición'.format(MAXIMO_LOTE))
+
+    # Un null es lo mismo que no mandar el campo: los opcionales toman su valor por
+    # omisión y los obligatorios se reportan como faltantes
+    filas = [{campo: valor for campo, valor in fila.items() if valor is not None} for fila in filas]
+    errores = []
+    for indice, fila in enumerate(filas):
+        try:
+            _revisar_campos(fila)
+        except ErrorFila as e:
+            errores.append((indice, str(e)))
+    if errores:
+        return _error('Ningún registro se guardó', errores=[{'indice': i, 'error': e} for i, e in errores])
+
+    if recurso.tipo is None:
+        registros, errores = _observaciones(filas)
+    else:
+        importacion = Importacion(recurso.tipo)
+        registros = [importacion.registro(indice, fila) for indice, fila in enumerate(filas)]
+        errores = importacion.errores
+    if errores:
+        return _error('Ningún registro se guardó', errores=[{'indice': i, 'error': e} for i, e in errores])
+
+    # Las cajas nuevas se apartan en la transacción del commit, con el candado de
+    # escritura: el conjunto de Importacion se leyó antes y no ve registros ni reservas
+    # hechos después. apartar_caja deshace todo si una no está libre.
+    for indice, registro in enumerate(registros):
+        caja = getattr(registro, 'caja', None)
+        if caja is not None and not apartar_caja(caja, current_user.id):
+            return _error('Ningún registro se guardó', 409, errores=[
+                {'indice': indice, 'error': 'La caja {} ya existe o está reservada'.format(caja)}])
+    try:
+        db.session.add_all(registros)
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        return _error('Ningún registro se guardó: {}'.format(error.orig), 409)
+    return jsonify(ids=[registro.id for registro in registros]), 201
+
+
+def _observaciones(filas):
+    # Cada una con exactamente uno de macho_id / hembra_id, de una caja que exista
+    machos = {fila.get('macho_id') for fila in filas if _es_id(fila.get('macho_id'))}
+    hembras = {fila.get('hembra_id') for fila in filas if _es_id(fila.get('hembra_id'))}
+    existen = {('macho_id', id) for id, in db.session.query(Macho.id).filter(Macho.id.in_(machos))} | \
+              {('hembra_id', id) for id, in db.session.query(Hembra.id).filter(Hembra.id.in_(hembras))}
+
+    registros, errores = [], []
+    for indice, fila in enumerate(filas):
+        try:
+            llaves = [llave for llave in ('macho_id', 'hembra_id') if fila.get(llave) is not None]
+            if len(llaves) != 1:
+                raise ErrorFila('Indique macho_id o hembra_id (sólo uno)')
+            if not _es_id(fila[llaves[0]]):
+                raise ErrorFila('{} inválido: {}'.format(llaves[0], fila[llaves[0]]))
+            if (llaves[0], fila[llaves[0]]) not in existen:
+                raise ErrorFila('No existe la caja {} {}'.format(llaves[0], fila[llaves[0]]))
+            observacion = Observacion(observacion=_texto(fila.get('observacion')), **{llaves[0]: fila[llaves[0]]})
+            if fila.get('fecha'):
+                observacion.fecha = valor_fecha(fila['fecha'])
+            registros.append(observacion)
+        except ErrorFila as e:
+            errores.append((indice, str(e)))
+        except (ValueError, TypeError, AttributeError) as e:
+            errores.append((indice, 'Valor faltante o inválido: {}'.format(e)))
+    return registros, errores
+
+
+@api.route('/<nombre>', methods=['PATCH'])
+@autenticado
+def actualizar(nombre):
+    # Arreglo de {"id": ..., campo: valor, ...} con sólo los campos editables del recurso.
+    # Se cargan todos con una consulta y se guardan con un solo commit (todo o nada).
+    recurso = _recurso(nombre)
+    if recurso is None:
+        return _error('Recurso desconocido: {}'.format(nombre), 404)
+    filas = _lote()
+    if filas is None:
+        return _error('Se esperaba un arreglo de objetos JSON')
+    if len(filas) > MAXIMO_LOTE:
+        return _error('Máximo {} registros por petición'.format(MAXIMO_LOTE))
+
+    ids = [fila.get('id') for fila in filas if _es_id(fila.get('id'))]
+    registros = {registro.id: registro for registro in recurso.modelo.query.filter(recurso.modelo.id.in_(ids))}
+    errores = []
+    for indice, fila in enumerate(filas):
+        try:
+            if not _es_id(fila.get('id')):
+                raise ErrorFila('id inválido: {}'.format(fila.get('id')))
+            registro = registros.get(fila['id'])
+            if registro is None:
+                raise ErrorFila('No existe el registro {}'.format(fila.get('id')))
+            campos = set(fila) - {'id'}
+            no_editables = campos - set(recurso.editables)
+            if no_editables:
+                raise ErrorFila('Campos no editables: {}'.format(', '.join(sorted(no_editables))))
+            _revisar_campos({campo: fila[campo] for campo in campos})
+            for campo in campos:
+                setattr(registro, campo, recurso.editables[campo](fila[campo]))
+        except ErrorFila as e:
+            errores.append((indice, str(e)))
+        except (ValueError, TypeError, AttributeError) as e:
+            errores.append((indice, 'Valor faltante o inválido: {}'.format(e)))
+
+    if errores:
+        db.session.rollback()
+        return _error('Ningún registro se guardó', errores=[{'indice': i, 'error': e} for i, e in errores])
+    db.session.commit()
+    return jsonify(actualizados=len(filas))
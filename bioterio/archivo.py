@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+import click
+from bioterio import app, db
+from bioterio.models import Cruza, Camada, Macho, Hembra, Observacion, Caja, VersionDatos, CruzaArchivo, \
+    CamadaArchivo, MachoArchivo, HembraArchivo, ObservacionArchivo
+from bioterio.paginacion import pagina, filtrar
+from bioterio.en_vivo import purgar_cambios
+
+# Días que una caja retirada, una camada destetada o una cruza cerrada se queda en las
+# tablas activas antes de archivarse, y filas que se mueven por transacción
+DIAS = 90
+LOTE = 500
+
+# Lo que se puede consultar en /historial: (modelo de archivo, columnas de caja, cepa y fecha)
+HISTORIAL = {
+    'macho': (MachoArchivo, MachoArchivo.caja, MachoArchivo.cepa, MachoArchivo.fecha_destete),
+    'hembra': (HembraArchivo, HembraArchivo.caja, HembraArchivo.cepa, HembraArchivo.fecha_destete),
+    'cruza': (CruzaArchivo, CruzaArchivo.caja, CruzaArchivo.cepa, CruzaArchivo.fecha_cruza),
+}
+
+
+def retirar(caja, fecha=None):
+    # La caja deja los tableros y los contadores desde ya; el nombre sigue ocupado
+    # hasta que se archive
+    if caja.fecha_baja is not None:
+        raise ValueError('La caja {} ya está retirada'.format(caja.caja))
+    caja.fecha_baja = fecha or datetime.now()
+
+
+def cerrar(cruza, fecha=None):
+    if cruza.fecha_cierre is not None:
+        raise ValueError('La cruza {} ya está cerrada'.format(cruza.caja))
+    pendientes = Camada.query.filter(Camada.cruza_id == cruza.id) \
+        .filter(db.or_(Camada.macho_is_created == False, Camada.hembra_is_created == False)).count()
+    if pendientes:
+        raise ValueError('La cruza {} tiene {} camadas sin destetar'.format(cruza.caja, pendientes))
+    cruza.fecha_cierre = fecha or datetime.now()
+
+
+def _columnas(archivo):
+    return [columna.name for columna in archivo.__table__.columns if columna.name != 'archivada']
+
+
+def _mover(modelo, archivo, ids, ahora):
+    # INSERT ... SELECT al archivo y DELETE de la tabla activa, por Core: los eventos del
+    # ORM no corren, pero ninguna de estas filas cuenta ya en los contadores
+    columnas = _columnas(archivo)
+    origen = modelo.__table__
+    db.session.execute(archivo.__table__.insert().from_select(
+        columnas + ['archivada'],
+        db.select([origen.c[nombre] for nombre in columnas] + [db.literal(ahora, db.DateTime)])
+        .where(origen.c.id.in_(ids))))
+    db.session.execute(origen.delete().where(origen.c.id.in_(ids)))
+
+
+def _candidatas(modelo, *condiciones, lote):
+    # Las tablas activas son AUTOINCREMENT: archivar la fila con el id más alto no
+    # hace que SQLite le dé ese id a la siguiente alta
+    return [id for id, in db.session.query(modelo.id).filter(*condiciones).order_by(modelo.id).limit(lote)]
+
+
+def _terminar_lote():
+    # Las filas movidas cambian los tableros: nueva versión de datos, igual que un flush
+    tabla = VersionDatos.__table__
+    db.session.execute(tabla.update().where(tabla.c.id == 1).values(version=tabla.c.version + 1))
+    db.session.commit()
+
+
+def archivar(dias=DIAS, lote=LOTE, ahora=None):
+    # Mueve por lotes, cada uno en su propia transacción para no tener el candado de
+    # escritura más que un momento. Regresa {tabla: filas archivadas}.
+    ahora = ahora or datetime.now()
+    corte = ahora - timedelta(days=dias)
+    movidas = dict.fromkeys(('macho', 'hembra', 'observacion', 'camada', 'cruza'), 0)
+
+    # Cajas retiradas, con sus observaciones; el nombre de la caja queda libre
+    for modelo, archivo, llave in ((Macho, MachoArchivo, Observacion.macho_id),
+                                   (Hembra, HembraArchivo, Observacion.hembra_id)):
+        while True:
+            ids = _candidatas(modelo, modelo.fecha_baja < corte, lote=lote)
+            if not ids:
+                break
+            observaciones = [id for id, in db.session.query(Observacion.id).filter(llave.in_(ids))]
+            if observaciones:
+                _mover(Observacion, ObservacionArchivo, observaciones, ahora)
+            _mover(modelo, archivo, ids, ahora)
+            db.session.execute(Caja.__table__.delete().where(Caja.tabla == modelo.__tablename__)
+                               .where(Caja.registro_id.in_(ids)))
+            _terminar_lote()
+            movidas[modelo.__tablename__] += len(ids)
+            movidas['observacion'] += len(observaciones)
+
+    # Camadas con los dos sexos destetados hace más de `dias`
+    while True:
+        ids = _candidatas(Camada, Camada.macho_is_created == True, Camada.hembra_is_created == True,
+                          Camada.fecha_destete < corte, lote=lote)
+        if not ids:
+            break
+        _mover(Camada, CamadaArchivo, ids, ahora)
+        _terminar_lote()
+        movidas['camada'] += len(ids)
+
+    # Cruzas cerradas que ya no tienen camadas ni cajas activas. Sus filas de progenitor
+    # se quedan: son el grafo del linaje y las cajas archivadas siguen en él.
+    while True:
+        ids = _candidatas(Cruza, Cruza.fecha_cierre < corte,
+                          ~Camada.query.filter(Camada.cruza_id == Cruza.id).exists(),
+                          ~Macho.query.filter(Macho.cruza_id == Cruza.id).exists(),
+                          ~Hembra.query.filter(Hembra.cruza_id == Cruza.id).exists(), lote=lote)
+        if not ids:
+            break
+        _mover(Cruza, CruzaArchivo, ids, ahora)
+        db.session.execute(Caja.__table__.delete().where(Caja.tabla == 'cruza').where(Caja.registro_id.in_(ids)))
+        _terminar_lote()
+        movidas['cruza'] += len(ids)
+
+    # La bitácora del tablero en vivo sólo se purga sola mientras alguien lo ve
+    purgar_cambios(ahora)
+    return movidas
+
+
+def historial(tabla, filtros, cursor=None):
+    # Una página del archivo, lo más recientemente archivado primero, con las
+    # observaciones de las cajas de la página en una sola consulta
+    modelo, caja, cepa, fecha = HISTORIAL[tabla]
+    consulta = filtrar(modelo.query, filtros, caja, cepa, fecha)
+    filas, siguiente = pagina(consulta, [modelo.archivada, modelo.id], cursor, descendente=True)
+
+    observaciones = {}
+    if tabla in ('macho', 'hembra') and filas:
+        llave = getattr(ObservacionArchivo, tabla + '_id')
+        for observacion in ObservacionArchivo.query.filter(llave.in_([fila.id for fila in filas])) \
+                .order_by(ObservacionArchivo.fecha):
+            observaciones.setdefault(getattr(observacion, tabla + '_id'), []).append(observacion)
+    return filas, observaciones, siguiente
+
+
+@app.cli.command('archivar')
+@click.option('--dias', default=DIAS, show_default=True,
+              help='Días desde la baja, el destete o el cierre antes de archivar')
+@click.option('--lote', default=LOTE, show_default=True, help='Filas por transacción')
+def archivar_command(dias, lote):
+    """Mueve cajas retiradas, camadas destetadas y cruzas cerradas a las tablas de archivo."""
+    movidas = archivar(dias, lote)
+    for tabla, filas in movidas.items():
+        click.echo('{}: {} archivadas'.format(tabla, filas))
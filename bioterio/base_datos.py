@@ -0,0 +1,51 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# PRAGMAs que se aplican a cada conexión nueva de SQLite. WAL deja que los lectores
+# sigan leyendo mientras alguien escribe; busy_timeout hace que un escritor espere su
+# turno en lugar de fallar con "database is locked".
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 10000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,
+    'temp_store': 'MEMORY',
+}
+
+
+def aplicar_pragmas(conexion, pragmas):
+    cursor = conexion.cursor()
+    for nombre, valor in pragmas.items():
+        cursor.execute('PRAGMA {} = {}'.format(nombre, valor))
+    cursor.close()
+
+
+def opciones_engine(pool_size=5, max_overflow=10):
+    # Un pool de conexiones reutilizables en lugar de abrir el archivo en cada petición
+    return {'poolclass': QueuePool, 'pool_size': pool_size, 'max_overflow': max_overflow,
+            'connect_args': {'check_same_thread': False}}
+
+
+def configurar(app, db):
+    # Lee SQLITE_PRAGMAS, SQLITE_POOL_SIZE y SQLITE_MAX_OVERFLOW de la configuración.
+    # Se llama después de SQLAlchemy(app) pero antes de usar el engine, que se crea al
+    # pedirlo por primera vez; con otra base de datos no hace nada.
+    if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+
+    app.config.setdefault('SQLITE_PRAGMAS', dict(PRAGMAS))
+    app.config.setdefault('SQLITE_POOL_SIZE', 5)
+    app.config.setdefault('SQLITE_MAX_OVERFLOW', 10)
+    if ':memory:' not in app.config['SQLALCHEMY_DATABASE_URI']:
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS',
+                              opciones_engine(app.config['SQLITE_POOL_SIZE'], app.config['SQLITE_MAX_OVERFLOW']))
+
+    # Sólo en el engine de la aplicación: escuchar en la clase Engine también ajustaría
+    # cualquier otro engine del proceso (p. ej. el brazo base de los benchmarks)
+    def _al_conectar(conexion, registro):
+        if isinstance(conexion, sqlite3.Connection):
+            aplicar_pragmas(conexion, app.config['SQLITE_PRAGMAS'])
+
+    event.listen(db.get_engine(app), 'connect', _al_conectar)
@@ -0,0 +1,47 @@
+from markupsafe import Markup, escape
+from bioterio import db
+
+POR_PAGINA = 20
+
+# Marcas que pone snippet() alrededor de cada coincidencia; se cambian por <mark>
+# después de escapar el texto de la observación.
+_INICIO, _FIN = '\x02', '\x03'
+
+
+def expresion(texto):
+    # Cada palabra entre comillas (para que la sintaxis de FTS5 no truene con lo que
+    # escriba el usuario) y como prefijo: "pele" encuentra "pelea". Todas deben aparecer.
+    palabras = ['"{}"*'.format(palabra.replace('"', '""')) for palabra in texto.split()]
+    return ' '.join(palabras)
+
+
+def buscar(texto, pagina=1, por_pagina=POR_PAGINA):
+    # Observaciones ordenadas por relevancia (bm25), con la caja y la cepa a la que pertenecen
+    consulta = expresion(texto)
+    if not consulta:
+        return [], False
+
+    filas = db.session.execute(db.text("""
+        SELECT o.id, o.fecha, o.macho_id, o.hembra_id,
+               COALESCE(m.caja, h.caja) AS caja, COALESCE(m.cepa, h.cepa) AS cepa,
+               snippet(observacion_fts, 0, :inicio, :fin, '…', 16) AS fragmento
+        FROM observacion_fts
+        JOIN observacion o ON o.id = observacion_fts.rowid
+        LEFT JOIN macho m ON m.id = o.macho_id
+        LEFT JOIN hembra h ON h.id = o.hembra_id
+        WHERE observacion_fts MATCH :consulta
+        ORDER BY observacion_fts.rank
+        LIMIT :limite OFFSET :desde
+    """), {'consulta': consulta, 'inicio': _INICIO, 'fin': _FIN,
+           'limite': por_pagina + 1, 'desde': (pagina - 1) * por_pagina}).fetchall()
+
+    hay_siguiente = len(filas) > por_pagina
+    return [_resultado(fila) for fila in filas[:por_pagina]], hay_siguiente
+
+
+def _resultado(fila):
+    resultado = dict(fila)
+    resultado['sexo'] = 'macho' if fila.macho_id is not None else 'hembra'
+    resultado['fragmento'] = Markup(str(escape(fila.fragmento))
+                                    .replace(_INICIO, '<mark>').replace(_FIN, '</mark>'))
+    return resultado
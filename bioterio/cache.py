@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheTTL:
+    # Cache en memoria del proceso: descarta lo menos usado al llenarse (LRU) y
+    # lo que tenga más de `ttl` segundos. Cada worker de gunicorn tiene la suya,
+    # el ttl acota cuánto tarda en enterarse de cambios hechos en otro worker.
+
+    def __init__(self, maximo=128, ttl=300):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._datos = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, llave):
+        with self._candado:
+            entrada = self._datos.get(llave)
+            if entrada is not None and entrada[0] > time.monotonic():
+                self._datos.move_to_end(llave)
+                self.aciertos += 1
+                return entrada[1]
+            if entrada is not None:
+                del self._datos[llave]
+            self.fallos += 1
+            return None
+
+    def guardar(self, llave, valor):
+        with self._candado:
+            self._datos[llave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(llave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def quitar(self, llave):
+        with self._candado:
+            self._datos.pop(llave, None)
+
+    def limpiar(self):
+        with self._candado:
+            self._datos.clear()
+
+    def estadisticas(self):
+        with self._candado:
+            return {'aciertos': self.aciertos, 'fallos': self.fallos, 'tamano': len(self._datos)}
@@ -0,0 +1,145 @@
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError, OperationalError
+from bioterio import db
+from bioterio.models import Caja, ReservaCaja, separar_caja
+from bioterio.cepas import prefijo_de
+
+# Minutos que se guarda una caja ofrecida en el formulario de destete
+RESERVA_MINUTOS = 15
+INTENTOS = 10
+# Nombres por consulta en apartar_cajas, por debajo del límite de parámetros de SQLite
+TROZO = 400
+
+
+class CajaNoDisponible(Exception):
+    pass
+
+
+# El primer hueco: el menor número n + 1 de la letra tal que n + 1 no está ni en uso
+# ni reservado. Sólo lee el índice (letra, numero) de las dos tablas.
+_HUECO = db.text("""
+    WITH usados AS (
+        SELECT numero FROM caja WHERE letra = :letra AND numero IS NOT NULL
+        UNION
+        SELECT numero FROM reserva_caja WHERE letra = :letra AND expira > :ahora
+    )
+    SELECT MIN(numero + 1) FROM usados WHERE numero + 1 NOT IN usados
+""").bindparams(db.bindparam('ahora', type_=db.DateTime))
+
+
+def verificar_caja(caja, cepa):
+    # La caja debe empezar con el prefijo de la cepa (y sólo con él: 'AB3' no es de 'A')
+    prefijo = prefijo_de(cepa)
+    return prefijo is not None and separar_caja(caja)[0] == prefijo
+
+
+def regresar_letra_cepa(cepa):
+    return prefijo_de(cepa)
+
+
+def _primer_hueco(letra, ahora):
+    numero = db.session.execute(_HUECO, {'letra': letra, 'ahora': ahora}).scalar()
+    if numero is None:
+        numero = 1
+    return numero
+
+
+def siguientes_numeros(letra, cantidad, ahora):
+    # Los siguientes `cantidad` números libres de la letra, cada uno el primer hueco
+    # después de contar los anteriores; una sola lectura de los números en uso.
+    usados = {numero for (numero,) in db.session.execute(db.text("""
+        SELECT numero FROM caja WHERE letra = :letra AND numero IS NOT NULL
+        UNION
+        SELECT numero FROM reserva_caja WHERE letra = :letra AND expira > :ahora
+    """).bindparams(db.bindparam('ahora', type_=db.DateTime)), {'letra': letra, 'ahora': ahora})}
+
+    numeros = []
+    numero = min(usados) if usados else 0
+    while len(numeros) < cantidad:
+        if numero + 1 not in usados:
+            numeros.append(numero + 1)
+            usados.add(numero + 1)
+        numero += 1
+    return numeros
+
+
+def siguiente_caja(cepa):
+    letra = regresar_letra_cepa(cepa)
+    return letra + str(_primer_hueco(letra, datetime.now()))
+
+
+def reservar_caja(cepa, usuario_id, destino=None):
+    # Aparta la siguiente caja libre de la cepa y la regresa. Si el mismo usuario ya tiene
+    # una reserva vigente para el mismo destino (p. ej. recargar el formulario) se reutiliza.
+    letra = regresar_letra_cepa(cepa)
+    tabla = ReservaCaja.__table__
+
+    for intento in range(INTENTOS):
+        ahora = datetime.now()
+        expira = ahora + timedelta(minutes=RESERVA_MINUTOS)
+        try:
+            # Empezar con una escritura toma el candado de escritura de SQLite: hasta el
+            # commit ninguna otra transacción puede reservar ni registrar cajas.
+            db.session.execute(tabla.delete().where(tabla.c.expira <= ahora))
+
+            if destino is not None:
+                propia = db.session.execute(
+                    db.select([tabla.c.id, tabla.c.caja])
+                    .where(tabla.c.usuario_id == usuario_id)
+                    .where(tabla.c.destino == destino)
+                    .where(tabla.c.letra == letra)).first()
+                if propia is not None:
+                    db.session.execute(tabla.update().where(tabla.c.id == propia.id).values(expira=expira))
+                    db.session.commit()
+                    return propia.caja
+
+            numero = _primer_hueco(letra, ahora)
+            caja = letra + str(numero)
+            db.session.execute(tabla.insert().values(caja=caja, letra=letra, numero=numero, expira=expira,
+                                                     usuario_id=usuario_id, destino=destino))
+            db.session.commit()
+            return caja
+        except (IntegrityError, OperationalError):
+            # Otra transacción ganó el número o la base siguió ocupada: de nuevo con espera
+            db.session.rollback()
+            time.sleep(random.uniform(0, 0.01 * 2 ** intento))
+
+    raise CajaNoDisponible('No se pudo reservar una caja para {}'.format(cepa))
+
+
+def apartar_caja(caja, usuario_id):
+    # Se llama antes de crear la caja, dentro de la misma transacción (no hace commit).
+    # Libera la reserva propia o vencida de ese nombre, toma el candado de escritura y
+    # regresa False si la caja ya existe o alguien más la tiene reservada.
+    tabla = ReservaCaja.__table__
+    db.session.execute(tabla.delete().where(tabla.c.caja == caja)
+                       .where(db.or_(tabla.c.expira <= datetime.now(), tabla.c.usuario_id == usuario_id)))
+
+    reservada = db.session.query(ReservaCaja.query.filter(ReservaCaja.caja == caja).exists()).scalar()
+    if reservada or existe_caja(caja):
+        db.session.rollback()
+        return False
+    return True
+
+
+def apartar_cajas(cajas, usuario_id):
+    # apartar_caja para un lote: un DELETE y una lectura por conjunto en lugar de tres
+    # consultas por caja. Regresa los nombres que ya existen o que alguien más tiene
+    # reservados; las demás quedan apartadas hasta el commit. No hace commit ni rollback.
+    tabla = ReservaCaja.__table__
+    nombres = list(dict.fromkeys(cajas))
+    tomadas = set()
+    for inicio in range(0, len(nombres), TROZO):
+        trozo = nombres[inicio:inicio + TROZO]
+        db.session.execute(tabla.delete().where(tabla.c.caja.in_(trozo))
+                           .where(db.or_(tabla.c.expira <= datetime.now(), tabla.c.usuario_id == usuario_id)))
+        en_uso = db.select([Caja.caja]).where(Caja.caja.in_(trozo)).union(
+            db.select([tabla.c.caja]).where(tabla.c.caja.in_(trozo)))
+        tomadas.update(caja for (caja,) in db.session.execute(en_uso))
+    return tomadas
+
+
+def existe_caja(caja):
+    return db.session.query(Caja.query.filter(Caja.caja == caja).exists()).scalar()
@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from sqlalchemy import literal, tuple_
+from bioterio import db
+from bioterio.models import Macho, Hembra
+from bioterio.paginacion import POR_PAGINA, filtrar, leer_cursor, escribir_cursor
+from bioterio.contadores import contadores
+
+# (sexo, modelo) en el orden en que se muestran
+SEXOS = (('macho', Macho), ('hembra', Hembra))
+# Las edades de más semanas que esto se juntan en una sola columna del reporte
+TOPE_SEMANAS = 52
+# Llave de orden de las cajas y del cursor: (orden de SEXOS, cepa, fecha_destete, id)
+LLAVE = (db.column('orden', db.Integer), db.column('cepa', db.String), db.column('fecha_destete', db.DateTime),
+         db.column('id', db.Integer))
+
+
+def dias_desde(columna, hoy):
+    # Días completos entre la fecha (sin hora) de `columna` y `hoy`, calculados en SQLite.
+    # `hoy` viene de Python y no de 'now' para que coincida con la llave del caché de páginas.
+    return db.cast(db.func.julianday(hoy) - db.func.julianday(db.func.date(columna)), db.Integer)
+
+
+def _cajas(cepas, filtros, *columnas):
+    # Machos y hembras en una sola consulta; "orden" conserva el orden de SEXOS.
+    # Los filtros se aplican a cada tabla para que usen sus índices.
+    consultas = []
+    for orden, (sexo, modelo) in enumerate(SEXOS):
+        consulta = db.session.query(literal(orden).label('orden'), literal(sexo).label('sexo'),
+                                    modelo.cepa.label('cepa'),
+                                    *[getattr(modelo, columna).label(columna) for columna in columnas])
+        # Las cajas retiradas ya no cuentan aunque aún no se archiven
+        consulta = filtrar(consulta.filter(modelo.cepa.in_(cepas), modelo.fecha_baja.is_(None)), filtros,
+                           modelo.caja, modelo.cepa, modelo.fecha_destete)
+        consultas.append(consulta)
+    return consultas[0].union_all(*consultas[1:]).subquery()
+
+
+def _grupos(cepas, desde):
+    # (orden, sexo, modelo, cepa) en el orden de la página, a partir del grupo del cursor
+    for orden, (sexo, modelo) in enumerate(SEXOS):
+        for cepa in sorted(cepas):
+            if desde is None or (orden, cepa) >= (desde[0], desde[1]):
+                yield orden, sexo, modelo, cepa
+
+
+def cajas_destetadas(cepas, filtros, cursor=None, hoy=None, por_pagina=POR_PAGINA):
+    # Una página de cajas en orden LLAVE. Un UNION ALL con `cepa IN (...)` obliga a SQLite
+    # a ordenar todas las cajas activas en cada página; en cambio se recorre grupo por
+    # grupo (sexo, cepa) desde el del cursor, con una consulta `cepa = ?` que sigue el
+    # índice (cepa, fecha_destete) y pide sólo las filas que faltan. El costo de una
+    # página no depende del tamaño de la colonia.
+    hoy = hoy or date.today()
+    desde = leer_cursor(cursor, LLAVE) if cursor else None
+    filas = []
+    for orden, sexo, modelo, cepa in _grupos(cepas, desde):
+        consulta = db.session.query(literal(orden).label('orden'), literal(sexo).label('sexo'),
+                                    modelo.cepa.label('cepa'), modelo.id.label('id'), modelo.caja.label('caja'),
+                                    modelo.fecha_nacimiento.label('fecha_nacimiento'),
+                                    modelo.fecha_destete.label('fecha_destete'), modelo.cantidad.label('cantidad'),
+                                    modelo.padres.label('padres'),
+                                    dias_desde(modelo.fecha_nacimiento, hoy).label('edad')) \
+            .filter(modelo.cepa == cepa, modelo.fecha_baja.is_(None))
+        consulta = filtrar(consulta, filtros, modelo.caja, modelo.cepa, modelo.fecha_destete)
+        if desde is not None and (orden, cepa) == (desde[0], desde[1]):
+            consulta = consulta.filter(tuple_(modelo.fecha_destete, modelo.id) > tuple_(desde[2], desde[3]))
+        filas += consulta.order_by(modelo.fecha_destete, modelo.id).limit(por_pagina + 1 - len(filas)).all()
+        if len(filas) > por_pagina:
+            break
+
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        siguiente = escribir_cursor([getattr(filas[-1], clave.key) for clave in LLAVE])
+    return filas, siguiente
+
+
+def totales(cepas, filtros):
+    if not (filtros['prefijo'] or filtros['desde'] or filtros['hasta']):
+        # Sin filtros bastan los contadores por cepa, sin sumar las cajas
+        suma = {}
+        for cepa, contador in contadores(cepas).items():
+            suma[('macho', cepa)] = contador.machos
+            suma[('hembra', cepa)] = contador.hembras
+        return suma
+
+    cajas = _cajas(cepas, filtros, 'cantidad')
+    filas = db.session.query(cajas.c.sexo, cajas.c.cepa, db.func.sum(cajas.c.cantidad)) \
+        .group_by(cajas.c.sexo, cajas.c.cepa).all()
+    return {(sexo, cepa): total for sexo, cepa, total in filas}
+
+
+def censo(cepas, filtros, cursor=None, hoy=None):
+    # [(sexo, [(cepa, total, cajas), ...]), ...] con todas las cepas aunque no tengan cajas
+    # en la página; los totales son de todo lo filtrado, no sólo de la página.
+    if filtros['cepa']:
+        cepas = [cepa for cepa in cepas if cepa == filtros['cepa']]
+
+    grupos = {(sexo, cepa): [] for sexo, _ in SEXOS for cepa in cepas}
+    cajas, siguiente = cajas_destetadas(cepas, filtros, cursor, hoy)
+    for caja in cajas:
+        grupos[(caja.sexo, caja.cepa)].append(caja)
+
+    suma = totales(cepas, filtros)
+    secciones = [(sexo, [(cepa, suma.get((sexo, cepa), 0), grupos[(sexo, cepa)]) for cepa in cepas])
+                 for sexo, _ in SEXOS]
+    return secciones, siguiente
+
+
+def edades(cepas, hoy=None, sexo=None, desde=None, hasta=None):
+    # Animales y cajas activos por cepa, sexo y semana de edad, en una sola consulta de
+    # agregación: nada se carga fila por fila. `desde`/`hasta` (semanas, inclusivas) se
+    # traducen a un rango de fecha_nacimiento para que cada tabla use su índice
+    # (cepa, fecha_nacimiento, cantidad). Las semanas después de TOPE_SEMANAS se juntan.
+    # Regresa [{cepa, sexo, semana, cajas, animales}, ...] ordenado por cepa, sexo y semana.
+    hoy = hoy or date.today()
+    medianoche = datetime.combine(hoy, datetime.min.time()) + timedelta(days=1)
+    consultas = []
+    for orden, (nombre, modelo) in enumerate(SEXOS):
+        if sexo and sexo != nombre:
+            continue
+        semana = db.func.min(dias_desde(modelo.fecha_nacimiento, hoy) / 7, TOPE_SEMANAS)
+        consulta = db.session.query(literal(orden).label('orden'), literal(nombre).label('sexo'),
+                                    modelo.cepa.label('cepa'), semana.label('semana'),
+                                    modelo.cantidad.label('cantidad')) \
+            .filter(modelo.cepa.in_(cepas), modelo.fecha_baja.is_(None))
+        # semana >= desde  <=>  nació antes del día siguiente a hoy - 7 * desde
+        if desde is not None:
+            consulta = consulta.filter(modelo.fecha_nacimiento < medianoche - timedelta(weeks=desde))
+        if hasta is not None and hasta < TOPE_SEMANAS:
+            consulta = consulta.filter(modelo.fecha_nacimiento >= medianoche - timedelta(weeks=hasta + 1))
+        consultas.append(consulta)
+    if not consultas or not cepas:
+        return []
+
+    cajas = consultas[0].union_all(*consultas[1:]).subquery()
+    filas = db.session.query(cajas.c.cepa, cajas.c.sexo, cajas.c.semana,
+                             db.func.count().label('cajas'), db.func.sum(cajas.c.cantidad).label('animales')) \
+        .group_by(cajas.c.cepa, cajas.c.orden, cajas.c.sexo, cajas.c.semana) \
+        .order_by(cajas.c.cepa, cajas.c.orden, cajas.c.semana)
+    return [dict(fila._mapping) for fila in filas]
+
+
+def tabla_edades(filas):
+    # Las filas de edades() como tabla para la página: (semanas, [(cepa, sexo, {semana: fila}, total)])
+    semanas = sorted({fila['semana'] for fila in filas})
+    grupos = OrderedDict()
+    for fila in filas:
+        grupos.setdefault((fila['cepa'], fila['sexo']), {})[fila['semana']] = fila
+    return semanas, [(cepa, sexo, celdas, sum(fila['animales'] for fila in celdas.values()))
+                     for (cepa, sexo), celdas in grupos.items()]
@@ -0,0 +1,63 @@
+from collections import namedtuple
+from sqlalchemy import event
+from bioterio import db
+from bioterio.cache import CacheTTL
+from bioterio.models import Cepa, EDAD_DESTETE
+from bioterio.respuestas import version_datos
+
+# Las cepas cambian casi nunca y se consultan en cada página, así que la tabla entera
+# vive en memoria: por nombre, por prefijo y en orden. La llave lleva la versión de los
+# datos, que sube con cualquier cambio a Cepa: un worker se entera de una cepa nueva en
+# cuanto otro la registra, sin esperar el ttl. La versión se lee una vez por transacción
+# de la sesión (no una por caja al importar) y se olvida al terminarla.
+Registro = namedtuple('Registro', 'nombres por_nombre por_prefijo')
+_registro = CacheTTL(maximo=1, ttl=3600)
+
+
+def _version():
+    info = db.session.info
+    if 'version_cepas' not in info:
+        info['version_cepas'] = version_datos()
+    return info['version_cepas']
+
+
+def registro():
+    version = _version()
+    datos = _registro.obtener(('cepas', version))
+    if datos is None:
+        filas = db.session.query(Cepa.nombre, Cepa.prefijo, Cepa.edad_destete).order_by(Cepa.id).all()
+        datos = Registro([fila.nombre for fila in filas], {fila.nombre: fila for fila in filas},
+                         {fila.prefijo: fila.nombre for fila in filas})
+        _registro.guardar(('cepas', version), datos)
+    return datos
+
+
+def cepas():
+    return registro().nombres
+
+
+def prefijo_de(cepa):
+    fila = registro().por_nombre.get(cepa)
+    return fila.prefijo if fila else None
+
+
+def cepa_de_prefijo(prefijo):
+    return registro().por_prefijo.get(prefijo)
+
+
+def edad_destete(cepa):
+    fila = registro().por_nombre.get(cepa)
+    return fila.edad_destete if fila else EDAD_DESTETE
+
+
+def olvidar():
+    _registro.limpiar()
+    db.session.info.pop('version_cepas', None)
+
+
+def _al_terminar(session):
+    session.info.pop('version_cepas', None)
+
+
+event.listen(db.session, 'after_commit', _al_terminar)
+event.listen(db.session, 'after_rollback', _al_terminar)
@@ -0,0 +1,76 @@
+import click
+from bioterio import app, db
+from bioterio.models import ContadorCepa
+
+COLUMNAS = ('machos', 'hembras', 'cajas_macho', 'cajas_hembra', 'cruzas', 'camadas_pendientes')
+
+# Los mismos totales que mantienen los eventos de models.py, calculados desde cero
+CALCULAR = db.text("""
+    SELECT cepa, SUM(machos), SUM(hembras), SUM(cajas_macho), SUM(cajas_hembra), SUM(cruzas),
+           SUM(camadas_pendientes)
+    FROM (
+        SELECT cepa, SUM(cantidad) AS machos, 0 AS hembras, COUNT(*) AS cajas_macho, 0 AS cajas_hembra,
+               0 AS cruzas, 0 AS camadas_pendientes
+        FROM macho WHERE fecha_baja IS NULL GROUP BY cepa
+        UNION ALL
+        SELECT cepa, 0, SUM(cantidad), 0, COUNT(*), 0, 0 FROM hembra WHERE fecha_baja IS NULL GROUP BY cepa
+        UNION ALL
+        SELECT cepa, 0, 0, 0, 0, COUNT(*), 0 FROM cruza WHERE fecha_cierre IS NULL GROUP BY cepa
+        UNION ALL
+        SELECT cruza.cepa, 0, 0, 0, 0, 0, COUNT(*)
+        FROM camada JOIN cruza ON cruza.id = camada.cruza_id
+        WHERE NOT (camada.macho_is_created AND camada.hembra_is_created)
+        GROUP BY cruza.cepa
+    )
+    GROUP BY cepa
+""")
+
+
+def calcular():
+    return {fila[0]: dict(zip(COLUMNAS, fila[1:])) for fila in db.session.execute(CALCULAR)}
+
+
+def contadores(cepas):
+    # Totales por cepa sin recorrer la colonia: una fila por cepa
+    filas = ContadorCepa.query.filter(ContadorCepa.cepa.in_(cepas)).all()
+    return {fila.cepa: fila for fila in filas}
+
+
+def reconciliar(corregir=True):
+    # Compara los contadores con los totales reales; regresa [(cepa, columna, guardado, real)]
+    # y, si se pide, deja los contadores iguales a los reales.
+    reales = calcular()
+    guardados = {fila.cepa: fila for fila in ContadorCepa.query.all()}
+
+    diferencias = []
+    for cepa in sorted(set(reales) | set(guardados)):
+        real = reales.get(cepa, dict.fromkeys(COLUMNAS, 0))
+        guardado = guardados.get(cepa)
+        for columna in COLUMNAS:
+            valor = getattr(guardado, columna) if guardado else 0
+            if valor != real[columna]:
+                diferencias.append((cepa, columna, valor, real[columna]))
+
+        if corregir:
+            if guardado is None:
+                db.session.add(ContadorCepa(cepa=cepa, **real))
+            else:
+                for columna in COLUMNAS:
+                    setattr(guardado, columna, real[columna])
+
+    if corregir:
+        db.session.commit()
+    return diferencias
+
+
+@app.cli.command('reconciliar-contadores')
+@click.option('--solo-revisar', is_flag=True, help='Reporta las diferencias sin corregirlas')
+def reconciliar_command(solo_revisar):
+    """Recalcula los contadores por cepa desde cero y reporta las diferencias."""
+    diferencias = reconciliar(corregir=not solo_revisar)
+    for cepa, columna, guardado, real in diferencias:
+        click.echo('{} {}: {} en el contador, {} real'.format(cepa, columna, guardado, real))
+    if diferencias:
+        click.echo('{} diferencias {}'.format(len(diferencias), 'encontradas' if solo_revisar else 'corregidas'))
+    else:
+        click.echo('Los contadores coinciden con la colonia')
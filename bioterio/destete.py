@@ -0,0 +1,72 @@
+from collections import defaultdict
+from datetime import date, datetime
+from bioterio import db
+from bioterio.models import Cruza, Camada, Macho, Hembra, ReservaCaja
+from bioterio.cajas import regresar_letra_cepa, siguientes_numeros
+from bioterio.censo import dias_desde
+
+SEXOS = (('macho', Macho, 'machos'), ('hembra', Hembra, 'hembras'))
+
+
+def pendiente():
+    # Camadas que ya deben destetarse y les falta algún sexo
+    return db.and_(Camada.fecha_destete < datetime.now(),
+                   db.or_(Camada.macho_is_created == False, Camada.hembra_is_created == False))
+
+
+def camadas_pendientes(hoy=None):
+    # Las pendientes con la cepa de su cruza y los días que lleva vencida (calculados en SQLite)
+    hoy = hoy or date.today()
+    return db.session.query(Camada, Cruza.cepa, dias_desde(Camada.fecha_destete, hoy).label('vencida')) \
+        .join(Cruza, Camada.cruza_id == Cruza.id) \
+        .filter(pendiente()) \
+        .order_by(Camada.fecha_destete.desc()).all()
+
+
+def destetar_lote(seleccion, fecha_destete, usuario_id):
+    # Desteta de una vez los sexos elegidos de varias camadas. `seleccion` es
+    # {'macho': {camada_id, ...}, 'hembra': {...}}. Las cajas de cada cepa se asignan
+    # en una sola pasada y todo (cajas, cambios a las camadas) va en un solo commit.
+    # Sólo se destetan camadas pendientes (como en camadas_pendientes) de cepas con
+    # prefijo. Regresa ([(sexo, caja, cepa, camada_id), ...] con lo que se creó,
+    # [camada_id, ...] de las elegidas que se saltaron).
+    ids = set().union(*seleccion.values())
+    if not ids:
+        return [], []
+
+    # Empezar con una escritura toma el candado de escritura de SQLite (ver reservar_caja);
+    # las reservas de este usuario para estas camadas se liberan porque aquí se asignan.
+    ahora = datetime.now()
+    destinos = ['{}-{}'.format(sexo, id) for sexo, ids_sexo in seleccion.items() for id in ids_sexo]
+    tabla = ReservaCaja.__table__
+    db.session.execute(tabla.delete().where(db.or_(
+        tabla.c.expira <= ahora,
+        db.and_(tabla.c.usuario_id == usuario_id, tabla.c.destino.in_(destinos)))))
+
+    filas = db.session.query(Camada, Cruza).join(Cruza, Camada.cruza_id == Cruza.id) \
+        .filter(Camada.id.in_(ids), pendiente()).order_by(Camada.fecha_nacimiento, Camada.id).all()
+
+    por_letra = defaultdict(list)
+    omitidas = set(ids)
+    for camada, cruza in filas:
+        letra = regresar_letra_cepa(cruza.cepa)
+        if letra is None:
+            continue
+        for sexo, modelo, cantidad in SEXOS:
+            if camada.id in seleccion.get(sexo, ()) and not getattr(camada, sexo + '_is_created'):
+                por_letra[letra].append((sexo, modelo, cantidad, camada, cruza))
+                omitidas.discard(camada.id)
+
+    creadas = []
+    for letra, pendientes in por_letra.items():
+        for (sexo, modelo, cantidad, camada, cruza), numero in zip(pendientes,
+                                                                   siguientes_numeros(letra, len(pendientes), ahora)):
+            caja = letra + str(numero)
+            db.session.add(modelo(caja=caja, fecha_nacimiento=camada.fecha_nacimiento, fecha_destete=fecha_destete,
+                                  cantidad=getattr(camada, cantidad), cepa=cruza.cepa, cruza=cruza,
+                                  padres=cruza.caja))
+            setattr(camada, sexo + '_is_created', True)
+            creadas.append((sexo, caja, cruza.cepa, camada.id))
+
+    db.session.commit()
+    return creadas, sorted(omitidas)
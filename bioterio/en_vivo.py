@@ -0,0 +1,181 @@
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from bioterio import app, db
+from bioterio.models import Cambio, Camada, Cruza, datos_camada
+
+# Tablero en vivo por server-sent events. Un solo hilo publicador por proceso lee la
+# bitácora `cambio` cada INTERVALO segundos y pone cada cambio en la cola de cada
+# navegador conectado: el trabajo es por cambio, no por visor ni por recarga. El hilo
+# arranca con el primer cliente y termina cuando ya no queda ninguno.
+#
+# Cada pestaña abierta ocupa una petición mientras siga abierta. Con trabajadores
+# síncronos (gunicorn por omisión) unas cuantas pestañas dejarían sin trabajadores al
+# resto de las rutas, así que /en-vivo sólo se sirve con hilos o con gevent (ver
+# admite_flujos) y en otro caso responde 204 y la página sigue sin cambios en vivo. En
+# producción conviene un proceso aparte sólo para el tablero, detrás del mismo proxy:
+#
+#     gunicorn -w 4 app:app                                    # el resto de las rutas
+#     gunicorn -w 1 -k gthread --threads 64 -b :8001 app:app   # sólo /en-vivo
+#
+#     location /en-vivo { proxy_pass http://127.0.0.1:8001; proxy_buffering off; }
+#
+# La bitácora se purga aquí mientras hay clientes y también desde `flask archivar` y
+# el ciclo de `flask trabajos` (purgar_cambios), para que no crezca si nadie mira.
+INTERVALO = 1.0
+# Cada cuánto se manda un comentario vacío para que proxies y navegadores no corten
+LATIDO = 15
+# Mensajes pendientes por cliente; uno que no lee se desconecta y reanuda con Last-Event-ID
+COLA = 256
+# Cuánto se guarda la bitácora y cada cuánto se purga
+CONSERVAR = timedelta(days=1)
+PURGA = timedelta(minutes=10)
+LOTE = 500
+
+log = logging.getLogger(__name__)
+
+
+def admite_flujos(environ):
+    # ¿El servidor puede tener una petición abierta sin bloquear a las demás?
+    if environ.get('wsgi.multithread'):
+        return True
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def purgar_cambios(ahora=None):
+    # Borra la bitácora más vieja que CONSERVAR, en lotes para no tener el candado de
+    # escritura más que un momento. No hay que tener clientes conectados.
+    ahora = ahora or datetime.now()
+    tabla = Cambio.__table__
+    borrados = 0
+    while True:
+        viejos = db.select([tabla.c.id]).where(tabla.c.fecha < ahora - CONSERVAR).order_by(tabla.c.id).limit(LOTE)
+        filas = db.session.execute(tabla.delete().where(tabla.c.id.in_(viejos))).rowcount
+        db.session.commit()
+        borrados += filas
+        if filas < LOTE:
+            return borrados
+
+
+def mensaje(tipo, datos, id=None):
+    lineas = ['event: {}'.format(tipo), 'data: {}'.format(json.dumps(datos, default=str))]
+    if id is not None:
+        lineas.insert(0, 'id: {}'.format(id))
+    return '\n'.join(lineas) + '\n\n'
+
+
+def _mensaje_cambio(cambio):
+    return mensaje(cambio.tipo, json.loads(cambio.datos), cambio.id)
+
+
+class Publicador:
+
+    def __init__(self, app):
+        self.app = app
+        self._clientes = set()
+        self._candado = threading.Lock()
+        self._hilo = None
+        self.ultimo = None
+
+    def __contains__(self, cola):
+        return cola in self._clientes
+
+    def suscribir(self, desde=None):
+        # Regresa (cola, mensajes atrasados). Se llama dentro de la petición: si el
+        # navegador trae Last-Event-ID se le reenvía lo que se perdió mientras reconectaba.
+        cola = queue.Queue(maxsize=COLA)
+        with self._candado:
+            if self._hilo is None:
+                # Hilo nuevo: lo que cambió mientras nadie veía ya está en la página que se
+                # acaba de cargar; se empieza desde el último cambio, no desde donde quedó
+                self.ultimo = db.session.query(db.func.max(Cambio.id)).scalar() or 0
+            hasta = self.ultimo
+            self._clientes.add(cola)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name='publicador-en-vivo', daemon=True)
+                self._hilo.start()
+
+        atrasados = []
+        if desde is not None:
+            atrasados = [_mensaje_cambio(cambio) for cambio in
+                         Cambio.query.filter(Cambio.id > desde, Cambio.id <= hasta).order_by(Cambio.id).limit(COLA)]
+        return cola, atrasados
+
+    def cancelar(self, cola):
+        with self._candado:
+            self._clientes.discard(cola)
+
+    def flujo(self, cola, atrasados):
+        # Generador de la respuesta; no toca la base
+        try:
+            yield 'retry: 3000\n\n'
+            for texto in atrasados:
+                yield texto
+            while cola in self:
+                try:
+                    yield cola.get(timeout=LATIDO)
+                except queue.Empty:
+                    yield ': latido\n\n'
+        finally:
+            self.cancelar(cola)
+
+    def repartir(self, texto, id=None):
+        # Con el candado: quien se suscriba después ya cuenta este id entre los atrasados
+        with self._candado:
+            clientes = list(self._clientes)
+            if id is not None:
+                self.ultimo = id
+        for cola in clientes:
+            try:
+                cola.put_nowait(texto)
+            except queue.Full:
+                self.cancelar(cola)
+
+    def _ciclo(self):
+        revisado = datetime.now()
+        purgado = datetime.min
+        with self.app.app_context():
+            while True:
+                with self._candado:
+                    if not self._clientes:
+                        self._hilo = None
+                        return
+                try:
+                    ahora = datetime.now()
+                    self._publicar_cambios()
+                    self._publicar_vencidas(revisado, ahora)
+                    revisado = ahora
+                    if ahora - purgado > PURGA:
+                        purgar_cambios(ahora)
+                        purgado = ahora
+                except Exception:
+                    log.exception('Error en el publicador en vivo')
+                finally:
+                    # Termina la transacción de lectura para ver lo nuevo en la siguiente vuelta
+                    db.session.remove()
+                time.sleep(INTERVALO)
+
+    def _publicar_cambios(self):
+        while True:
+            cambios = Cambio.query.filter(Cambio.id > self.ultimo).order_by(Cambio.id).limit(LOTE).all()
+            for cambio in cambios:
+                self.repartir(_mensaje_cambio(cambio), cambio.id)
+            if len(cambios) < LOTE:
+                return
+
+    def _publicar_vencidas(self, desde, hasta):
+        # Camadas cuya fecha de destete llegó desde la vuelta anterior y siguen pendientes;
+        # nadie escribió nada, así que no están en la bitácora
+        filas = db.session.query(Camada, Cruza.cepa).join(Cruza, Camada.cruza_id == Cruza.id) \
+            .filter(Camada.fecha_destete > desde, Camada.fecha_destete <= hasta,
+                    db.or_(Camada.macho_is_created == False, Camada.hembra_is_created == False))
+        for camada, cepa in filas:
+            self.repartir(mensaje('camada_vencida', datos_camada(camada, cepa)))
+
+
+publicador = Publicador(app)
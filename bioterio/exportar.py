@@ -0,0 +1,183 @@
+import csv
+import io
+import os
+import click
+from sqlalchemy import case
+from bioterio import app, db
+from bioterio.models import Cruza, Camada, Macho, Hembra, Observacion, CruzaArchivo, CamadaArchivo, MachoArchivo, \
+    HembraArchivo, ObservacionArchivo
+from bioterio.paginacion import leer_filtros
+
+TABLAS = ('cruza', 'camada', 'macho', 'hembra', 'observacion')
+TAMANO_BLOQUE = 1000
+
+
+# Modelos de cada lado de la exportación: las tablas activas y las de archivo
+ACTIVAS = {'cruza': Cruza, 'camada': Camada, 'macho': Macho, 'hembra': Hembra, 'observacion': Observacion}
+ARCHIVO = {'cruza': CruzaArchivo, 'camada': CamadaArchivo, 'macho': MachoArchivo, 'hembra': HembraArchivo,
+           'observacion': ObservacionArchivo}
+
+
+def _columnas(tabla, modelos, con_archivada):
+    # Columnas de un lado (activo o archivo) con la cepa (y la caja) ya resueltas para que
+    # el archivo se pueda analizar sin más uniones. Devuelve la consulta, las columnas y
+    # las columnas de cepa y de fecha que se usan para filtrar.
+    if tabla == 'cruza':
+        cruza = modelos['cruza']
+        columnas = [cruza.id, cruza.caja, cruza.cepa, cruza.fecha_cruza, cruza.machos, cruza.hembras,
+                    cruza.fecha_cierre]
+        q, cepa, fecha = db.session.query(*columnas), cruza.cepa, cruza.fecha_cruza
+    elif tabla == 'camada':
+        camada = modelos['camada']
+        if modelos is ACTIVAS:
+            # Una cruza no se archiva mientras tenga camadas activas
+            caja, cepa = Cruza.caja, Cruza.cepa
+            q = db.session.query().select_from(camada).join(Cruza, camada.cruza_id == Cruza.id)
+        else:
+            caja = db.func.coalesce(Cruza.caja, CruzaArchivo.caja)
+            cepa = db.func.coalesce(Cruza.cepa, CruzaArchivo.cepa)
+            q = db.session.query().select_from(camada) \
+                .outerjoin(Cruza, camada.cruza_id == Cruza.id) \
+                .outerjoin(CruzaArchivo, camada.cruza_id == CruzaArchivo.id)
+        columnas = [camada.id, camada.cruza_id, caja.label('cruza'), cepa.label('cepa'), camada.fecha_nacimiento,
+                    camada.fecha_destete, camada.machos, camada.hembras, camada.macho_is_created,
+                    camada.hembra_is_created]
+        fecha = camada.fecha_nacimiento
+    elif tabla in ('macho', 'hembra'):
+        modelo = modelos[tabla]
+        columnas = [modelo.id, modelo.caja, modelo.cepa, modelo.fecha_nacimiento, modelo.fecha_destete,
+                    modelo.cantidad, modelo.padres, modelo.cruza_id, modelo.fecha_baja]
+        q, cepa, fecha = db.session.query(*columnas), modelo.cepa, modelo.fecha_destete
+    elif tabla == 'observacion':
+        # Las observaciones se archivan junto con su caja
+        observacion, macho, hembra = modelos['observacion'], modelos['macho'], modelos['hembra']
+        cepa = db.func.coalesce(macho.cepa, hembra.cepa)
+        columnas = [observacion.id, observacion.fecha,
+                    case([(observacion.macho_id.isnot(None), 'macho')], else_='hembra').label('sexo'),
+                    db.func.coalesce(macho.caja, hembra.caja).label('caja'), cepa.label('cepa'),
+                    observacion.observacion, observacion.macho_id, observacion.hembra_id]
+        q = db.session.query().select_from(observacion) \
+            .outerjoin(macho, observacion.macho_id == macho.id) \
+            .outerjoin(hembra, observacion.hembra_id == hembra.id)
+        fecha = observacion.fecha
+    else:
+        raise ValueError('Tabla desconocida: {}'.format(tabla))
+
+    if con_archivada:
+        archivada = db.literal(None, db.DateTime) if modelos is ACTIVAS else modelos[tabla].archivada
+        columnas.append(archivada.label('archivada'))
+    return q.with_entities(*columnas), columnas, cepa, fecha
+
+
+def consulta(tabla, filtros, archivo=False):
+    # Con `archivo` se agregan las filas de las tablas *_archivo y una columna
+    # `archivada` (vacía en las filas activas). Los filtros se aplican a cada lado antes
+    # de unirlos para que cada tabla use sus índices.
+    consultas = []
+    for modelos in (ACTIVAS, ARCHIVO) if archivo else (ACTIVAS,):
+        q, columnas, cepa, fecha = _columnas(tabla, modelos, archivo)
+        if filtros['cepa']:
+            q = q.filter(cepa == filtros['cepa'])
+        if filtros['desde']:
+            q = q.filter(fecha >= filtros['desde'])
+        if filtros['hasta']:
+            q = q.filter(fecha < filtros['hasta'])
+        consultas.append((q, columnas))
+
+    q, columnas = consultas[0]
+    if len(consultas) > 1:
+        q = q.union_all(consultas[1][0])
+    return q.order_by(columnas[0]), columnas
+
+
+def bloques(tabla, filtros, tamano=TAMANO_BLOQUE, avance=None, archivo=False):
+    # Recorre la tabla con un cursor del lado del servidor y entrega listas de hasta
+    # `tamano` filas: la memoria no depende del tamaño de la tabla. `avance(filas)` se
+    # llama después de cada bloque (los trabajos en segundo plano reportan con él).
+    q, _ = consulta(tabla, filtros, archivo)
+    bloque = []
+    for fila in q.execution_options(stream_results=True).yield_per(tamano):
+        bloque.append(fila)
+        if len(bloque) >= tamano:
+            yield bloque
+            if avance:
+                avance(len(bloque))
+            bloque = []
+    if bloque:
+        yield bloque
+        if avance:
+            avance(len(bloque))
+
+
+def nombres(tabla, filtros, archivo=False):
+    _, columnas = consulta(tabla, filtros, archivo)
+    return [columna.key for columna in columnas]
+
+
+def generar_csv(tabla, filtros, tamano=TAMANO_BLOQUE, avance=None, archivo=False):
+    # Un pedazo de texto CSV por bloque, para una respuesta de Flask en partes
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(nombres(tabla, filtros, archivo))
+    for bloque in bloques(tabla, filtros, tamano, avance, archivo):
+        escritor.writerows(bloque)
+        yield salida.getvalue()
+        salida.seek(0)
+        salida.truncate()
+    if salida.getvalue():
+        yield salida.getvalue()
+
+
+def escribir_csv(tabla, filtros, destino, tamano=TAMANO_BLOQUE, avance=None, archivo=False):
+    with open(destino, 'w', newline='', encoding='utf-8') as salida:
+        for pedazo in generar_csv(tabla, filtros, tamano, avance, archivo):
+            salida.write(pedazo)
+
+
+def escribir_parquet(tabla, filtros, destino, tamano=TAMANO_BLOQUE, avance=None, archivo=False):
+    # Archivo columnar con un row group por bloque. pyarrow es opcional: sólo se
+    # necesita para este formato.
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise click.ClickException('Para exportar en formato parquet instale pyarrow (pip install pyarrow)')
+
+    _, columnas = consulta(tabla, filtros, archivo)
+    tipos = []
+    for columna in columnas:
+        if isinstance(columna.type, db.DateTime):
+            tipos.append(pa.timestamp('us'))
+        elif isinstance(columna.type, db.Boolean):
+            tipos.append(pa.bool_())
+        elif isinstance(columna.type, db.Integer):
+            tipos.append(pa.int64())
+        else:
+            tipos.append(pa.string())
+    esquema = pa.schema([(columna.key, tipo) for columna, tipo in zip(columnas, tipos)])
+
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for bloque in bloques(tabla, filtros, tamano, avance, archivo):
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array([fila[i] for fila in bloque], type=tipo) for i, tipo in enumerate(tipos)],
+                schema=esquema))
+
+
+@app.cli.command('exportar')
+@click.argument('directorio', type=click.Path(file_okay=False))
+@click.option('--tabla', 'tablas', multiple=True, type=click.Choice(TABLAS),
+              help='Tabla a exportar (se puede repetir); por omisión todas')
+@click.option('--formato', type=click.Choice(['parquet', 'csv']), default='parquet')
+@click.option('--cepa')
+@click.option('--desde', help='Fecha inicial yyyy-mm-dd')
+@click.option('--hasta', help='Fecha final yyyy-mm-dd')
+@click.option('--archivo', is_flag=True, help='Incluir también las filas archivadas')
+def exportar_command(directorio, tablas, formato, cepa, desde, hasta, archivo):
+    """Exporta la colonia completa, un archivo por tabla."""
+    filtros = leer_filtros({'cepa': cepa, 'desde': desde, 'hasta': hasta})
+    escribir = escribir_parquet if formato == 'parquet' else escribir_csv
+    os.makedirs(directorio, exist_ok=True)
+    for tabla in tablas or TABLAS:
+        destino = os.path.join(directorio, '{}.{}'.format(tabla, formato))
+        escribir(tabla, filtros, destino, archivo=archivo)
+        click.echo(destino)
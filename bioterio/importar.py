@@ -0,0 +1,211 @@
+import codecs
+import csv
+import json
+from datetime import datetime
+import click
+from dateutil.relativedelta import relativedelta
+from bioterio import app, db
+from bioterio.models import Cruza, Camada, Macho, Hembra, Caja
+from bioterio.cajas import verificar_caja, apartar_caja, apartar_cajas
+from bioterio.cepas import cepas, edad_destete
+
+TIPOS = ('cruza', 'camada', 'macho', 'hembra')
+TAMANO_LOTE = 500
+
+
+class ErrorFila(Exception):
+    pass
+
+
+class Importacion:
+    # Importa un archivo de un solo tipo de registro. Las cajas en uso y las cruzas se
+    # leen una sola vez al inicio; cada fila se valida contra esos conjuntos en memoria
+    # y se inserta en lotes de `tamano_lote` filas por transacción. Una fila con error
+    # se reporta y se salta, sin detener el resto del archivo. Las cajas nuevas se
+    # apartan al guardar, lote por lote (apartar_cajas), con el candado de escritura
+    # tomado: el conjunto en memoria no ve lo que se registró o reservó después de leerlo.
+
+    def __init__(self, tipo, tamano_lote=TAMANO_LOTE, usuario_id=None):
+        if tipo not in TIPOS:
+            raise ValueError('Tipo de registro desconocido: {}'.format(tipo))
+        self.tipo = tipo
+        self.tamano_lote = tamano_lote
+        self.usuario_id = usuario_id
+        self.insertados = 0
+        self.errores = []
+        self.cajas = {caja for (caja,) in db.session.query(Caja.caja)}
+        # Si hay varias cruzas con la misma caja se usa la más reciente
+        self.cruzas = {caja: (id, cepa) for id, caja, cepa in
+                       db.session.query(Cruza.id, Cruza.caja, Cruza.cepa).order_by(Cruza.fecha_cruza)}
+
+    def registro(self, numero, fila):
+        # El registro (sin guardar) de una fila, o None si no es válida; el error queda en self.errores
+        try:
+            if isinstance(fila, ErrorFila):
+                raise fila
+            return getattr(self, '_' + self.tipo)(fila)
+        except ErrorFila as e:
+            self.errores.append((numero, str(e)))
+        except KeyError as e:
+            self.errores.append((numero, 'Falta el campo {}'.format(e.args[0])))
+        except (ValueError, TypeError, AttributeError) as e:
+            self.errores.append((numero, 'Valor faltante o inválido: {}'.format(e)))
+        return None
+
+    def importar(self, filas):
+        lote = []
+        for numero, fila in filas:
+            registro = self.registro(numero, fila)
+            if registro is not None:
+                lote.append((numero, registro))
+
+            if len(lote) >= self.tamano_lote:
+                self._guardar(lote)
+                lote = []
+        if lote:
+            self._guardar(lote)
+        return self
+
+    def apartar(self, registro):
+        # Para el reintento fila por fila, dentro de su transacción; ErrorFila (y rollback)
+        # si la caja ya se registró o alguien más la tiene reservada
+        caja = getattr(registro, 'caja', None)
+        if caja is not None and not apartar_caja(caja, self.usuario_id):
+            raise ErrorFila('La caja {} ya existe o está reservada'.format(caja))
+
+    def _guardar(self, lote):
+        try:
+            # El DELETE de apartar_cajas toma el candado de escritura; las filas cuya caja
+            # ya se registró o reservó desde que se leyó self.cajas se reportan y se quitan
+            tomadas = apartar_cajas([registro.caja for _, registro in lote if getattr(registro, 'caja', None)],
+                                    self.usuario_id)
+            if tomadas:
+                for numero, registro in lote:
+                    if getattr(registro, 'caja', None) in tomadas:
+                        self.errores.append((numero, 'La caja {} ya existe o está reservada'.format(registro.caja)))
+                lote = [(numero, registro) for numero, registro in lote
+                        if getattr(registro, 'caja', None) not in tomadas]
+            db.session.add_all([registro for _, registro in lote])
+            db.session.commit()
+            self.insertados += len(lote)
+        except Exception:
+            # Si falla el lote completo se reintenta fila por fila para aislar la que falló
+            db.session.rollback()
+            for numero, registro in lote:
+                try:
+                    self.apartar(registro)
+                    db.session.add(registro)
+                    db.session.commit()
+                    self.insertados += 1
+                except Exception as e:
+                    db.session.rollback()
+                    self.errores.append((numero, str(e)))
+
+    def _caja_nueva(self, caja, cepa):
+        if not verificar_caja(caja, cepa):
+            raise ErrorFila('La caja {} no coincide con la cepa {}'.format(caja, cepa))
+        if caja in self.cajas:
+            raise ErrorFila('La caja {} ya existe'.format(caja))
+        self.cajas.add(caja)
+
+    def _cruza_de(self, caja):
+        if caja not in self.cruzas:
+            raise ErrorFila('No existe la cruza {}'.format(caja))
+        return self.cruzas[caja]
+
+    def _cruza(self, fila):
+        caja = fila['caja'].strip().upper()
+        cepa = fila['cepa'].strip()
+        if cepa not in cepas():
+            raise ErrorFila('Cepa desconocida: {}'.format(cepa))
+        self._caja_nueva(caja, cepa)
+        return Cruza(caja=caja, cepa=cepa, fecha_cruza=valor_fecha(fila['fecha_cruza']),
+                     machos=valor_entero(fila.get('machos')), hembras=valor_entero(fila.get('hembras')))
+
+    def _camada(self, fila):
+        cruza_id, cepa = self._cruza_de(fila['cruza'].strip().upper())
+        fecha_nacimiento = valor_fecha(fila['fecha_nacimiento'])
+        if fila.get('fecha_destete'):
+            fecha_destete = valor_fecha(fila['fecha_destete'])
+        else:
+            fecha_destete = fecha_nacimiento + relativedelta(days=+edad_destete(cepa))
+        return Camada(fecha_nacimiento=fecha_nacimiento, fecha_destete=fecha_destete,
+                      machos=valor_entero(fila.get('machos')), hembras=valor_entero(fila.get('hembras')),
+                      macho_is_created=valor_booleano(fila.get('macho_is_created')),
+                      hembra_is_created=valor_booleano(fila.get('hembra_is_created')),
+                      cruza_id=cruza_id)
+
+    def _destetados(self, modelo, fila):
+        caja = fila['caja'].strip().upper()
+        padres = fila['padres'].strip().upper()
+        cruza_id, cepa = self._cruza_de(padres)
+        self._caja_nueva(caja, cepa)
+        return modelo(caja=caja, cepa=cepa, padres=padres, cruza_id=cruza_id,
+                      fecha_nacimiento=valor_fecha(fila['fecha_nacimiento']),
+                      fecha_destete=valor_fecha(fila['fecha_destete']),
+                      cantidad=valor_entero(fila.get('cantidad')))
+
+    def _macho(self, fila):
+        return self._destetados(Macho, fila)
+
+    def _hembra(self, fila):
+        return self._destetados(Hembra, fila)
+
+
+def valor_fecha(valor):
+    # AAAA-MM-DD, o con hora como las regresa la API (AAAA-MM-DDTHH:MM:SS)
+    return datetime.fromisoformat(valor.strip())
+
+
+def valor_entero(valor):
+    if valor is None or str(valor).strip() == '':
+        return 0
+    numero = int(valor)
+    if numero < 0:
+        raise ErrorFila('Número negativo: {}'.format(numero))
+    return numero
+
+
+def valor_booleano(valor):
+    return str(valor).strip().lower() in ('1', 'true', 'si', 'sí')
+
+
+def leer_filas(texto, formato):
+    # Genera (número de fila, dict o ErrorFila) sin cargar el archivo completo en memoria.
+    # 'csv' con encabezados, 'json' con un objeto por línea (JSON Lines).
+    if formato == 'csv':
+        lector = csv.DictReader(texto)
+        for fila in lector:
+            yield lector.line_num, fila
+    elif formato == 'json':
+        for numero, linea in enumerate(texto, start=1):
+            if linea.strip():
+                # Una línea que no es un objeto se entrega como ErrorFila para reportarla tal cual
+                try:
+                    fila = json.loads(linea)
+                except json.JSONDecodeError as e:
+                    fila = ErrorFila('JSON inválido: {} (columna {})'.format(e.msg, e.colno))
+                else:
+                    if not isinstance(fila, dict):
+                        fila = ErrorFila('Se esperaba un objeto JSON, no {}'.format(type(fila).__name__))
+                yield numero, fila
+    else:
+        raise ValueError('Formato desconocido: {}'.format(formato))
+
+
+def importar_archivo(binario, tipo, formato, tamano_lote=TAMANO_LOTE, usuario_id=None):
+    texto = codecs.getreader('utf-8-sig')(binario)
+    return Importacion(tipo, tamano_lote, usuario_id).importar(leer_filas(texto, formato))
+
+
+@app.cli.command('importar')
+@click.argument('tipo', type=click.Choice(TIPOS))
+@click.argument('archivo', type=click.File('rb'))
+@click.option('--formato', type=click.Choice(['csv', 'json']), default='csv')
+@click.option('--lote', default=TAMANO_LOTE, help='Filas por transacción')
+def importar_command(tipo, archivo, formato, lote):
+    """Importa cruzas, camadas, machos o hembras desde un archivo CSV o JSON Lines."""
+    resultado = importar_archivo(archivo, tipo, formato, lote)
+    for numero, error in resultado.errores:
+        click.echo('Fila {}: {}'.format(numero, error), err=True)
+    click.echo('{} registros importados, {} con error'.format(resultado.insertados, len(resultado.errores)))
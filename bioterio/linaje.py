@@ -0,0 +1,127 @@
+from bioterio import db
+from bioterio.models import Macho, Hembra, Progenitor
+
+GENERACIONES = 3
+MAXIMO_GENERACIONES = 10
+
+# El árbol se recorre caja -> cruza -> caja: una caja destetada viene de la cruza
+# Macho/Hembra.cruza_id, y los reproductores de esa cruza son las cajas enlazadas en
+# progenitor. Cada consulta recorre todas las generaciones pedidas en un solo viaje a
+# la base con un CTE recursivo; UNION (no UNION ALL) quita las cajas repetidas por
+# endogamia dentro de la misma generación y el tope de generaciones asegura que
+# termine aunque haya un ciclo por un error de captura. Las cajas archivadas
+# (bioterio.archivo) conservan su id, así que cada caja se busca en la tabla activa y
+# en la de archivo de su sexo.
+_BUSCAR_CAJA = """
+    LEFT JOIN macho m ON {r}.sexo = 'macho' AND m.id = {r}.caja_id
+    LEFT JOIN macho_archivo ma ON {r}.sexo = 'macho' AND ma.id = {r}.caja_id
+    LEFT JOIN hembra h ON {r}.sexo = 'hembra' AND h.id = {r}.caja_id
+    LEFT JOIN hembra_archivo ha ON {r}.sexo = 'hembra' AND ha.id = {r}.caja_id
+"""
+
+
+def _de_caja(columna):
+    return 'COALESCE(m.{0}, ma.{0}, h.{0}, ha.{0})'.format(columna)
+
+
+_CAJA = """
+    SELECT r.generacion, r.sexo, r.caja_id AS id,
+           {caja} AS caja, {cepa} AS cepa, {fecha_nacimiento} AS fecha_nacimiento,
+           {cruza_id} AS cruza_id, COALESCE(m.id, h.id) IS NULL AS archivada
+    FROM {{cte}} r
+    {buscar}
+    WHERE {id} IS NOT NULL
+    ORDER BY r.generacion, r.sexo DESC, caja
+""".format(buscar=_BUSCAR_CAJA.format(r='r'), caja=_de_caja('caja'), cepa=_de_caja('cepa'),
+           fecha_nacimiento=_de_caja('fecha_nacimiento'), cruza_id=_de_caja('cruza_id'), id=_de_caja('id'))
+
+_ANCESTROS = """
+    WITH RECURSIVE ancestros(sexo, caja_id, generacion) AS (
+        SELECT p.sexo, p.caja_id, 1
+        FROM progenitor p
+        WHERE p.cruza_id = :cruza_id
+        UNION
+        SELECT p.sexo, p.caja_id, a.generacion + 1
+        FROM ancestros a
+        {buscar}
+        JOIN progenitor p ON p.cruza_id = {cruza_id}
+        WHERE a.generacion < :generaciones
+    )
+""".format(buscar=_BUSCAR_CAJA.format(r='a'), cruza_id=_de_caja('cruza_id')) + _CAJA.format(cte='ancestros')
+
+# Las hijas de una cruza pueden estar en macho o en hembra, activas o archivadas;
+# cruzar con `fuentes` permite buscarlas en las cuatro tablas por su índice de
+# cruza_id en un solo paso recursivo.
+_DESCENDIENTES = """
+    WITH RECURSIVE fuentes(sexo, archivo) AS (VALUES ('macho', 0), ('macho', 1), ('hembra', 0), ('hembra', 1)),
+    descendientes(sexo, caja_id, generacion) AS (
+        SELECT :sexo, :caja_id, 0
+        UNION
+        SELECT s.sexo, {id}, d.generacion + 1
+        FROM descendientes d
+        JOIN progenitor p ON p.sexo = d.sexo AND p.caja_id = d.caja_id
+        CROSS JOIN fuentes s
+        LEFT JOIN macho m ON s.sexo = 'macho' AND s.archivo = 0 AND m.cruza_id = p.cruza_id
+        LEFT JOIN macho_archivo ma ON s.sexo = 'macho' AND s.archivo = 1 AND ma.cruza_id = p.cruza_id
+        LEFT JOIN hembra h ON s.sexo = 'hembra' AND s.archivo = 0 AND h.cruza_id = p.cruza_id
+        LEFT JOIN hembra_archivo ha ON s.sexo = 'hembra' AND s.archivo = 1 AND ha.cruza_id = p.cruza_id
+        WHERE d.generacion < :generaciones AND {id} IS NOT NULL
+    )
+""".format(id=_de_caja('id')) + _CAJA.format(cte='(SELECT * FROM descendientes WHERE generacion > 0)')
+
+MODELOS = {'macho': Macho, 'hembra': Hembra}
+
+
+def _consulta(sql):
+    # Con el tipo declarado la fecha llega como datetime y no como el texto de SQLite
+    return db.text(sql).columns(fecha_nacimiento=db.DateTime)
+
+
+def ancestros(caja, generaciones=GENERACIONES):
+    # Cajas de las que descienden los animales de `caja`, de padres (1) a bisabuelos (3), etc.
+    return [dict(fila) for fila in db.session.execute(_consulta(_ANCESTROS), {
+        'cruza_id': caja.cruza_id, 'generaciones': generaciones})]
+
+
+def descendientes(sexo, caja, generaciones=GENERACIONES):
+    # Cajas destetadas de cruzas en las que participaron animales de `caja`, y así hacia abajo
+    return [dict(fila) for fila in db.session.execute(_consulta(_DESCENDIENTES), {
+        'sexo': sexo, 'caja_id': caja.id, 'generaciones': generaciones})]
+
+
+def leer_cajas(texto):
+    # 'a3, A5 ' -> ['A3', 'A5']
+    return [caja.strip().upper() for caja in (texto or '').split(',') if caja.strip()]
+
+
+def enlazar_progenitores(cruza, cajas_machos, cajas_hembras):
+    # Reemplaza los progenitores de la cruza por las cajas indicadas (nombres). No hace
+    # commit; lanza ValueError si alguna caja no existe.
+    enlaces = []
+    for sexo, cajas in (('macho', cajas_machos), ('hembra', cajas_hembras)):
+        if not cajas:
+            continue
+        modelo = MODELOS[sexo]
+        ids = dict(db.session.query(modelo.caja, modelo.id).filter(modelo.caja.in_(cajas)))
+        faltan = [caja for caja in cajas if caja not in ids]
+        if faltan:
+            raise ValueError('No existen cajas de {} con el nombre {}'.format(sexo, ', '.join(faltan)))
+        enlaces.extend(Progenitor(sexo=sexo, caja_id=ids[caja]) for caja in dict.fromkeys(cajas))
+    cruza.progenitores = enlaces
+
+
+def olvidar_caja(sexo, caja_id):
+    # Quita los enlaces de pedigrí de una caja que se va a borrar; sin esto quedarían
+    # apuntando a un id que SQLite puede volver a asignar a otra caja. No hace commit.
+    Progenitor.query.filter_by(sexo=sexo, caja_id=caja_id).delete(synchronize_session=False)
+
+
+def nombres_progenitores(cruza):
+    # {'macho': 'A3, A5', 'hembra': 'A4'} para volver a llenar el formulario de la cruza
+    nombres = {}
+    for sexo, modelo in MODELOS.items():
+        cajas = db.session.query(modelo.caja).join(
+            Progenitor, db.and_(Progenitor.sexo == sexo, Progenitor.caja_id == modelo.id)) \
+            .filter(Progenitor.cruza_id == cruza.id).order_by(modelo.caja)
+        nombres[sexo] = ', '.join(caja for caja, in cajas)
+    return nombres
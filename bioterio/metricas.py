@@ -0,0 +1,162 @@
+import cProfile
+import heapq
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Cuántas peticiones recientes se guardan por endpoint y cuántas consultas lentas
+VENTANA = 500
+LENTAS = 5
+# Límites (ms) de las cubetas del histograma de latencia; la última es "más de 2000"
+CUBETAS = (5, 10, 25, 50, 100, 250, 500, 1000, 2000)
+
+
+def _percentil(ordenados, p):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100.0 * (len(ordenados) - 1))))]
+
+
+class Histograma:
+    # Ventana móvil por endpoint de las últimas VENTANA peticiones: latencia total,
+    # consultas, tiempo en SQL y en plantillas, más las consultas más lentas vistas.
+    # Es memoria del proceso; cada worker de gunicorn lleva la suya.
+
+    def __init__(self, ventana=VENTANA, lentas=LENTAS):
+        self.ventana = ventana
+        self.lentas = lentas
+        self._muestras = defaultdict(lambda: deque(maxlen=self.ventana))
+        self._lentas = defaultdict(list)
+        self._totales = defaultdict(int)
+        self._candado = threading.Lock()
+
+    def registrar(self, endpoint, latencia, consultas, sql, plantillas, lentas=()):
+        with self._candado:
+            self._muestras[endpoint].append((latencia, consultas, sql, plantillas))
+            self._totales[endpoint] += 1
+            peores = self._lentas[endpoint]
+            for consulta in lentas:
+                if len(peores) < self.lentas:
+                    heapq.heappush(peores, consulta)
+                elif consulta > peores[0]:
+                    heapq.heapreplace(peores, consulta)
+
+    def limpiar(self):
+        with self._candado:
+            self._muestras.clear()
+            self._lentas.clear()
+            self._totales.clear()
+
+    def resumen(self):
+        # {endpoint: {...}} con percentiles de latencia, promedios y las cubetas
+        with self._candado:
+            copia = {endpoint: (list(muestras), sorted(self._lentas[endpoint], reverse=True),
+                                self._totales[endpoint])
+                     for endpoint, muestras in self._muestras.items()}
+
+        resultado = {}
+        for endpoint, (muestras, lentas, total) in sorted(copia.items()):
+            latencias = sorted(muestra[0] for muestra in muestras)
+            cubetas = [0] * (len(CUBETAS) + 1)
+            for latencia in latencias:
+                cubetas[next((i for i, limite in enumerate(CUBETAS) if latencia <= limite), len(CUBETAS))] += 1
+            n = len(muestras)
+            resultado[endpoint] = {
+                'peticiones': total,
+                'ventana': n,
+                'p50_ms': _percentil(latencias, 50),
+                'p90_ms': _percentil(latencias, 90),
+                'p99_ms': _percentil(latencias, 99),
+                'maximo_ms': latencias[-1],
+                'consultas': sum(muestra[1] for muestra in muestras) / n,
+                'consultas_maximo': max(muestra[1] for muestra in muestras),
+                'sql_ms': sum(muestra[2] for muestra in muestras) / n,
+                'plantillas_ms': sum(muestra[3] for muestra in muestras) / n,
+                'cubetas': cubetas,
+                'lentas': [{'ms': ms, 'sql': sql} for ms, sql in lentas],
+            }
+        return resultado
+
+
+histograma = Histograma()
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'metricas' in g:
+        context._metricas_inicio = time.perf_counter()
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, '_metricas_inicio', None)
+    if inicio is None or not has_request_context() or 'metricas' not in g:
+        return
+    ms = (time.perf_counter() - inicio) * 1000
+    metricas = g.metricas
+    metricas['consultas'] += 1
+    metricas['sql'] += ms
+    lentas = metricas['lentas']
+    if len(lentas) < LENTAS:
+        heapq.heappush(lentas, (ms, statement))
+    elif ms > lentas[0][0]:
+        heapq.heapreplace(lentas, (ms, statement))
+
+
+def _antes_de_plantilla(app, template, context):
+    if 'metricas' in g:
+        g.metricas['plantilla_inicio'] = time.perf_counter()
+
+
+def _plantilla_lista(app, template, context):
+    if 'metricas' in g and g.metricas.get('plantilla_inicio') is not None:
+        g.metricas['plantillas'] += (time.perf_counter() - g.metricas.pop('plantilla_inicio')) * 1000
+
+
+def configurar(app):
+    # Lee PERFIL_UMBRAL_MS (None lo apaga) y PERFIL_DIRECTORIO. Con un umbral, cada
+    # petición corre bajo cProfile y las que lo rebasen dejan un .prof para abrir
+    # con pstats o snakeviz.
+    app.config.setdefault('PERFIL_UMBRAL_MS', None)
+    app.config.setdefault('PERFIL_DIRECTORIO', os.path.join(app.instance_path, 'perfiles'))
+
+    event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+    event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+    before_render_template.connect(_antes_de_plantilla, app)
+    template_rendered.connect(_plantilla_lista, app)
+
+    @app.before_request
+    def _iniciar():
+        g.metricas = {'inicio': time.perf_counter(), 'consultas': 0, 'sql': 0.0, 'plantillas': 0.0,
+                      'lentas': [], 'perfil': None}
+        if app.config['PERFIL_UMBRAL_MS'] is not None:
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+                g.metricas['perfil'] = perfil
+            except ValueError:
+                # Ya hay otro perfilador activo en este hilo
+                pass
+
+    @app.teardown_request
+    def _terminar(error=None):
+        metricas = g.pop('metricas', None)
+        if metricas is None or request.endpoint in (None, 'static'):
+            return
+        latencia = (time.perf_counter() - metricas['inicio']) * 1000
+        perfil = metricas['perfil']
+        if perfil is not None:
+            perfil.disable()
+            if latencia >= app.config['PERFIL_UMBRAL_MS']:
+                _guardar_perfil(perfil, app.config['PERFIL_DIRECTORIO'], request.endpoint, latencia)
+        histograma.registrar(request.endpoint, latencia, metricas['consultas'], metricas['sql'],
+                             metricas['plantillas'], metricas['lentas'])
+
+
+def _guardar_perfil(perfil, directorio, endpoint, latencia):
+    os.makedirs(directorio, exist_ok=True)
+    nombre = '{}-{}-{:.0f}ms.prof'.format(endpoint, datetime.now().strftime('%Y%m%d-%H%M%S-%f'), latencia)
+    perfil.dump_stats(os.path.join(directorio, nombre))
@@ -1,8 +1,12 @@
+import hashlib
+import json
+import re
 from bioterio import db, login_manager
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
+from datetime import datetime, timedelta
+from sqlalchemy import event, inspect
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from bioterio.cache import CacheTTL
 # By inheriting the UserMixin we get access to a lot of built-in attributes
 # which we will be able to call in our views!
 # is_authenticated()
@@ -11,11 +15,45 @@ from flask_login import UserMixin
 # get_id()
 
 
+# Users already loaded by a previous request, so that a logged-in page view
+# does not need to query the users table again.
+usuarios_cache = CacheTTL(maximo=256, ttl=300)
+# Credenciales de HTTP Basic ya verificadas (hash de correo y contraseña -> id), para
+# que los scripts que usan la API no paguen el hash de la contraseña en cada petición.
+credenciales_cache = CacheTTL(maximo=256, ttl=300)
+
+
 # The user_loader decorator allows flask-login to load the current user
 # and grab their id.
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    user_id = int(user_id)
+    user = usuarios_cache.obtener(user_id)
+    if user is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            # Detach it so later commits in other requests don't expire it
+            db.session.expunge(user)
+            usuarios_cache.guardar(user_id, user)
+    return user
+
+
+# Los clientes de la API (bioterio.api) se identifican con HTTP Basic en cada petición
+@login_manager.request_loader
+def load_user_from_request(request):
+    credenciales = request.authorization
+    if credenciales is None or not credenciales.username or credenciales.password is None:
+        return None
+    llave = hashlib.sha256('{}\0{}'.format(credenciales.username, credenciales.password)
+                           .encode('utf-8')).hexdigest()
+    user_id = credenciales_cache.obtener(llave)
+    if user_id is None:
+        user = User.query.filter_by(email=credenciales.username).first()
+        if user is None or not user.check_password(credenciales.password):
+            return None
+        user_id = user.id
+        credenciales_cache.guardar(llave, user_id)
+    return load_user(user_id)
 
 
 class User(db.Model, UserMixin):
@@ -35,20 +73,67 @@ class User(db.Model, UserMixin):
         return check_password_hash(self.password_hash, password)
 
 
+# Forget the cached user when its password changes or it is deleted
+def _invalidar_usuario(mapper, connection, target):
+    usuarios_cache.quitar(target.id)
+    credenciales_cache.limpiar()
+
+
+event.listen(User, 'after_update', _invalidar_usuario)
+event.listen(User, 'after_delete', _invalidar_usuario)
+
+
+# Días de nacida a los que se desteta si la cepa no dice otra cosa
+EDAD_DESTETE = 28
+
+
+# Valores por omisión de las fechas, calculados en cada INSERT y no una sola vez al
+# importar el módulo (un worker que lleva días arriba pondría fechas viejas). Se
+# derivan de la otra fecha de la misma fila cuando viene.
+def _destete_por_omision(context):
+    nacimiento = context.get_current_parameters().get('fecha_nacimiento')
+    return (nacimiento or datetime.now()) + timedelta(days=EDAD_DESTETE)
+
+
+def _nacimiento_por_omision(context):
+    destete = context.get_current_parameters().get('fecha_destete')
+    return (destete or datetime.now()) - timedelta(days=EDAD_DESTETE)
+
+
+class Cepa(db.Model):
+    # Cepas del bioterio: el prefijo con el que empiezan los nombres de sus cajas y los
+    # días de nacida a los que se desteta. Se consultan a través de bioterio.cepas,
+    # que las guarda en memoria.
+    __tablename__ = 'cepa'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(20), nullable=False, unique=True)
+    prefijo = db.Column(db.String(5), nullable=False, unique=True)
+    edad_destete = db.Column(db.Integer, default=EDAD_DESTETE, nullable=False)
+
+    def __repr__(self):
+        return '<Cepa %r>' % self.nombre
+
+
 class Cruza(db.Model):
     __tablename__ = 'cruza'
-    __table_args__ = {'extend_existing': True}
+    # AUTOINCREMENT en las tablas que se archivan: un id que ya está en *_archivo (o al
+    # que apunta un Progenitor) no se le vuelve a dar a otra fila aunque se borre la última
+    __table_args__ = (db.Index('ix_cruza_fecha_cruza', 'fecha_cruza'), {'sqlite_autoincrement': True})
 
-    db.Model.metadata.reflect(db.engine)
     id = db.Column(db.Integer, primary_key=True)
     caja = db.Column(db.String(20), nullable=False)
     cepa = db.Column(db.String(20), nullable=False)
     fecha_cruza = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     machos = db.Column(db.Integer, default=0)
     hembras = db.Column(db.Integer, default=0)
+    # Una cruza cerrada ya no se muestra ni se cuenta; `flask archivar` la mueve a
+    # cruza_archivo cuando ya no le quedan camadas ni cajas activas
+    fecha_cierre = db.Column(db.DateTime)
     camadas = db.relationship('Camada', backref='cruza', lazy=True)
     macho = db.relationship('Macho', backref='cruza', lazy=True)
     hembra = db.relationship('Hembra', backref='cruza', lazy=True)
+    progenitores = db.relationship('Progenitor', cascade='all, delete-orphan', backref='cruza', lazy=True)
 
     def __repr__(self):
         return '<Cruza %r>' % self.id
@@ -56,17 +141,19 @@ class Cruza(db.Model):
 
 class Camada(db.Model):
     __tablename__ = 'camada'
-    __table_args__ = {'extend_existing': True}
+    # Para el visor de destetes pendientes
+    __table_args__ = (db.Index('ix_camada_destete_pendiente', 'fecha_destete', 'macho_is_created',
+                               'hembra_is_created'),
+                      {'sqlite_autoincrement': True})
 
-    db.Model.metadata.reflect(db.engine)
     id = db.Column(db.Integer, primary_key=True)
     fecha_nacimiento = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    fecha_destete = db.Column(db.DateTime, default=datetime.today() + relativedelta(days=+28), nullable=False)
+    fecha_destete = db.Column(db.DateTime, default=_destete_por_omision, nullable=False)
     machos = db.Column(db.Integer, default=0, nullable=False)
     hembras = db.Column(db.Integer, default=0, nullable=False)
     macho_is_created = db.Column(db.Boolean, default=False, nullable=False)
     hembra_is_created = db.Column(db.Boolean, default=False, nullable=False)
-    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), nullable=False)
+    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), nullable=False, index=True)
 
     def __repr__(self):
         return '<Camada %r>' % self.id
@@ -74,17 +161,21 @@ class Camada(db.Model):
 
 class Macho(db.Model):
     __tablename__ = 'macho'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (db.Index('ix_macho_cepa_fecha_destete', 'cepa', 'fecha_destete'),
+                      db.Index('ix_macho_cepa_fecha_nacimiento', 'cepa', 'fecha_nacimiento', 'cantidad'),
+                      {'sqlite_autoincrement': True})
 
-    db.Model.metadata.reflect(db.engine)
     id = db.Column(db.Integer, primary_key=True)
     caja = db.Column(db.String(20), nullable=False)
     cepa = db.Column(db.String(20), nullable=False)
-    fecha_nacimiento = db.Column(db.DateTime, default=datetime.today() + relativedelta(days=-28), nullable=False)
+    fecha_nacimiento = db.Column(db.DateTime, default=_nacimiento_por_omision, nullable=False)
     fecha_destete = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     cantidad = db.Column(db.Integer, default=0, nullable=False)
     padres = db.Column(db.String(20), nullable=False)
-    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), nullable=False)
+    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), nullable=False, index=True)
+    # Caja retirada: deja los tableros y los contadores; `flask archivar` la mueve a
+    # macho_archivo con sus observaciones
+    fecha_baja = db.Column(db.DateTime)
     observacion = db.relationship('Observacion', cascade="all", backref='macho', lazy=True)
 
     def __repr__(self):
@@ -93,17 +184,19 @@ class Macho(db.Model):
 
 class Hembra(db.Model):
     __tablename__ = 'hembra'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (db.Index('ix_hembra_cepa_fecha_destete', 'cepa', 'fecha_destete'),
+                      db.Index('ix_hembra_cepa_fecha_nacimiento', 'cepa', 'fecha_nacimiento', 'cantidad'),
+                      {'sqlite_autoincrement': True})
 
-    db.Model.metadata.reflect(db.engine)
     id = db.Column(db.Integer, primary_key=True)
     caja = db.Column(db.String(20), nullable=False)
     cepa = db.Column(db.String(20), nullable=False)
-    fecha_nacimiento = db.Column(db.DateTime, default=datetime.today() + relativedelta(days=-28), nullable=False)
+    fecha_nacimiento = db.Column(db.DateTime, default=_nacimiento_por_omision, nullable=False)
     fecha_destete = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     cantidad = db.Column(db.Integer, default=0, nullable=False)
     padres = db.Column(db.String(20), nullable=False)
-    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), nullable=False)
+    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), nullable=False, index=True)
+    fecha_baja = db.Column(db.DateTime)
     observacion = db.relationship('Observacion', cascade="all", backref='hembra', lazy=True)
 
     def __repr__(self):
@@ -112,9 +205,8 @@ class Hembra(db.Model):
 
 class Observacion(db.Model):
     __tablename__ = 'observacion'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = {'sqlite_autoincrement': True}
 
-    db.Model.metadata.reflect(db.engine)
     id = db.Column(db.Integer, primary_key=True)
     observacion = db.Column(db.Text, nullable=False)
     fecha = db.Column(db.DateTime, default=datetime.now, nullable=False)
@@ -123,3 +215,462 @@ class Observacion(db.Model):
 
     def __repr__(self):
         return '<Observacion %r>' % self.id
+
+
+class Caja(db.Model):
+    # Registro de todos los nombres de caja en uso (cruzas, machos y hembras)
+    # para no tener que recorrer las tres tablas cada vez que se busca o se
+    # asigna una caja. Se mantiene con los eventos de abajo.
+    __tablename__ = 'caja'
+    __table_args__ = (db.Index('ix_caja_letra_numero', 'letra', 'numero'),
+                      db.Index('ix_caja_tabla_registro', 'tabla', 'registro_id'))
+
+    id = db.Column(db.Integer, primary_key=True)
+    caja = db.Column(db.String(20), nullable=False, index=True)
+    letra = db.Column(db.String(5), nullable=False)
+    numero = db.Column(db.Integer)
+    tabla = db.Column(db.String(10), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return '<Caja %r>' % self.caja
+
+
+class ReservaCaja(db.Model):
+    # Nombres de caja apartados mientras alguien llena el formulario de destete, para
+    # que dos personas destetando a la vez no reciban la misma caja. La restricción
+    # UNIQUE en caja es la que garantiza que un nombre sólo se entregue una vez.
+    __tablename__ = 'reserva_caja'
+    __table_args__ = (db.Index('ix_reserva_caja_letra_numero', 'letra', 'numero'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    caja = db.Column(db.String(20), nullable=False, unique=True)
+    letra = db.Column(db.String(5), nullable=False)
+    numero = db.Column(db.Integer, nullable=False)
+    expira = db.Column(db.DateTime, nullable=False, index=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    destino = db.Column(db.String(30))
+
+    def __repr__(self):
+        return '<ReservaCaja %r>' % self.caja
+
+
+class Progenitor(db.Model):
+    # Enlaza una cruza con las cajas destetadas (macho u hembra) de las que salieron
+    # sus reproductores. Junto con Macho.cruza_id / Hembra.cruza_id forma el árbol
+    # genealógico que recorre bioterio.linaje.
+    __tablename__ = 'progenitor'
+    __table_args__ = (db.Index('ix_progenitor_sexo_caja', 'sexo', 'caja_id'),)
+
+    cruza_id = db.Column(db.Integer, db.ForeignKey('cruza.id'), primary_key=True)
+    sexo = db.Column(db.String(6), primary_key=True)
+    caja_id = db.Column(db.Integer, primary_key=True)
+
+    def __repr__(self):
+        return '<Progenitor %r %s %r>' % (self.cruza_id, self.sexo, self.caja_id)
+
+
+_NOMBRE_CAJA = re.compile(r'([^\W\d_]+)(\d+)$')
+
+
+def separar_caja(caja):
+    # 'A12' -> ('A', 12), 'RG3' -> ('RG', 3); las cajas que no son prefijo y número no
+    # cuentan para calcular la siguiente caja libre
+    partes = _NOMBRE_CAJA.match(caja)
+    if partes is None:
+        return caja[:1], None
+    return partes.group(1), int(partes.group(2))
+
+
+def _registrar_caja(mapper, connection, target):
+    letra, numero = separar_caja(target.caja)
+    connection.execute(Caja.__table__.insert().values(caja=target.caja, letra=letra, numero=numero,
+                                                      tabla=target.__tablename__, registro_id=target.id))
+    # La caja ya está en uso, su reserva (si la había) ya no hace falta
+    connection.execute(ReservaCaja.__table__.delete().where(ReservaCaja.caja == target.caja))
+
+
+def _actualizar_caja(mapper, connection, target):
+    if not inspect(target).attrs.caja.history.has_changes():
+        return
+    letra, numero = separar_caja(target.caja)
+    connection.execute(Caja.__table__.update()
+                       .where(Caja.tabla == target.__tablename__)
+                       .where(Caja.registro_id == target.id)
+                       .values(caja=target.caja, letra=letra, numero=numero))
+
+
+def _liberar_caja(mapper, connection, target):
+    connection.execute(Caja.__table__.delete()
+                       .where(Caja.tabla == target.__tablename__)
+                       .where(Caja.registro_id == target.id))
+
+
+for modelo in (Cruza, Macho, Hembra):
+    event.listen(modelo, 'after_insert', _registrar_caja)
+    event.listen(modelo, 'after_update', _actualizar_caja)
+    event.listen(modelo, 'after_delete', _liberar_caja)
+
+
+class ContadorCepa(db.Model):
+    # Totales de la colonia por cepa. Se actualizan en la misma transacción que cada
+    # alta, cambio o baja de cruzas, camadas, machos y hembras (eventos de abajo), así
+    # los tableros no tienen que sumar toda la colonia. `flask reconciliar-contadores`
+    # los recalcula desde cero.
+    __tablename__ = 'contador_cepa'
+
+    cepa = db.Column(db.String(20), primary_key=True)
+    machos = db.Column(db.Integer, default=0, nullable=False)
+    hembras = db.Column(db.Integer, default=0, nullable=False)
+    cajas_macho = db.Column(db.Integer, default=0, nullable=False)
+    cajas_hembra = db.Column(db.Integer, default=0, nullable=False)
+    cruzas = db.Column(db.Integer, default=0, nullable=False)
+    camadas_pendientes = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return '<ContadorCepa %r>' % self.cepa
+
+
+def _sumar(connection, cepa, **cambios):
+    cambios = {columna: valor for columna, valor in cambios.items() if valor}
+    if not cambios:
+        return
+    tabla = ContadorCepa.__table__
+    resultado = connection.execute(tabla.update().where(tabla.c.cepa == cepa)
+                                   .values({tabla.c[columna]: tabla.c[columna] + valor
+                                            for columna, valor in cambios.items()}))
+    if resultado.rowcount == 0:
+        connection.execute(tabla.insert().values(cepa=cepa, **cambios))
+
+
+def _anterior(target, atributo):
+    # El valor antes de este flush, o el actual si no cambió
+    historia = inspect(target).attrs[atributo].history
+    return historia.deleted[0] if historia.deleted else getattr(target, atributo)
+
+
+def _pendiente(macho_is_created, hembra_is_created):
+    return 0 if macho_is_created and hembra_is_created else 1
+
+
+def _cepa_de_cruza(connection, cruza_id):
+    tabla = Cruza.__table__
+    return connection.execute(db.select([tabla.c.cepa]).where(tabla.c.id == cruza_id)).scalar()
+
+
+_COLUMNAS_DESTETADOS = {'macho': ('machos', 'cajas_macho'), 'hembra': ('hembras', 'cajas_hembra')}
+
+
+def _activa(fecha):
+    # 1 si la caja o cruza cuenta en los tableros (no está retirada ni cerrada)
+    return 1 if fecha is None else 0
+
+
+def _contar_destetados(mapper, connection, target):
+    animales, cajas = _COLUMNAS_DESTETADOS[target.__tablename__]
+    activa = _activa(target.fecha_baja)
+    _sumar(connection, target.cepa, **{animales: target.cantidad * activa, cajas: activa})
+
+
+def _recontar_destetados(mapper, connection, target):
+    animales, cajas = _COLUMNAS_DESTETADOS[target.__tablename__]
+    antes = (_anterior(target, 'cepa'), _anterior(target, 'cantidad'), _activa(_anterior(target, 'fecha_baja')))
+    despues = (target.cepa, target.cantidad, _activa(target.fecha_baja))
+    if antes != despues:
+        cepa, cantidad, activa = antes
+        _sumar(connection, cepa, **{animales: -cantidad * activa, cajas: -activa})
+        cepa, cantidad, activa = despues
+        _sumar(connection, cepa, **{animales: cantidad * activa, cajas: activa})
+
+
+def _descontar_destetados(mapper, connection, target):
+    animales, cajas = _COLUMNAS_DESTETADOS[target.__tablename__]
+    activa = _activa(_anterior(target, 'fecha_baja'))
+    _sumar(connection, _anterior(target, 'cepa'), **{animales: -_anterior(target, 'cantidad') * activa,
+                                                     cajas: -activa})
+
+
+def _contar_cruza(mapper, connection, target):
+    _sumar(connection, target.cepa, cruzas=_activa(target.fecha_cierre))
+
+
+def _recontar_cruza(mapper, connection, target):
+    cepa, activa = _anterior(target, 'cepa'), _activa(_anterior(target, 'fecha_cierre'))
+    if cepa != target.cepa:
+        # Las camadas de la cruza cambian de cepa con ella
+        tabla = Camada.__table__
+        pendientes = connection.execute(
+            db.select([db.func.count()]).where(tabla.c.cruza_id == target.id)
+            .where(db.not_(db.and_(tabla.c.macho_is_created, tabla.c.hembra_is_created)))).scalar()
+        _sumar(connection, cepa, cruzas=-activa, camadas_pendientes=-pendientes)
+        _sumar(connection, target.cepa, cruzas=_activa(target.fecha_cierre), camadas_pendientes=pendientes)
+    elif activa != _activa(target.fecha_cierre):
+        _sumar(connection, cepa, cruzas=_activa(target.fecha_cierre) - activa)
+
+
+def _descontar_cruza(mapper, connection, target):
+    _sumar(connection, _anterior(target, 'cepa'), cruzas=-_activa(_anterior(target, 'fecha_cierre')))
+
+
+def _contar_camada(mapper, connection, target):
+    _sumar(connection, _cepa_de_cruza(connection, target.cruza_id),
+           camadas_pendientes=_pendiente(target.macho_is_created, target.hembra_is_created))
+
+
+def _recontar_camada(mapper, connection, target):
+    antes = (_anterior(target, 'cruza_id'),
+             _pendiente(_anterior(target, 'macho_is_created'), _anterior(target, 'hembra_is_created')))
+    despues = (target.cruza_id, _pendiente(target.macho_is_created, target.hembra_is_created))
+    if antes != despues:
+        _sumar(connection, _cepa_de_cruza(connection, antes[0]), camadas_pendientes=-antes[1])
+        _sumar(connection, _cepa_de_cruza(connection, despues[0]), camadas_pendientes=despues[1])
+
+
+def _descontar_camada(mapper, connection, target):
+    _sumar(connection, _cepa_de_cruza(connection, _anterior(target, 'cruza_id')),
+           camadas_pendientes=-_pendiente(_anterior(target, 'macho_is_created'),
+                                          _anterior(target, 'hembra_is_created')))
+
+
+for modelo in (Macho, Hembra):
+    event.listen(modelo, 'after_insert', _contar_destetados)
+    event.listen(modelo, 'after_update', _recontar_destetados)
+    event.listen(modelo, 'after_delete', _descontar_destetados)
+
+event.listen(Cruza, 'after_insert', _contar_cruza)
+event.listen(Cruza, 'after_update', _recontar_cruza)
+event.listen(Cruza, 'after_delete', _descontar_cruza)
+
+event.listen(Camada, 'after_insert', _contar_camada)
+event.listen(Camada, 'after_update', _recontar_camada)
+event.listen(Camada, 'after_delete', _descontar_camada)
+
+
+class VersionDatos(db.Model):
+    # Una sola fila con un número que sube en cada flush que toca la colonia. Los
+    # tableros cacheados (bioterio.respuestas) lo usan en su llave, así una página
+    # guardada deja de servirse en cuanto cualquier worker escribe algo.
+    __tablename__ = 'version_datos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return '<VersionDatos %r>' % self.version
+
+
+MODELOS_VERSIONADOS = (Cepa, Cruza, Camada, Macho, Hembra, Observacion, ContadorCepa)
+
+
+def _subir_version(session, flush_context):
+    # En after_flush las listas new/dirty/deleted aún tienen lo que se acaba de escribir;
+    # el UPDATE va en la misma transacción que los cambios.
+    objetos = list(session.new) + list(session.deleted) + \
+        [objeto for objeto in session.dirty if session.is_modified(objeto)]
+    if any(isinstance(objeto, MODELOS_VERSIONADOS) for objeto in objetos):
+        tabla = VersionDatos.__table__
+        session.connection().execute(tabla.update().where(tabla.c.id == 1)
+                                     .values(version=tabla.c.version + 1))
+
+
+event.listen(db.session, 'after_flush', _subir_version)
+
+
+class Cambio(db.Model):
+    # Bitácora corta de lo que cambió en los tableros, escrita por los eventos de abajo en
+    # la misma transacción. El publicador de bioterio.en_vivo la lee una vez por proceso y
+    # reparte cada cambio a los navegadores conectados; se purga sola después de un día.
+    __tablename__ = 'cambio'
+    # AUTOINCREMENT para que un id nunca se repita aunque se purguen los últimos: los
+    # navegadores reanudan con Last-Event-ID
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    datos = db.Column(db.Text, nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.now, nullable=False, index=True)
+
+    def __repr__(self):
+        return '<Cambio %r %s>' % (self.id, self.tipo)
+
+
+def _anotar(connection, tipo, **datos):
+    connection.execute(Cambio.__table__.insert().values(tipo=tipo, datos=json.dumps(datos, default=str),
+                                                        fecha=datetime.now()))
+
+
+def datos_camada(camada, cepa):
+    # Lo que necesita una fila del visor de destetes
+    return {'id': camada.id, 'cepa': cepa, 'fecha_nacimiento': camada.fecha_nacimiento.date(),
+            'fecha_destete': camada.fecha_destete.date(), 'machos': camada.machos, 'hembras': camada.hembras,
+            'macho_is_created': camada.macho_is_created, 'hembra_is_created': camada.hembra_is_created}
+
+
+def _anotar_vencida(connection, target):
+    # Una camada capturada tarde o con la fecha de destete corregida puede quedar
+    # vencida de inmediato; las que vencen con el tiempo las detecta el publicador
+    if target.fecha_destete <= datetime.now() and not (target.macho_is_created and target.hembra_is_created):
+        _anotar(connection, 'camada_vencida', **datos_camada(target, _cepa_de_cruza(connection, target.cruza_id)))
+
+
+def _anotar_camada_nueva(mapper, connection, target):
+    _anotar_vencida(connection, target)
+
+
+def _anotar_camada(mapper, connection, target):
+    historia = inspect(target).attrs
+    if historia.macho_is_created.history.has_changes() or historia.hembra_is_created.history.has_changes():
+        _anotar(connection, 'destete', id=target.id, macho_is_created=target.macho_is_created,
+                hembra_is_created=target.hembra_is_created)
+    if historia.fecha_destete.history.has_changes():
+        _anotar_vencida(connection, target)
+
+
+def _anotar_camada_eliminada(mapper, connection, target):
+    _anotar(connection, 'camada_eliminada', id=target.id)
+
+
+def _anotar_caja(mapper, connection, target):
+    _anotar(connection, 'caja_nueva', sexo=target.__tablename__, id=target.id, caja=target.caja, cepa=target.cepa,
+            fecha_nacimiento=target.fecha_nacimiento.date(), fecha_destete=target.fecha_destete.date(),
+            cantidad=target.cantidad, padres=target.padres)
+
+
+def _anotar_caja_retirada(mapper, connection, target):
+    if inspect(target).attrs.fecha_baja.history.has_changes() and target.fecha_baja is not None:
+        _anotar(connection, 'caja_retirada', sexo=target.__tablename__, id=target.id)
+
+
+def _anotar_caja_eliminada(mapper, connection, target):
+    _anotar(connection, 'caja_eliminada', sexo=target.__tablename__, id=target.id)
+
+
+def _anotar_observacion(mapper, connection, target):
+    sexo, caja_id = ('macho', target.macho_id) if target.macho_id is not None else ('hembra', target.hembra_id)
+    _anotar(connection, 'observacion', sexo=sexo, id=caja_id, observacion=target.observacion)
+
+
+event.listen(Camada, 'after_insert', _anotar_camada_nueva)
+event.listen(Camada, 'after_update', _anotar_camada)
+event.listen(Camada, 'after_delete', _anotar_camada_eliminada)
+for modelo in (Macho, Hembra):
+    event.listen(modelo, 'after_insert', _anotar_caja)
+    event.listen(modelo, 'after_update', _anotar_caja_retirada)
+    event.listen(modelo, 'after_delete', _anotar_caja_eliminada)
+event.listen(Observacion, 'after_insert', _anotar_observacion)
+
+
+# Archivo: cajas retiradas, camadas destetadas viejas y cruzas cerradas que `flask
+# archivar` (bioterio.archivo) saca de las tablas activas. Conservan el id original
+# (así el linaje y las observaciones siguen enlazados) y sólo se leen en /historial.
+class CruzaArchivo(db.Model):
+    __tablename__ = 'cruza_archivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    caja = db.Column(db.String(20), nullable=False, index=True)
+    cepa = db.Column(db.String(20), nullable=False)
+    fecha_cruza = db.Column(db.DateTime, nullable=False)
+    machos = db.Column(db.Integer)
+    hembras = db.Column(db.Integer)
+    fecha_cierre = db.Column(db.DateTime)
+    archivada = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<CruzaArchivo %r>' % self.id
+
+
+class CamadaArchivo(db.Model):
+    __tablename__ = 'camada_archivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    fecha_nacimiento = db.Column(db.DateTime, nullable=False)
+    fecha_destete = db.Column(db.DateTime, nullable=False)
+    machos = db.Column(db.Integer, nullable=False)
+    hembras = db.Column(db.Integer, nullable=False)
+    macho_is_created = db.Column(db.Boolean, nullable=False)
+    hembra_is_created = db.Column(db.Boolean, nullable=False)
+    cruza_id = db.Column(db.Integer, nullable=False, index=True)
+    archivada = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<CamadaArchivo %r>' % self.id
+
+
+class MachoArchivo(db.Model):
+    __tablename__ = 'macho_archivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    caja = db.Column(db.String(20), nullable=False, index=True)
+    cepa = db.Column(db.String(20), nullable=False)
+    fecha_nacimiento = db.Column(db.DateTime, nullable=False)
+    fecha_destete = db.Column(db.DateTime, nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    padres = db.Column(db.String(20), nullable=False)
+    cruza_id = db.Column(db.Integer, nullable=False, index=True)
+    fecha_baja = db.Column(db.DateTime)
+    archivada = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<MachoArchivo %r>' % self.id
+
+
+class HembraArchivo(db.Model):
+    __tablename__ = 'hembra_archivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    caja = db.Column(db.String(20), nullable=False, index=True)
+    cepa = db.Column(db.String(20), nullable=False)
+    fecha_nacimiento = db.Column(db.DateTime, nullable=False)
+    fecha_destete = db.Column(db.DateTime, nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    padres = db.Column(db.String(20), nullable=False)
+    cruza_id = db.Column(db.Integer, nullable=False, index=True)
+    fecha_baja = db.Column(db.DateTime)
+    archivada = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<HembraArchivo %r>' % self.id
+
+
+class ObservacionArchivo(db.Model):
+    __tablename__ = 'observacion_archivo'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    observacion = db.Column(db.Text, nullable=False)
+    fecha = db.Column(db.DateTime, nullable=False)
+    macho_id = db.Column(db.Integer, index=True)
+    hembra_id = db.Column(db.Integer, index=True)
+    archivada = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return '<ObservacionArchivo %r>' % self.id
+
+
+class Trabajo(db.Model):
+    # Cola de trabajos pesados (exportaciones, pronósticos, importaciones, reconciliar
+    # contadores). Las rutas y `flask encolar` agregan filas pendientes; `flask trabajos`
+    # las toma y las corre en un pool de procesos. Ver bioterio/trabajos.py.
+    __tablename__ = 'trabajo'
+    __table_args__ = (db.Index('ix_trabajo_estado', 'estado', 'id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(20), nullable=False)
+    parametros = db.Column(db.Text, nullable=False, default='{}')
+    estado = db.Column(db.String(12), nullable=False, default='pendiente')
+    progreso = db.Column(db.Integer, nullable=False, default=0)
+    mensaje = db.Column(db.String(200))
+    # Se marca para pedir que un trabajo corriendo se detenga en su siguiente reporte de avance
+    cancelar = db.Column(db.Boolean, nullable=False, default=False)
+    # Resumen en JSON y nombre del archivo de resultado dentro de TRABAJOS_DIRECTORIO
+    resumen = db.Column(db.Text)
+    resultado = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    # pid del `flask trabajos` que lo tomó, para recuperarlo si ese proceso muere
+    worker = db.Column(db.Integer)
+    creado = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    iniciado = db.Column(db.DateTime)
+    terminado = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return '<Trabajo %r %s>' % (self.id, self.tipo)
@@ -0,0 +1,89 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from bioterio import db
+
+POR_PAGINA = 50
+
+
+def escribir_cursor(valores):
+    texto = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in valores])
+    return base64.urlsafe_b64encode(texto.encode()).decode()
+
+
+def _valor_cursor(clave, valor):
+    # Cada valor con el tipo de su columna: lo demás llegaría a SQLite tal cual
+    if isinstance(clave.type, db.DateTime):
+        return datetime.fromisoformat(valor)
+    if isinstance(clave.type, db.Integer) and (not isinstance(valor, int) or isinstance(valor, bool)):
+        raise TypeError('Se esperaba un entero')
+    if isinstance(clave.type, db.String) and not isinstance(valor, str):
+        raise TypeError('Se esperaba texto')
+    return valor
+
+
+def leer_cursor(cursor, claves):
+    # ValueError para cualquier cursor mal formado (base64, JSON, forma o tipos), que las
+    # vistas responden como "Filtro o cursor inválido"
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if not isinstance(valores, list) or len(valores) != len(claves):
+            raise ValueError('Cursor inválido')
+        return [_valor_cursor(clave, v) for clave, v in zip(claves, valores)]
+    except (TypeError, binascii.Error) as error:
+        raise ValueError('Cursor inválido') from error
+
+
+def pagina(consulta, claves, cursor=None, por_pagina=POR_PAGINA, descendente=False):
+    # Paginación por llave (keyset): en lugar de OFFSET se continúa después de la última
+    # fila vista, así cada página cuesta lo mismo sin importar qué tan atrás esté.
+    # La última clave debe ser única (el id) para que el orden sea total.
+    if cursor:
+        valores = leer_cursor(cursor, claves)
+        if descendente:
+            consulta = consulta.filter(tuple_(*claves) < tuple_(*valores))
+        else:
+            consulta = consulta.filter(tuple_(*claves) > tuple_(*valores))
+
+    orden = [clave.desc() if descendente else clave for clave in claves]
+    filas = consulta.order_by(*orden).limit(por_pagina + 1).all()
+
+    siguiente = None
+    if len(filas) > por_pagina:
+        filas = filas[:por_pagina]
+        siguiente = escribir_cursor([getattr(filas[-1], clave.key) for clave in claves])
+
+    return filas, siguiente
+
+
+def leer_filtros(args):
+    # Filtros comunes de los listados: cepa, prefijo de caja y rango de fechas (YYYY-MM-DD)
+    filtros = {'cepa': args.get('cepa') or None,
+               'prefijo': (args.get('prefijo') or '').upper() or None,
+               'desde': None,
+               'hasta': None}
+    if args.get('desde'):
+        filtros['desde'] = datetime.strptime(args['desde'], "%Y-%m-%d")
+    if args.get('hasta'):
+        # Inclusivo: todo el día de la fecha final
+        filtros['hasta'] = datetime.strptime(args['hasta'], "%Y-%m-%d") + timedelta(days=1)
+    return filtros
+
+
+def filtrar(consulta, filtros, caja, cepa, fecha):
+    if filtros['cepa']:
+        consulta = consulta.filter(cepa == filtros['cepa'])
+    if filtros['prefijo']:
+        consulta = consulta.filter(caja.startswith(filtros['prefijo'], autoescape=True))
+    if filtros['desde']:
+        consulta = consulta.filter(fecha >= filtros['desde'])
+    if filtros['hasta']:
+        consulta = consulta.filter(fecha < filtros['hasta'])
+    return consulta
+
+
+def argumentos(args):
+    # Los argumentos de la página actual sin el cursor, para armar el enlace a la siguiente
+    return {llave: valor for llave, valor in args.items() if llave != 'cursor' and valor}
@@ -0,0 +1,33 @@
+import os
+from functools import wraps
+from flask import abort
+from flask_login import current_user
+from bioterio import app, db
+from bioterio.models import User
+
+# Correos de los administradores, en la configuración o separados por comas en
+# BIOTERIO_ADMIN_EMAILS. Si no hay ninguno, el administrador es el primer usuario
+# registrado.
+app.config.setdefault('ADMIN_EMAILS', [correo.strip() for correo in
+                                       os.environ.get('BIOTERIO_ADMIN_EMAILS', '').split(',')
+                                       if correo.strip()])
+
+
+def es_admin(usuario):
+    if usuario is None or not usuario.is_authenticated:
+        return False
+    correos = app.config['ADMIN_EMAILS']
+    if correos:
+        return usuario.email in correos
+    primero = db.session.query(db.func.min(User.id)).scalar()
+    return usuario.id == primero
+
+
+def admin_requerido(vista):
+    # Va debajo de @login_required
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not es_admin(current_user):
+            abort(403)
+        return vista(*args, **kwargs)
+    return envoltura
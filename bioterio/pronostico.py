@@ -0,0 +1,166 @@
+import click
+from datetime import datetime, timedelta
+from bioterio import app, db
+from bioterio.models import Cruza, Camada
+from bioterio.cepas import edad_destete as edad_registrada
+
+SEMANAS = 12
+MAXIMO_SEMANAS = 52
+# Una cruza sin camadas ni cruzamiento en este tiempo ya no se cuenta como productiva
+DIAS_ACTIVA = 120
+# Valores para cepas sin suficiente historia (se usan en lugar de la media); la edad
+# de destete de respaldo es la registrada para cada cepa
+INTERVALO_DIAS = 28.0
+LATENCIA_DIAS = 21.0
+
+
+def _numpy():
+    # numpy sólo se necesita para el pronóstico, igual que pyarrow para exportar a parquet
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('Para el pronóstico instale numpy (pip install numpy)')
+    return numpy
+
+
+def _por_cepa(np, indices, valores, n_cepas, respaldo):
+    # Media y desviación estándar de `valores` agrupados por cepa con bincount; las
+    # cepas sin datos toman `respaldo` de media y 0 de desviación.
+    n = np.bincount(indices, minlength=n_cepas)
+    suma = np.bincount(indices, weights=valores, minlength=n_cepas)
+    cuadrados = np.bincount(indices, weights=valores * valores, minlength=n_cepas)
+    con_datos = n > 0
+    media = np.where(con_datos, suma / np.maximum(n, 1), respaldo)
+    varianza = np.where(con_datos, cuadrados / np.maximum(n, 1) - media * media, 0.0)
+    return n, media, np.sqrt(np.maximum(varianza, 0.0))
+
+
+def historia():
+    # Toda la historia de camadas en una consulta, ordenada por cruza y nacimiento para
+    # poder sacar los intervalos entre camadas consecutivas con diferencias de arreglos.
+    camadas = db.session.query(Cruza.cepa, Cruza.id, Cruza.fecha_cruza, Camada.fecha_nacimiento,
+                               Camada.fecha_destete, Camada.machos, Camada.hembras,
+                               Camada.macho_is_created, Camada.hembra_is_created) \
+        .join(Camada, Camada.cruza_id == Cruza.id) \
+        .order_by(Cruza.id, Camada.fecha_nacimiento).all()
+    # Todas las cruzas, también las cerradas: sus camadas cuentan para las estadísticas
+    cruzas = db.session.query(Cruza.cepa, Cruza.id, Cruza.fecha_cruza, Cruza.fecha_cierre).order_by(Cruza.id).all()
+    return camadas, cruzas
+
+
+def pronosticar(semanas=SEMANAS, hoy=None):
+    # Destetes esperados por cepa para cada una de las próximas `semanas` semanas:
+    # los de camadas ya nacidas según su fecha de destete, más los de camadas que las
+    # cruzas activas deberían tener según el intervalo entre partos de su cepa. Las
+    # cajas se cuentan como las crea el destete: una por sexo por camada.
+    np = _numpy()
+    hoy = hoy or datetime.combine(datetime.today(), datetime.min.time())
+    camadas, cruzas = historia()
+    if not cruzas:
+        return {'inicio': hoy, 'semanas': [], 'cepas': []}
+
+    def dias(fechas):
+        return (np.array(fechas, dtype='datetime64[s]') - np.datetime64(hoy, 's')) / np.timedelta64(1, 'D')
+
+    cepas, cepa_cruza = np.unique([fila.cepa for fila in cruzas], return_inverse=True)
+    n_cepas = len(cepas)
+    id_cruza = np.array([fila.id for fila in cruzas])
+    cruzamiento = dias([fila.fecha_cruza for fila in cruzas])
+
+    # Arreglos por camada
+    cruza = np.array([fila.id for fila in camadas], dtype=np.int64)
+    cepa = cepa_cruza[np.searchsorted(id_cruza, cruza)]
+    nacimiento = dias([fila.fecha_nacimiento for fila in camadas])
+    destete = dias([fila.fecha_destete for fila in camadas])
+    machos = np.array([fila.machos for fila in camadas], dtype=float)
+    hembras = np.array([fila.hembras for fila in camadas], dtype=float)
+    macho_hecho = np.array([fila.macho_is_created for fila in camadas], dtype=bool)
+    hembra_hecho = np.array([fila.hembra_is_created for fila in camadas], dtype=bool)
+
+    # Estadísticas de la historia por cepa
+    n_camadas, media_machos, sd_machos = _por_cepa(np, cepa, machos, n_cepas, 0.0)
+    _, media_hembras, sd_hembras = _por_cepa(np, cepa, hembras, n_cepas, 0.0)
+    _, edad_destete, _ = _por_cepa(np, cepa, destete - nacimiento, n_cepas,
+                                   np.array([edad_registrada(nombre) for nombre in cepas], dtype=float))
+    prob_machos = np.bincount(cepa, weights=(machos > 0), minlength=n_cepas) / np.maximum(n_camadas, 1)
+    prob_hembras = np.bincount(cepa, weights=(hembras > 0), minlength=n_cepas) / np.maximum(n_camadas, 1)
+
+    misma_cruza = cruza[1:] == cruza[:-1]
+    primera = np.ones(len(camadas), dtype=bool)
+    primera[1:] = ~misma_cruza
+    n_intervalos, intervalo, sd_intervalo = _por_cepa(
+        np, cepa[1:][misma_cruza], np.diff(nacimiento)[misma_cruza], n_cepas, INTERVALO_DIAS)
+    _, latencia, _ = _por_cepa(np, cepa[primera], nacimiento[primera] - cruzamiento[
+        np.searchsorted(id_cruza, cruza[primera])], n_cepas, LATENCIA_DIAS)
+    intervalo = np.maximum(intervalo, 1.0)
+
+    forma = (n_cepas, semanas)
+    esperado = {nombre: np.zeros(forma) for nombre in ('machos', 'hembras', 'cajas_macho', 'cajas_hembra')}
+
+    # 1. Camadas ya nacidas con algún sexo sin destetar; las atrasadas cuentan en la primera semana
+    semana = np.floor(np.maximum(destete, 0) / 7).astype(np.int64)
+    for sexo, cantidad, hecho in (('macho', machos, macho_hecho), ('hembra', hembras, hembra_hecho)):
+        dentro = ~hecho & (semana < semanas)
+        np.add.at(esperado[sexo + 's'], (cepa[dentro], semana[dentro]), cantidad[dentro])
+        np.add.at(esperado['cajas_' + sexo], (cepa[dentro], semana[dentro]), cantidad[dentro] > 0)
+
+    # 2. Camadas futuras de las cruzas activas (no cerradas): la siguiente después del último parto (o de
+    # la latencia desde el cruzamiento si aún no paren) y luego una por intervalo.
+    ultimo = np.full(len(cruzas), np.nan)
+    if len(camadas):
+        ultima_camada = np.append(~misma_cruza, True)
+        ultimo[np.searchsorted(id_cruza, cruza[ultima_camada])] = nacimiento[ultima_camada]
+    sin_partos = np.isnan(ultimo)
+    siguiente = np.where(sin_partos, cruzamiento + latencia[cepa_cruza], ultimo + intervalo[cepa_cruza])
+    abierta = np.array([fila.fecha_cierre is None for fila in cruzas], dtype=bool)
+    activa = abierta & (np.where(sin_partos, cruzamiento, ultimo) > -DIAS_ACTIVA)
+    siguiente = np.maximum(siguiente[activa], 0.0)
+    cepa_activa = cepa_cruza[activa]
+
+    partos = int(np.ceil(semanas * 7 / intervalo.min())) + 1
+    nacimientos = siguiente[:, None] + np.arange(partos)[None, :] * intervalo[cepa_activa][:, None]
+    semana = np.floor((nacimientos + edad_destete[cepa_activa][:, None]) / 7).astype(np.int64)
+    dentro = semana < semanas
+    indices = (np.broadcast_to(cepa_activa[:, None], semana.shape)[dentro], semana[dentro])
+    for nombre, por_camada in (('machos', media_machos), ('hembras', media_hembras),
+                               ('cajas_macho', prob_machos), ('cajas_hembra', prob_hembras)):
+        np.add.at(esperado[nombre], indices, por_camada[indices[0]])
+
+    cruzas_activas = np.bincount(cepa_activa, minlength=n_cepas)
+    resultado = []
+    for i, cepa_nombre in enumerate(cepas):
+        resultado.append({
+            'cepa': str(cepa_nombre),
+            'camadas': int(n_camadas[i]),
+            'cruzas_activas': int(cruzas_activas[i]),
+            'machos_por_camada': (float(media_machos[i]), float(sd_machos[i])),
+            'hembras_por_camada': (float(media_hembras[i]), float(sd_hembras[i])),
+            'intervalo': (float(intervalo[i]), float(sd_intervalo[i]), int(n_intervalos[i])),
+            'latencia': float(latencia[i]),
+            'edad_destete': float(edad_destete[i]),
+            'semanas': [{nombre: float(esperado[nombre][i, s]) for nombre in esperado}
+                        for s in range(semanas)],
+        })
+    return {'inicio': hoy, 'semanas': [hoy + timedelta(weeks=s) for s in range(semanas)], 'cepas': resultado}
+
+
+@app.cli.command('pronostico')
+@click.option('--semanas', default=SEMANAS, show_default=True, type=click.IntRange(1, MAXIMO_SEMANAS),
+              help='Semanas a proyectar')
+def pronostico_command(semanas):
+    """Destetes y cajas esperados por cepa para las próximas semanas."""
+    try:
+        pronostico = pronosticar(semanas)
+    except ImportError as error:
+        raise click.ClickException(str(error))
+
+    for cepa in pronostico['cepas']:
+        click.echo('{cepa}: {camadas} camadas, {cruzas_activas} cruzas activas, '
+                   'intervalo entre partos {intervalo[0]:.1f} días, '
+                   '{machos_por_camada[0]:.1f} machos y {hembras_por_camada[0]:.1f} hembras por camada'
+                   .format(**cepa))
+        click.echo('  semana      machos  hembras  cajas M  cajas H')
+        for inicio, semana in zip(pronostico['semanas'], cepa['semanas']):
+            click.echo('  {} {:8.1f} {:8.1f} {:8.1f} {:8.1f}'.format(
+                inicio.date(), semana['machos'], semana['hembras'], semana['cajas_macho'],
+                semana['cajas_hembra']))
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+import click
+from bioterio import app, db
+
+# Respaldos en caliente con la API de backup de SQLite: se copian PAGINAS páginas por
+# paso y entre pasos se suelta la base PAUSA segundos, así ni en modo rollback un
+# escritor espera más que un paso. Si alguien escribe a media copia SQLite la reinicia,
+# de modo que el archivo final siempre es una foto consistente.
+app.config.setdefault('RESPALDO_DIRECTORIO', os.path.join(app.instance_path, 'respaldos'))
+app.config.setdefault('RESPALDO_PAGINAS', 256)
+app.config.setdefault('RESPALDO_PAUSA', 0.005)
+app.config.setdefault('RESPALDO_CONSERVAR', 14)
+
+PREFIJO = 'bioterio-'
+_candado = threading.Lock()
+
+
+class ErrorRespaldo(Exception):
+    pass
+
+
+def ruta_base():
+    url = db.engine.url
+    if url.get_backend_name() != 'sqlite' or not url.database or url.database == ':memory:':
+        raise ErrorRespaldo('Los respaldos sólo funcionan con una base SQLite en archivo')
+    return url.database
+
+
+def _manifiesto(ruta):
+    return ruta[:-len('.db')] + '.json'
+
+
+def respaldos(directorio=None):
+    # [{nombre, ruta, bytes, version, creado, tablas}, ...] del más nuevo al más viejo
+    directorio = directorio or app.config['RESPALDO_DIRECTORIO']
+    if not os.path.isdir(directorio):
+        return []
+    lista = []
+    for nombre in sorted(os.listdir(directorio), reverse=True):
+        if not (nombre.startswith(PREFIJO) and nombre.endswith('.db')):
+            continue
+        ruta = os.path.join(directorio, nombre)
+        try:
+            with open(_manifiesto(ruta)) as archivo:
+                datos = json.load(archivo)
+        except (OSError, ValueError):
+            datos = {}
+        lista.append(dict(datos, nombre=nombre, ruta=ruta, bytes=os.path.getsize(ruta)))
+    return lista
+
+
+def contar_filas(conexion):
+    tablas = [nombre for nombre, in conexion.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    return {tabla: conexion.execute('SELECT COUNT(*) FROM "{}"'.format(tabla)).fetchone()[0]
+            for tabla in tablas}
+
+
+def huella(ruta):
+    # SHA-256 del archivo del respaldo sin los campos del encabezado que cambian sin que
+    # cambien los datos (contador de cambios, versión de SQLite). Dos copias de la misma
+    # base dan la misma huella; cualquier fila distinta, en cualquier tabla, la cambia.
+    suma = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        encabezado = bytearray(archivo.read(100))
+        encabezado[24:28] = bytes(4)
+        encabezado[92:100] = bytes(8)
+        suma.update(encabezado)
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            suma.update(bloque)
+    return suma.hexdigest()
+
+
+def _version(conexion):
+    try:
+        fila = conexion.execute('SELECT version FROM version_datos WHERE id = 1').fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return fila[0] if fila else 0
+
+
+def _abrir_solo_lectura(ruta):
+    return sqlite3.connect('file:{}?mode=ro'.format(ruta), uri=True)
+
+
+def verificar(ruta):
+    # Abre el respaldo como se abriría para restaurarlo, revisa su integridad y que
+    # cada tabla tenga las filas que se anotaron al crearlo. Regresa la lista de
+    # problemas (vacía si está bien).
+    try:
+        with open(_manifiesto(ruta)) as archivo:
+            esperado = json.load(archivo)['tablas']
+    except (OSError, ValueError, KeyError):
+        return ['No se pudo leer el manifiesto de {}'.format(os.path.basename(ruta))]
+
+    conexion = _abrir_solo_lectura(ruta)
+    try:
+        revision = [fila[0] for fila in conexion.execute('PRAGMA quick_check')]
+        problemas = [] if revision == ['ok'] else ['quick_check: {}'.format(fila) for fila in revision]
+        reales = contar_filas(conexion)
+    except sqlite3.DatabaseError as error:
+        return ['No se pudo abrir {}: {}'.format(os.path.basename(ruta), error)]
+    finally:
+        conexion.close()
+
+    for tabla in sorted(set(esperado) | set(reales)):
+        if esperado.get(tabla) != reales.get(tabla):
+            problemas.append('{}: {} filas en el manifiesto, {} en el respaldo'.format(
+                tabla, esperado.get(tabla), reales.get(tabla)))
+    return problemas
+
+
+def rotar(directorio, conservar):
+    # Borra los respaldos más viejos (y sus manifiestos) dejando los `conservar` más nuevos
+    borrados = []
+    for respaldo in respaldos(directorio)[conservar:]:
+        for ruta in (respaldo['ruta'], _manifiesto(respaldo['ruta'])):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        borrados.append(respaldo['nombre'])
+    return borrados
+
+
+def respaldar(directorio=None, incremental=False, conservar=None, paginas=None, pausa=None):
+    # Crea un respaldo verificado y rota los viejos. Con `incremental` la copia se descarta
+    # si su huella es la misma que la del último respaldo. Regresa el registro del
+    # respaldo nuevo (como en respaldos()) o None si no hizo falta.
+    directorio = directorio or app.config['RESPALDO_DIRECTORIO']
+    conservar = app.config['RESPALDO_CONSERVAR'] if conservar is None else conservar
+    paginas = paginas or app.config['RESPALDO_PAGINAS']
+    pausa = app.config['RESPALDO_PAUSA'] if pausa is None else pausa
+    origen = ruta_base()
+
+    with _candado:
+        os.makedirs(directorio, exist_ok=True)
+        anteriores = respaldos(directorio)
+        fuente = sqlite3.connect(origen, timeout=10)
+        creado = datetime.now()
+        ruta = os.path.join(directorio, '{}{}.db'.format(PREFIJO, creado.strftime('%Y%m%d-%H%M%S-%f')))
+        parcial = ruta + '.parcial'
+        destino = sqlite3.connect(parcial)
+        try:
+            # Una sola transacción de lectura para contar y copiar: el manifiesto anota lo
+            # que tenía la base, no lo que quedó en la copia, y verificar() los compara. En
+            # WAL los escritores siguen mientras tanto y la copia no se reinicia.
+            fuente.execute('BEGIN')
+            datos = {'creado': creado.isoformat(timespec='seconds'), 'version': _version(fuente),
+                     'tablas': contar_filas(fuente)}
+            fuente.backup(destino, pages=paginas, progress=lambda *avance: time.sleep(pausa))
+            fuente.rollback()
+            # El respaldo queda en modo rollback (no WAL) para poder copiarse como un solo archivo
+            destino.execute('PRAGMA journal_mode = DELETE')
+            destino.close()
+        except sqlite3.Error as error:
+            destino.close()
+            os.remove(parcial)
+            raise ErrorRespaldo('No se pudo copiar {}: {}'.format(origen, error))
+        finally:
+            fuente.close()
+
+        datos['huella'] = huella(parcial)
+        if incremental and anteriores and anteriores[0].get('huella') == datos['huella']:
+            os.remove(parcial)
+            return None
+        os.replace(parcial, ruta)
+        with open(_manifiesto(ruta), 'w') as archivo:
+            json.dump(datos, archivo, indent=2, sort_keys=True)
+        problemas = verificar(ruta)
+        if problemas:
+            raise ErrorRespaldo('El respaldo {} no pasó la verificación: {}'.format(
+                os.path.basename(ruta), '; '.join(problemas)))
+        rotar(directorio, conservar)
+        return dict(datos, nombre=os.path.basename(ruta), ruta=ruta, bytes=os.path.getsize(ruta))
+
+
+@app.cli.command('respaldar')
+@click.option('--directorio', help='Dónde guardar los respaldos (RESPALDO_DIRECTORIO)')
+@click.option('--incremental', is_flag=True, help='Sólo si los datos cambiaron desde el último respaldo')
+@click.option('--conservar', type=int, help='Cuántos respaldos dejar (RESPALDO_CONSERVAR)')
+def respaldar_command(directorio, incremental, conservar):
+    """Copia la base en caliente con la API de backup de SQLite y la verifica."""
+    try:
+        respaldo = respaldar(directorio, incremental, conservar)
+    except ErrorRespaldo as error:
+        raise click.ClickException(str(error))
+    if respaldo is None:
+        click.echo('Sin cambios desde el último respaldo')
+    else:
+        click.echo('{} ({} bytes, versión {})'.format(respaldo['ruta'], respaldo['bytes'], respaldo['version']))
+
+
+@app.cli.command('verificar-respaldo')
+@click.argument('ruta', required=False)
+def verificar_command(ruta):
+    """Revisa un respaldo (por omisión el más reciente) contra su manifiesto."""
+    if ruta is None:
+        lista = respaldos()
+        if not lista:
+            raise click.ClickException('No hay respaldos en {}'.format(app.config['RESPALDO_DIRECTORIO']))
+        ruta = lista[0]['ruta']
+    problemas = verificar(ruta)
+    for problema in problemas:
+        click.echo(problema)
+    if problemas:
+        raise click.ClickException('{} no pasó la verificación'.format(ruta))
+    click.echo('{}: correcto'.format(ruta))
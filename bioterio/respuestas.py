@@ -0,0 +1,55 @@
+import hashlib
+from datetime import date
+from functools import wraps
+from flask import request, Response
+from flask_login import current_user
+from bioterio import db
+from bioterio.cache import CacheTTL
+from bioterio.models import VersionDatos
+
+# Páginas ya renderizadas de los tableros. La llave lleva la versión de los datos,
+# así que una escritura las invalida en todos los workers sin avisarles; el ttl sólo
+# libera memoria de versiones viejas.
+paginas_cache = CacheTTL(maximo=256, ttl=600)
+
+
+def version_datos():
+    tabla = VersionDatos.__table__
+    return db.session.execute(db.select([tabla.c.version]).where(tabla.c.id == 1)).scalar() or 0
+
+
+def llave_pagina():
+    # Los tableros muestran el correo del usuario y edades calculadas contra hoy, así
+    # que ambos van en la llave junto con la ruta, los argumentos y la versión.
+    argumentos = tuple(sorted(request.args.items(multi=True)))
+    usuario = current_user.get_id() if current_user.is_authenticated else None
+    return (request.endpoint, argumentos, usuario, version_datos(), date.today().isoformat())
+
+
+def cachear_pagina(vista):
+    # Para los GET de los tableros: responde 304 si el navegador ya tiene esta versión
+    # (ETag fuerte derivado de la llave) y si no, sirve la página guardada o la genera
+    # y la guarda. Sólo se guardan las respuestas 200 de texto.
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        if request.method != 'GET':
+            return vista(*args, **kwargs)
+
+        llave = llave_pagina()
+        etag = hashlib.sha1(repr(llave).encode('utf-8')).hexdigest()
+        if request.if_none_match.contains(etag):
+            respuesta = Response(status=304)
+        else:
+            cuerpo = paginas_cache.obtener(llave)
+            if cuerpo is None:
+                cuerpo = vista(*args, **kwargs)
+                if not isinstance(cuerpo, str):
+                    return cuerpo
+                paginas_cache.guardar(llave, cuerpo)
+            respuesta = Response(cuerpo)
+
+        respuesta.set_etag(etag)
+        # Privada porque depende del usuario; no-cache obliga a revalidar cada vez
+        respuesta.headers['Cache-Control'] = 'private, no-cache'
+        return respuesta
+    return envoltura
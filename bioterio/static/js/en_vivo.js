@@ -0,0 +1,162 @@
+// Cambios en vivo para /destete y /macho-hembra/ (ver bioterio/en_vivo.py). Cada evento
+// trae sólo lo que cambió y aquí se aplica a la tabla que ya está en la página.
+(function () {
+	var destete = document.getElementById('en-vivo-destete');
+	var cajas = document.getElementById('en-vivo-cajas');
+	if (!destete && !cajas || !window.EventSource) {
+		return;
+	}
+
+	function celda(fila, texto) {
+		var td = document.createElement('td');
+		if (texto instanceof Node) {
+			td.appendChild(texto);
+		} else {
+			td.textContent = texto;
+		}
+		fila.appendChild(td);
+		return td;
+	}
+
+	function boton(clase, href, texto) {
+		var a = document.createElement('a');
+		a.className = 'btn ' + clase;
+		a.href = href;
+		a.textContent = texto;
+		return a;
+	}
+
+	function edad(nacimiento) {
+		var dias = Math.floor((Date.now() - new Date(nacimiento + 'T00:00:00')) / 86400000);
+		return Math.floor(dias / 7) + ' semanas y ' + (dias % 7) + ' días';
+	}
+
+	function resaltar(fila) {
+		fila.classList.add('table-warning');
+		setTimeout(function () { fila.classList.remove('table-warning'); }, 5000);
+	}
+
+	var fuente = new EventSource('/en-vivo');
+
+	if (destete) {
+		var cuerpo = destete.querySelector('tbody');
+
+		fuente.addEventListener('camada_vencida', function (evento) {
+			var camada = JSON.parse(evento.data);
+			var fila = document.createElement('tr');
+			fila.dataset.camada = camada.id;
+			celda(fila, camada.cepa);
+			celda(fila, camada.fecha_nacimiento);
+			celda(fila, camada.fecha_destete).style.color = 'red';
+			celda(fila, camada.machos);
+			celda(fila, camada.hembras);
+			celda(fila, camada.machos + camada.hembras);
+			var acciones = celda(fila, '');
+			[['macho', 'btn-outline-primary', 'Destetar macho'], ['hembra', 'btn-outline-success', 'Destetar hembra']]
+				.forEach(function (sexo) {
+					if (!camada[sexo[0] + '_is_created']) {
+						var a = boton(sexo[1], '/' + sexo[0] + '/' + camada.id, sexo[2]);
+						a.dataset.sexo = sexo[0];
+						acciones.appendChild(a);
+						acciones.appendChild(document.createElement('br'));
+					}
+				});
+			acciones.appendChild(boton('btn-primary', '/update-camada/' + camada.id, 'Actualizar camada'));
+
+			var anterior = cuerpo.querySelector('tr[data-camada="' + camada.id + '"]');
+			if (anterior) {
+				cuerpo.replaceChild(fila, anterior);
+			} else {
+				cuerpo.insertBefore(fila, cuerpo.firstChild);
+			}
+			resaltar(fila);
+		});
+
+		fuente.addEventListener('destete', function (evento) {
+			var camada = JSON.parse(evento.data);
+			var fila = cuerpo.querySelector('tr[data-camada="' + camada.id + '"]');
+			if (!fila) {
+				return;
+			}
+			if (camada.macho_is_created && camada.hembra_is_created) {
+				fila.remove();
+				return;
+			}
+			['macho', 'hembra'].forEach(function (sexo) {
+				var a = fila.querySelector('a[data-sexo="' + sexo + '"]');
+				if (a && camada[sexo + '_is_created']) {
+					a.nextSibling.remove();
+					a.remove();
+				}
+			});
+			resaltar(fila);
+		});
+
+		fuente.addEventListener('camada_eliminada', function (evento) {
+			var fila = cuerpo.querySelector('tr[data-camada="' + JSON.parse(evento.data).id + '"]');
+			if (fila) {
+				fila.remove();
+			}
+		});
+	}
+
+	if (cajas) {
+		function quitar(evento) {
+			var caja = JSON.parse(evento.data);
+			var fila = document.querySelector('tr[data-caja="' + caja.sexo + '-' + caja.id + '"]');
+			if (fila) {
+				fila.remove();
+			}
+		}
+
+		fuente.addEventListener('caja_eliminada', quitar);
+		fuente.addEventListener('caja_retirada', quitar);
+
+		fuente.addEventListener('caja_nueva', function (evento) {
+			// Con filtros o con más de una página no se sabe si la caja entra en esta vista
+			// (el orden es por cepa, fecha de destete e id); mejor no agregarla
+			if (cajas.dataset.filtrado || cajas.dataset.paginado) {
+				return;
+			}
+			var caja = JSON.parse(evento.data);
+			var tabla = document.querySelector('table[data-sexo="' + caja.sexo + '"][data-cepa="' + caja.cepa + '"]');
+			// Ya está si la página se cargó después del cambio o si el evento se repite
+			if (!tabla || document.querySelector('tr[data-caja="' + caja.sexo + '-' + caja.id + '"]')) {
+				return;
+			}
+			var fila = document.createElement('tr');
+			fila.dataset.caja = caja.sexo + '-' + caja.id;
+			celda(fila, caja.caja);
+			celda(fila, caja.cepa);
+			celda(fila, caja.fecha_nacimiento);
+			celda(fila, edad(caja.fecha_nacimiento));
+			celda(fila, caja.fecha_destete);
+			celda(fila, caja.cantidad);
+			var padres = document.createElement('a');
+			padres.href = '/pedigri/' + caja.sexo + '/' + caja.id;
+			padres.title = 'Ver pedigrí';
+			padres.textContent = caja.padres;
+			celda(fila, padres);
+			celda(fila, boton('btn-success', '/observacion-' + caja.sexo + '/' + caja.id, 'Ver/Agregar observaciones'));
+			var acciones = celda(fila, boton('btn-warning', '/retirar-' + caja.sexo + '/' + caja.id, 'Retirar'));
+			acciones.firstChild.onclick = function () {
+				return confirm('¿Retirar la caja ' + caja.caja + '? Pasará al historial.');
+			};
+			tabla.querySelector('tbody').appendChild(fila);
+			resaltar(fila);
+		});
+
+		fuente.addEventListener('observacion', function (evento) {
+			var caja = JSON.parse(evento.data);
+			var fila = document.querySelector('tr[data-caja="' + caja.sexo + '-' + caja.id + '"]');
+			var a = fila && fila.querySelector('a.btn-success');
+			if (!a) {
+				return;
+			}
+			var nuevas = a.querySelector('.badge') || a.appendChild(document.createElement('span'));
+			nuevas.className = 'badge badge-light ml-1';
+			nuevas.textContent = (parseInt(nuevas.textContent, 10) || 0) + 1;
+			nuevas.title = caja.observacion;
+		});
+	}
+}());
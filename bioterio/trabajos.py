@@ -0,0 +1,439 @@
+import codecs
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import click
+from sqlalchemy.exc import OperationalError
+from bioterio import app, db
+from bioterio.models import Trabajo
+from bioterio.paginacion import leer_filtros
+from bioterio.exportar import TABLAS, consulta, escribir_csv, escribir_parquet
+from bioterio.importar import TIPOS as REGISTROS, Importacion, leer_filas, valor_booleano
+from bioterio.pronostico import SEMANAS, MAXIMO_SEMANAS, pronosticar
+from bioterio.contadores import reconciliar
+from bioterio.archivo import DIAS, archivar
+from bioterio.en_vivo import purgar_cambios
+
+# Trabajos pesados fuera de la petición. La cola es la tabla `trabajo` de la misma base:
+# no hace falta ningún broker. `flask trabajos` toma las filas pendientes y las corre en
+# un pool de PROCESOS procesos (los pronósticos y exportaciones usan CPU, no sólo E/S).
+# Cada trabajo reporta su avance en su fila; ahí mismo se pide cancelarlo y se anota el
+# archivo de resultado, que queda en TRABAJOS_DIRECTORIO hasta que se purga.
+app.config.setdefault('TRABAJOS_DIRECTORIO', os.path.join(app.instance_path, 'trabajos'))
+app.config.setdefault('TRABAJOS_PROCESOS', 2)
+app.config.setdefault('TRABAJOS_CONSERVAR', 7)
+
+PENDIENTE, CORRIENDO, TERMINADO, FALLIDO, CANCELADO = 'pendiente', 'corriendo', 'terminado', 'fallido', 'cancelado'
+TERMINADOS = (TERMINADO, FALLIDO, CANCELADO)
+# Cada cuánto revisa la cola el worker y cada cuánto, como máximo, se escribe el avance
+INTERVALO = 1.0
+AVANCE = 0.5
+PURGA = timedelta(hours=1)
+
+log = logging.getLogger(__name__)
+
+# funcion(avance, **parametros) -> resumen; validar(parametros) -> parametros normalizados
+Tipo = namedtuple('Tipo', 'funcion validar admin descripcion')
+TIPOS = {}
+
+
+class Cancelado(Exception):
+    pass
+
+
+def tipo_trabajo(nombre, validar, descripcion, admin=False):
+    def registrar(funcion):
+        TIPOS[nombre] = Tipo(funcion, validar, admin, descripcion)
+        return funcion
+    return registrar
+
+
+def directorio():
+    return app.config['TRABAJOS_DIRECTORIO']
+
+
+class Avance:
+    # Lo que recibe la función de un trabajo. avance(hechos, total, mensaje) escribe el
+    # porcentaje en la fila (a lo más cada AVANCE segundos) y, si alguien pidió cancelar,
+    # lanza Cancelado. Usa su propia conexión: la función no debe llamarlo con una
+    # escritura a medias en su sesión, porque SQLite sólo tiene un escritor.
+
+    def __init__(self, id, usuario_id=None):
+        self.id = id
+        self.usuario_id = usuario_id
+        self.resultado = None
+        self._escrito = 0
+
+    def __call__(self, hechos=0, total=None, mensaje=None, forzar=False):
+        ahora = time.monotonic()
+        if not forzar and ahora - self._escrito < AVANCE:
+            return
+        self._escrito = ahora
+        valores = {'mensaje': mensaje} if mensaje is not None else {}
+        if total:
+            valores['progreso'] = min(99, int(100 * hechos / total))
+        tabla = Trabajo.__table__
+        try:
+            with db.engine.begin() as conexion:
+                if valores:
+                    conexion.execute(tabla.update().where(tabla.c.id == self.id).values(**valores))
+                cancelar = conexion.execute(db.select([tabla.c.cancelar]).where(tabla.c.id == self.id)).scalar()
+        except OperationalError:
+            # Base ocupada: este reporte se pierde, el siguiente llega
+            return
+        if cancelar:
+            raise Cancelado()
+
+    def archivo(self, extension):
+        # Ruta del archivo de resultado; queda anotado en la fila al terminar
+        os.makedirs(directorio(), exist_ok=True)
+        self.resultado = 'trabajo-{}.{}'.format(self.id, extension)
+        return os.path.join(directorio(), self.resultado)
+
+
+def encolar(tipo, parametros=None, usuario_id=None, entrada=None):
+    # Valida y agrega un trabajo pendiente; `entrada` es el archivo (stream binario) de una
+    # importación y se guarda junto a los resultados, con la extensión de su formato ya
+    # validado. Regresa el Trabajo. ValueError si el tipo o los parámetros no son válidos.
+    if tipo not in TIPOS:
+        raise ValueError('Tipo de trabajo desconocido: {}'.format(tipo))
+    if tipo == 'importar' and entrada is None:
+        raise ValueError('Falta el archivo a importar')
+    if tipo != 'importar' and entrada is not None:
+        raise ValueError('Sólo las importaciones reciben un archivo')
+    parametros = TIPOS[tipo].validar(dict(parametros or {}))
+
+    trabajo = Trabajo(tipo=tipo, parametros='{}', usuario_id=usuario_id)
+    db.session.add(trabajo)
+    db.session.flush()
+    if entrada is not None:
+        os.makedirs(directorio(), exist_ok=True)
+        parametros['entrada'] = 'entrada-{}.{}'.format(trabajo.id, EXTENSIONES[parametros['formato']])
+        with open(os.path.join(directorio(), parametros['entrada']), 'wb') as archivo:
+            shutil.copyfileobj(entrada, archivo)
+    trabajo.parametros = json.dumps(parametros)
+    db.session.commit()
+    return trabajo
+
+
+def cancelar(trabajo):
+    # Uno pendiente se cancela de inmediato; uno corriendo se detiene en su siguiente
+    # reporte de avance. Regresa False si ya había terminado.
+    tabla = Trabajo.__table__
+    pendiente = db.session.execute(tabla.update().where(tabla.c.id == trabajo.id, tabla.c.estado == PENDIENTE)
+                                   .values(estado=CANCELADO, cancelar=True, terminado=datetime.now())).rowcount
+    corriendo = db.session.execute(tabla.update().where(tabla.c.id == trabajo.id, tabla.c.estado == CORRIENDO)
+                                   .values(cancelar=True)).rowcount
+    db.session.commit()
+    db.session.refresh(trabajo)
+    return bool(pendiente or corriendo)
+
+
+def ruta_resultado(trabajo):
+    if trabajo.estado != TERMINADO or not trabajo.resultado:
+        return None
+    ruta = os.path.join(directorio(), trabajo.resultado)
+    return ruta if os.path.exists(ruta) else None
+
+
+def datos_trabajo(trabajo):
+    # Lo que se regresa en JSON para consultar el avance
+    return {'id': trabajo.id, 'tipo': trabajo.tipo, 'estado': trabajo.estado, 'progreso': trabajo.progreso,
+            'mensaje': trabajo.mensaje, 'parametros': json.loads(trabajo.parametros),
+            'resumen': json.loads(trabajo.resumen) if trabajo.resumen else None,
+            'resultado': trabajo.resultado if ruta_resultado(trabajo) else None, 'error': trabajo.error,
+            'creado': trabajo.creado, 'iniciado': trabajo.iniciado, 'terminado': trabajo.terminado}
+
+
+# --- Tipos de trabajo ---
+
+def _validar_exportacion(parametros):
+    # `tabla` es el campo del formulario de /exportar; `tablas`, el de /trabajos y la CLI
+    tablas = parametros.get('tablas') or parametros.get('tabla') or list(TABLAS)
+    if isinstance(tablas, str):
+        tablas = [tablas]
+    if any(tabla not in TABLAS for tabla in tablas) or parametros.get('formato', 'csv') not in ('csv', 'parquet'):
+        raise ValueError('Tabla o formato no válido')
+    filtros = {clave: parametros.get(clave) or None for clave in ('cepa', 'desde', 'hasta')}
+    leer_filtros(filtros)
+    return dict(filtros, tablas=tablas, formato=parametros.get('formato', 'csv'),
+                archivo=valor_booleano(parametros.get('archivo')))
+
+
+@tipo_trabajo('exportar', _validar_exportacion, 'Exportar tablas completas (un zip con un archivo por tabla)')
+def _exportar(avance, tablas, formato, cepa=None, desde=None, hasta=None, archivo=False):
+    filtros = leer_filtros({'cepa': cepa, 'desde': desde, 'hasta': hasta})
+    escribir = escribir_parquet if formato == 'parquet' else escribir_csv
+    cuentas = {tabla: consulta(tabla, filtros, archivo)[0].order_by(None).count() for tabla in tablas}
+    db.session.commit()
+    total = sum(cuentas.values())
+    hechas = [0]
+
+    def contar(filas):
+        hechas[0] += filas
+        avance(hechas[0], total, 'Exportando {}'.format(tabla))
+
+    temporal = avance.archivo('zip') + '.parcial'
+    with zipfile.ZipFile(temporal, 'w', zipfile.ZIP_DEFLATED) as comprimido:
+        for tabla in tablas:
+            avance(hechas[0], total, 'Exportando {}'.format(tabla), forzar=True)
+            nombre = '{}.{}'.format(tabla, formato)
+            ruta = '{}-{}'.format(temporal, nombre)
+            try:
+                escribir(tabla, filtros, ruta, avance=contar, archivo=archivo)
+                comprimido.write(ruta, nombre)
+            finally:
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+    os.replace(temporal, avance.archivo('zip'))
+    return {'filas': cuentas}
+
+
+def _validar_pronostico(parametros):
+    semanas = int(parametros.get('semanas') or SEMANAS)
+    if not 1 <= semanas <= MAXIMO_SEMANAS:
+        raise ValueError('Semanas fuera de rango')
+    return {'semanas': semanas}
+
+
+@tipo_trabajo('pronostico', _validar_pronostico, 'Pronóstico de destetes y cajas en JSON')
+def _pronostico(avance, semanas):
+    avance(mensaje='Calculando', forzar=True)
+    resultado = pronosticar(semanas)
+    with open(avance.archivo('json'), 'w') as archivo:
+        json.dump(resultado, archivo, default=str, indent=2)
+    return {'semanas': semanas, 'cepas': len(resultado['cepas'])}
+
+
+# Extensión del archivo de entrada guardado según el formato de la importación
+EXTENSIONES = {'csv': 'csv', 'json': 'jsonl'}
+
+
+def _validar_importacion(parametros):
+    if parametros.get('tipo') not in REGISTROS or parametros.get('formato') not in EXTENSIONES:
+        raise ValueError('Tipo de registro o formato no válido')
+    return {'tipo': parametros['tipo'], 'formato': parametros['formato']}
+
+
+@tipo_trabajo('importar', _validar_importacion, 'Importar un archivo grande de registros')
+def _importar(avance, tipo, formato, entrada):
+    # Se guarda lote por lote: si se cancela, lo ya guardado se queda
+    ruta = os.path.join(directorio(), entrada)
+    total = os.path.getsize(ruta)
+    with open(ruta, 'rb') as binario:
+        def filas():
+            for numero, fila in leer_filas(codecs.getreader('utf-8-sig')(binario), formato):
+                avance(binario.tell(), total, 'Fila {}'.format(numero))
+                yield numero, fila
+        importacion = Importacion(tipo, usuario_id=avance.usuario_id)
+        db.session.commit()
+        importacion.importar(filas())
+    os.remove(ruta)
+    if importacion.errores:
+        with open(avance.archivo('csv'), 'w', newline='', encoding='utf-8') as archivo:
+            archivo.write('fila,error\n')
+            archivo.writelines('{},"{}"\n'.format(numero, error.replace('"', '""'))
+                               for numero, error in importacion.errores)
+    return {'insertados': importacion.insertados, 'errores': len(importacion.errores)}
+
+
+def _validar_reconciliacion(parametros):
+    return {'corregir': valor_booleano(parametros.get('corregir', True))}
+
+
+@tipo_trabajo('reconciliar', _validar_reconciliacion, 'Recalcular los contadores por cepa', admin=True)
+def _reconciliar(avance, corregir):
+    avance(mensaje='Recalculando', forzar=True)
+    diferencias = reconciliar(corregir)
+    return {'diferencias': [{'cepa': cepa, 'columna': columna, 'guardado': guardado, 'real': real}
+                            for cepa, columna, guardado, real in diferencias]}
+
+
+def _validar_archivo(parametros):
+    dias = int(parametros.get('dias') or DIAS)
+    if dias < 0:
+        raise ValueError('Días no válidos')
+    return {'dias': dias}
+
+
+@tipo_trabajo('archivar', _validar_archivo, 'Mover al archivo lo retirado y cerrado', admin=True)
+def _archivar(avance, dias):
+    avance(mensaje='Archivando', forzar=True)
+    return archivar(dias)
+
+
+# --- Worker ---
+
+def _iniciar_proceso():
+    # Con fork el hijo hereda las conexiones del pool del padre; no deben usarse aquí
+    db.engine.dispose(close=False)
+
+
+def ejecutar(id):
+    # Corre un trabajo ya tomado (en un proceso del pool) y anota cómo terminó
+    with app.app_context():
+        trabajo = Trabajo.query.get(id)
+        avance = Avance(id, trabajo.usuario_id)
+        valores = {'estado': TERMINADO, 'progreso': 100, 'mensaje': None}
+        try:
+            if trabajo.cancelar:
+                raise Cancelado()
+            resumen = TIPOS[trabajo.tipo].funcion(avance, **json.loads(trabajo.parametros))
+            valores.update(resumen=json.dumps(resumen, default=str), resultado=avance.resultado)
+        except Cancelado:
+            db.session.rollback()
+            valores = {'estado': CANCELADO, 'mensaje': 'Cancelado'}
+        except Exception as error:
+            db.session.rollback()
+            log.exception('Falló el trabajo %s', id)
+            valores = {'estado': FALLIDO, 'error': '{}: {}'.format(type(error).__name__, error)}
+
+        if valores['estado'] != TERMINADO and avance.resultado:
+            for ruta in (os.path.join(directorio(), avance.resultado),
+                         os.path.join(directorio(), avance.resultado) + '.parcial'):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+        tabla = Trabajo.__table__
+        db.session.execute(tabla.update().where(tabla.c.id == id).values(terminado=datetime.now(), **valores))
+        db.session.commit()
+        db.session.remove()
+        return valores['estado']
+
+
+def tomar(worker):
+    # Marca como corriendo el pendiente más viejo. El UPDATE condicionado al estado hace
+    # que dos workers nunca tomen el mismo: el que pierde busca el siguiente.
+    tabla = Trabajo.__table__
+    while True:
+        id = db.session.query(db.func.min(Trabajo.id)).filter(Trabajo.estado == PENDIENTE).scalar()
+        if id is None:
+            db.session.commit()
+            return None
+        tomado = db.session.execute(tabla.update().where(tabla.c.id == id, tabla.c.estado == PENDIENTE)
+                                    .values(estado=CORRIENDO, worker=worker, iniciado=datetime.now())).rowcount
+        db.session.commit()
+        if tomado:
+            return id
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recuperar():
+    # Los que quedaron corriendo de un worker que ya no existe vuelven a la cola
+    tabla = Trabajo.__table__
+    muertos = {worker for worker, in db.session.query(Trabajo.worker).filter(Trabajo.estado == CORRIENDO).distinct()
+               if worker is None or not _vivo(worker)}
+    recuperados = 0
+    if muertos:
+        recuperados = db.session.execute(tabla.update().where(tabla.c.estado == CORRIENDO,
+                                                              db.or_(tabla.c.worker.in_(muertos - {None}),
+                                                                     tabla.c.worker.is_(None)))
+                                         .values(estado=PENDIENTE, worker=None, progreso=0)).rowcount
+    db.session.commit()
+    return recuperados
+
+
+def purgar(ahora=None, dias=None):
+    # Borra los trabajos terminados hace más de TRABAJOS_CONSERVAR días y sus archivos
+    ahora = ahora or datetime.now()
+    dias = app.config['TRABAJOS_CONSERVAR'] if dias is None else dias
+    viejos = Trabajo.query.filter(Trabajo.estado.in_(TERMINADOS),
+                                  Trabajo.terminado < ahora - timedelta(days=dias)).all()
+    for trabajo in viejos:
+        nombres = [trabajo.resultado, json.loads(trabajo.parametros).get('entrada')]
+        for nombre in filter(None, nombres):
+            ruta = os.path.join(directorio(), nombre)
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        db.session.delete(trabajo)
+    db.session.commit()
+    return len(viejos)
+
+
+def trabajar(procesos=None, una_vez=False):
+    # El ciclo de `flask trabajos`: llena el pool con pendientes hasta que haya
+    # `procesos` corriendo. Con `una_vez` termina cuando ya no queda nada pendiente.
+    procesos = procesos or app.config['TRABAJOS_PROCESOS']
+    worker = os.getpid()
+    recuperar()
+    purgado = datetime.min
+    corriendo = {}
+    with ProcessPoolExecutor(procesos, initializer=_iniciar_proceso) as pool:
+        while True:
+            for futuro in [futuro for futuro in corriendo if futuro.done()]:
+                id = corriendo.pop(futuro)
+                try:
+                    log.info('Trabajo %s: %s', id, futuro.result())
+                except Exception:
+                    # El proceso murió sin anotar nada; la próxima recuperación lo reintenta
+                    log.exception('Se perdió el proceso del trabajo %s', id)
+            while len(corriendo) < procesos:
+                id = tomar(worker)
+                if id is None:
+                    break
+                corriendo[pool.submit(ejecutar, id)] = id
+            if datetime.now() - purgado > PURGA:
+                purgar()
+                purgar_cambios()
+                purgado = datetime.now()
+            db.session.remove()
+
+            if una_vez and not corriendo:
+                return
+            if corriendo:
+                wait(corriendo, timeout=INTERVALO, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(INTERVALO)
+
+
+@app.cli.command('trabajos')
+@click.option('--procesos', type=click.IntRange(1), help='Procesos del pool (TRABAJOS_PROCESOS)')
+@click.option('--una-vez', is_flag=True, help='Termina cuando no quedan pendientes')
+def trabajos_command(procesos, una_vez):
+    """Corre los trabajos en segundo plano de la cola."""
+    trabajar(procesos, una_vez)
+
+
+@app.cli.command('encolar')
+@click.argument('tipo', type=click.Choice(sorted(TIPOS)))
+@click.option('-p', '--parametro', 'parametros', multiple=True, metavar='CLAVE=VALOR',
+              help='Parámetro del trabajo (se puede repetir; tablas=... varias veces para exportar)')
+@click.option('--archivo', type=click.File('rb'), help='Archivo de entrada (importar)')
+def encolar_command(tipo, parametros, archivo):
+    """Agrega un trabajo a la cola e imprime su id."""
+    datos = {}
+    for parametro in parametros:
+        clave, _, valor = parametro.partition('=')
+        datos.setdefault(clave, []).append(valor)
+    datos = {clave: valores if clave == 'tablas' else valores[-1] for clave, valores in datos.items()}
+    try:
+        trabajo = encolar(tipo, datos, entrada=archivo)
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    click.echo(trabajo.id)
+
+
+@app.cli.command('cancelar-trabajo')
+@click.argument('id', type=int)
+def cancelar_command(id):
+    """Cancela un trabajo pendiente o pide que se detenga uno corriendo."""
+    trabajo = Trabajo.query.get(id)
+    if trabajo is None:
+        raise click.ClickException('No existe el trabajo {}'.format(id))
+    if not cancelar(trabajo):
+        raise click.ClickException('El trabajo {} ya había terminado ({})'.format(id, trabajo.estado))
+    click.echo('{}: {}'.format(id, trabajo.estado))
@@ -0,0 +1,55 @@
+"""contadores por cepa
+
+Revision ID: 0a9d5e6b7c24
+Revises: e7f3b8a1c605
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a9d5e6b7c24'
+down_revision = 'e7f3b8a1c605'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('contador_cepa',
+    sa.Column('cepa', sa.String(length=20), nullable=False),
+    sa.Column('machos', sa.Integer(), nullable=False),
+    sa.Column('hembras', sa.Integer(), nullable=False),
+    sa.Column('cajas_macho', sa.Integer(), nullable=False),
+    sa.Column('cajas_hembra', sa.Integer(), nullable=False),
+    sa.Column('cruzas', sa.Integer(), nullable=False),
+    sa.Column('camadas_pendientes', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('cepa')
+    )
+
+    op.execute("""
+        INSERT INTO contador_cepa (cepa, machos, hembras, cajas_macho, cajas_hembra, cruzas,
+                                   camadas_pendientes)
+        SELECT cepa, SUM(machos), SUM(hembras), SUM(cajas_macho), SUM(cajas_hembra), SUM(cruzas),
+               SUM(camadas_pendientes)
+        FROM (
+            SELECT cepa, SUM(cantidad) AS machos, 0 AS hembras, COUNT(*) AS cajas_macho,
+                   0 AS cajas_hembra, 0 AS cruzas, 0 AS camadas_pendientes
+            FROM macho GROUP BY cepa
+            UNION ALL
+            SELECT cepa, 0, SUM(cantidad), 0, COUNT(*), 0, 0 FROM hembra GROUP BY cepa
+            UNION ALL
+            SELECT cepa, 0, 0, 0, 0, COUNT(*), 0 FROM cruza GROUP BY cepa
+            UNION ALL
+            SELECT cruza.cepa, 0, 0, 0, 0, 0, COUNT(*)
+            FROM camada JOIN cruza ON cruza.id = camada.cruza_id
+            WHERE NOT (camada.macho_is_created AND camada.hembra_is_created)
+            GROUP BY cruza.cepa
+        )
+        GROUP BY cepa
+    """)
+
+
+def downgrade():
+    op.drop_table('contador_cepa')
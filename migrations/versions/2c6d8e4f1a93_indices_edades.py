@@ -0,0 +1,26 @@
+"""índices por fecha de nacimiento para el reporte de edades
+
+Revision ID: 2c6d8e4f1a93
+Revises: b5e9d2c7f318
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c6d8e4f1a93'
+down_revision = 'b5e9d2c7f318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_macho_cepa_fecha_nacimiento', 'macho', ['cepa', 'fecha_nacimiento', 'cantidad'], unique=False)
+    op.create_index('ix_hembra_cepa_fecha_nacimiento', 'hembra', ['cepa', 'fecha_nacimiento', 'cantidad'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_hembra_cepa_fecha_nacimiento', table_name='hembra')
+    op.drop_index('ix_macho_cepa_fecha_nacimiento', table_name='macho')
@@ -0,0 +1,49 @@
+"""registro de cajas
+
+Revision ID: 3f1c9a7d2b10
+Revises: a695e27b2b4f
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a7d2b10'
+down_revision = 'a695e27b2b4f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('caja',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('caja', sa.String(length=20), nullable=False),
+    sa.Column('letra', sa.String(length=1), nullable=False),
+    sa.Column('numero', sa.Integer(), nullable=True),
+    sa.Column('tabla', sa.String(length=10), nullable=False),
+    sa.Column('registro_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_caja_caja'), 'caja', ['caja'], unique=False)
+    op.create_index('ix_caja_letra_numero', 'caja', ['letra', 'numero'], unique=False)
+    op.create_index('ix_caja_tabla_registro', 'caja', ['tabla', 'registro_id'], unique=False)
+
+    # Llenar el registro con las cajas que ya existen
+    for tabla in ('cruza', 'macho', 'hembra'):
+        op.execute("""
+            INSERT INTO caja (caja, letra, numero, tabla, registro_id)
+            SELECT caja, substr(caja, 1, 1),
+                   CASE WHEN substr(caja, 2) <> '' AND substr(caja, 2) NOT GLOB '*[^0-9]*'
+                        THEN CAST(substr(caja, 2) AS INTEGER) END,
+                   '{0}', id
+            FROM {0}
+        """.format(tabla))
+
+
+def downgrade():
+    op.drop_index('ix_caja_tabla_registro', table_name='caja')
+    op.drop_index('ix_caja_letra_numero', table_name='caja')
+    op.drop_index(op.f('ix_caja_caja'), table_name='caja')
+    op.drop_table('caja')
@@ -0,0 +1,80 @@
+"""ids sin reusar en las tablas que se archivan
+
+Revision ID: 4a7e2c9d1b86
+Revises: 8f3a1c5e7b29
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a7e2c9d1b86'
+down_revision = '8f3a1c5e7b29'
+branch_labels = None
+depends_on = None
+
+# (tabla, tablas cuyos ids no se deben repetir en ella)
+TABLAS = (
+    ('cruza', ['cruza_archivo']),
+    ('camada', ['camada_archivo']),
+    ('macho', ['macho_archivo']),
+    ('hembra', ['hembra_archivo']),
+    ('observacion', ['observacion_archivo']),
+)
+# Los progenitores apuntan a cajas por id sin llave foránea
+PROGENITORES = {'macho': 'macho', 'hembra': 'hembra'}
+
+TRIGGERS_FTS = (
+    """
+    CREATE TRIGGER observacion_fts_insert AFTER INSERT ON observacion BEGIN
+        INSERT INTO observacion_fts(rowid, observacion) VALUES (new.id, new.observacion);
+    END
+    """,
+    """
+    CREATE TRIGGER observacion_fts_delete AFTER DELETE ON observacion BEGIN
+        INSERT INTO observacion_fts(observacion_fts, rowid, observacion)
+        VALUES ('delete', old.id, old.observacion);
+    END
+    """,
+    """
+    CREATE TRIGGER observacion_fts_update AFTER UPDATE OF observacion ON observacion BEGIN
+        INSERT INTO observacion_fts(observacion_fts, rowid, observacion)
+        VALUES ('delete', old.id, old.observacion);
+        INSERT INTO observacion_fts(rowid, observacion) VALUES (new.id, new.observacion);
+    END
+    """,
+)
+
+
+def _reconstruir(autoincrement):
+    # SQLite no puede agregar AUTOINCREMENT a una tabla existente: se copia a una nueva.
+    # Al borrar la tabla vieja se van sus triggers, así que los del índice de texto
+    # completo se quitan antes y se vuelven a crear después.
+    for trigger in ('observacion_fts_insert', 'observacion_fts_delete', 'observacion_fts_update'):
+        op.execute('DROP TRIGGER IF EXISTS {}'.format(trigger))
+    for tabla, _ in TABLAS:
+        with op.batch_alter_table(tabla, recreate='always',
+                                  table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+            pass
+    for trigger in TRIGGERS_FTS:
+        op.execute(trigger)
+
+
+def upgrade():
+    _reconstruir(True)
+
+    # La copia deja la secuencia en el id más alto que queda en la tabla; los ids que ya
+    # se archivaron o a los que apunta un progenitor pueden ser mayores
+    for tabla, archivos in TABLAS:
+        maximos = ['SELECT MAX(id) FROM {}'.format(nombre) for nombre in [tabla] + archivos]
+        if tabla in PROGENITORES:
+            maximos.append("SELECT MAX(caja_id) FROM progenitor WHERE sexo = '{}'".format(PROGENITORES[tabla]))
+        op.execute("DELETE FROM sqlite_sequence WHERE name = '{}'".format(tabla))
+        op.execute("INSERT INTO sqlite_sequence (name, seq) SELECT '{}', MAX(COALESCE(m, 0)) FROM ({})"
+                   .format(tabla, ' UNION ALL '.join('SELECT ({}) AS m'.format(maximo) for maximo in maximos)))
+
+
+def downgrade():
+    _reconstruir(False)
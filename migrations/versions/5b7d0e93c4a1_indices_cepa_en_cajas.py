@@ -0,0 +1,26 @@
+"""indices cepa en cajas
+
+Revision ID: 5b7d0e93c4a1
+Revises: 8c2e41f0a7d3
+Create Date: 2026-10-18 11:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7d0e93c4a1'
+down_revision = '8c2e41f0a7d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_macho_cepa_fecha_destete', 'macho', ['cepa', 'fecha_destete'], unique=False)
+    op.create_index('ix_hembra_cepa_fecha_destete', 'hembra', ['cepa', 'fecha_destete'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_hembra_cepa_fecha_destete', table_name='hembra')
+    op.drop_index('ix_macho_cepa_fecha_destete', table_name='macho')
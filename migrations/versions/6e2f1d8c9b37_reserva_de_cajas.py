@@ -0,0 +1,39 @@
+"""reserva de cajas
+
+Revision ID: 6e2f1d8c9b37
+Revises: 0a9d5e6b7c24
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e2f1d8c9b37'
+down_revision = '0a9d5e6b7c24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reserva_caja',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('caja', sa.String(length=20), nullable=False),
+    sa.Column('letra', sa.String(length=1), nullable=False),
+    sa.Column('numero', sa.Integer(), nullable=False),
+    sa.Column('expira', sa.DateTime(), nullable=False),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('destino', sa.String(length=30), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('caja')
+    )
+    op.create_index(op.f('ix_reserva_caja_expira'), 'reserva_caja', ['expira'], unique=False)
+    op.create_index('ix_reserva_caja_letra_numero', 'reserva_caja', ['letra', 'numero'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_reserva_caja_letra_numero', table_name='reserva_caja')
+    op.drop_index(op.f('ix_reserva_caja_expira'), table_name='reserva_caja')
+    op.drop_table('reserva_caja')
@@ -0,0 +1,95 @@
+"""archivo
+
+Revision ID: 7d1c4b9e2a60
+Revises: f2b6a9c4d813
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d1c4b9e2a60'
+down_revision = 'f2b6a9c4d813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cruza', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_cierre', sa.DateTime(), nullable=True))
+    with op.batch_alter_table('macho', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_baja', sa.DateTime(), nullable=True))
+    with op.batch_alter_table('hembra', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fecha_baja', sa.DateTime(), nullable=True))
+
+    op.create_table('cruza_archivo',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('caja', sa.String(length=20), nullable=False),
+    sa.Column('cepa', sa.String(length=20), nullable=False),
+    sa.Column('fecha_cruza', sa.DateTime(), nullable=False),
+    sa.Column('machos', sa.Integer(), nullable=True),
+    sa.Column('hembras', sa.Integer(), nullable=True),
+    sa.Column('fecha_cierre', sa.DateTime(), nullable=True),
+    sa.Column('archivada', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_cruza_archivo_caja'), 'cruza_archivo', ['caja'], unique=False)
+
+    op.create_table('camada_archivo',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('fecha_nacimiento', sa.DateTime(), nullable=False),
+    sa.Column('fecha_destete', sa.DateTime(), nullable=False),
+    sa.Column('machos', sa.Integer(), nullable=False),
+    sa.Column('hembras', sa.Integer(), nullable=False),
+    sa.Column('macho_is_created', sa.Boolean(), nullable=False),
+    sa.Column('hembra_is_created', sa.Boolean(), nullable=False),
+    sa.Column('cruza_id', sa.Integer(), nullable=False),
+    sa.Column('archivada', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_camada_archivo_cruza_id'), 'camada_archivo', ['cruza_id'], unique=False)
+
+    for tabla in ('macho_archivo', 'hembra_archivo'):
+        op.create_table(tabla,
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('caja', sa.String(length=20), nullable=False),
+        sa.Column('cepa', sa.String(length=20), nullable=False),
+        sa.Column('fecha_nacimiento', sa.DateTime(), nullable=False),
+        sa.Column('fecha_destete', sa.DateTime(), nullable=False),
+        sa.Column('cantidad', sa.Integer(), nullable=False),
+        sa.Column('padres', sa.String(length=20), nullable=False),
+        sa.Column('cruza_id', sa.Integer(), nullable=False),
+        sa.Column('fecha_baja', sa.DateTime(), nullable=True),
+        sa.Column('archivada', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_{}_caja'.format(tabla)), tabla, ['caja'], unique=False)
+        op.create_index(op.f('ix_{}_cruza_id'.format(tabla)), tabla, ['cruza_id'], unique=False)
+
+    op.create_table('observacion_archivo',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('observacion', sa.Text(), nullable=False),
+    sa.Column('fecha', sa.DateTime(), nullable=False),
+    sa.Column('macho_id', sa.Integer(), nullable=True),
+    sa.Column('hembra_id', sa.Integer(), nullable=True),
+    sa.Column('archivada', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_observacion_archivo_macho_id'), 'observacion_archivo', ['macho_id'], unique=False)
+    op.create_index(op.f('ix_observacion_archivo_hembra_id'), 'observacion_archivo', ['hembra_id'], unique=False)
+
+
+def downgrade():
+    op.drop_table('observacion_archivo')
+    op.drop_table('hembra_archivo')
+    op.drop_table('macho_archivo')
+    op.drop_table('camada_archivo')
+    op.drop_table('cruza_archivo')
+    with op.batch_alter_table('hembra', schema=None) as batch_op:
+        batch_op.drop_column('fecha_baja')
+    with op.batch_alter_table('macho', schema=None) as batch_op:
+        batch_op.drop_column('fecha_baja')
+    with op.batch_alter_table('cruza', schema=None) as batch_op:
+        batch_op.drop_column('fecha_cierre')
@@ -0,0 +1,25 @@
+"""indice destetes pendientes
+
+Revision ID: 8c2e41f0a7d3
+Revises: 3f1c9a7d2b10
+Create Date: 2026-10-18 10:45:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2e41f0a7d3'
+down_revision = '3f1c9a7d2b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_camada_destete_pendiente', 'camada',
+                    ['fecha_destete', 'macho_is_created', 'hembra_is_created'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_camada_destete_pendiente', table_name='camada')
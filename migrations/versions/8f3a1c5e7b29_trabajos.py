@@ -0,0 +1,46 @@
+"""cola de trabajos en segundo plano
+
+Revision ID: 8f3a1c5e7b29
+Revises: 2c6d8e4f1a93
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a1c5e7b29'
+down_revision = '2c6d8e4f1a93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trabajo',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('parametros', sa.Text(), nullable=False),
+    sa.Column('estado', sa.String(length=12), nullable=False),
+    sa.Column('progreso', sa.Integer(), nullable=False),
+    sa.Column('mensaje', sa.String(length=200), nullable=True),
+    sa.Column('cancelar', sa.Boolean(), nullable=False),
+    sa.Column('resumen', sa.Text(), nullable=True),
+    sa.Column('resultado', sa.String(length=100), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('worker', sa.Integer(), nullable=True),
+    sa.Column('creado', sa.DateTime(), nullable=False),
+    sa.Column('iniciado', sa.DateTime(), nullable=True),
+    sa.Column('terminado', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['usuario_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_trabajo_estado', 'trabajo', ['estado', 'id'], unique=False)
+    op.create_index(op.f('ix_trabajo_usuario_id'), 'trabajo', ['usuario_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_trabajo_usuario_id'), table_name='trabajo')
+    op.drop_index('ix_trabajo_estado', table_name='trabajo')
+    op.drop_table('trabajo')
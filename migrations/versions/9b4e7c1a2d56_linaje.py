@@ -0,0 +1,37 @@
+"""linaje
+
+Revision ID: 9b4e7c1a2d56
+Revises: 6e2f1d8c9b37
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e7c1a2d56'
+down_revision = '6e2f1d8c9b37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('progenitor',
+    sa.Column('cruza_id', sa.Integer(), nullable=False),
+    sa.Column('sexo', sa.String(length=6), nullable=False),
+    sa.Column('caja_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['cruza_id'], ['cruza.id'], ),
+    sa.PrimaryKeyConstraint('cruza_id', 'sexo', 'caja_id')
+    )
+    op.create_index('ix_progenitor_sexo_caja', 'progenitor', ['sexo', 'caja_id'], unique=False)
+    # Para bajar de una cruza a las cajas que se destetaron de ella
+    op.create_index(op.f('ix_macho_cruza_id'), 'macho', ['cruza_id'], unique=False)
+    op.create_index(op.f('ix_hembra_cruza_id'), 'hembra', ['cruza_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_hembra_cruza_id'), table_name='hembra')
+    op.drop_index(op.f('ix_macho_cruza_id'), table_name='macho')
+    op.drop_index('ix_progenitor_sexo_caja', table_name='progenitor')
+    op.drop_table('progenitor')
@@ -0,0 +1,91 @@
+"""esquema inicial
+
+Revision ID: a695e27b2b4f
+Revises: 
+Create Date: 2019-11-20 18:02:11.481529
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a695e27b2b4f'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cruza',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('caja', sa.String(length=20), nullable=False),
+    sa.Column('cepa', sa.String(length=20), nullable=False),
+    sa.Column('fecha_cruza', sa.DateTime(), nullable=False),
+    sa.Column('machos', sa.Integer(), nullable=True),
+    sa.Column('hembras', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('email', sa.String(length=64), nullable=True),
+    sa.Column('password_hash', sa.String(length=128), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_table('camada',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('fecha_nacimiento', sa.DateTime(), nullable=False),
+    sa.Column('fecha_destete', sa.DateTime(), nullable=False),
+    sa.Column('machos', sa.Integer(), nullable=False),
+    sa.Column('hembras', sa.Integer(), nullable=False),
+    sa.Column('macho_is_created', sa.Boolean(), nullable=False),
+    sa.Column('hembra_is_created', sa.Boolean(), nullable=False),
+    sa.Column('cruza_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['cruza_id'], ['cruza.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('hembra',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('caja', sa.String(length=20), nullable=False),
+    sa.Column('cepa', sa.String(length=20), nullable=False),
+    sa.Column('fecha_nacimiento', sa.DateTime(), nullable=False),
+    sa.Column('fecha_destete', sa.DateTime(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('padres', sa.String(length=20), nullable=False),
+    sa.Column('cruza_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['cruza_id'], ['cruza.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('macho',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('caja', sa.String(length=20), nullable=False),
+    sa.Column('cepa', sa.String(length=20), nullable=False),
+    sa.Column('fecha_nacimiento', sa.DateTime(), nullable=False),
+    sa.Column('fecha_destete', sa.DateTime(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.Column('padres', sa.String(length=20), nullable=False),
+    sa.Column('cruza_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['cruza_id'], ['cruza.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('observacion',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('observacion', sa.Text(), nullable=False),
+    sa.Column('fecha', sa.DateTime(), nullable=False),
+    sa.Column('macho_id', sa.Integer(), nullable=True),
+    sa.Column('hembra_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['hembra_id'], ['hembra.id'], ),
+    sa.ForeignKeyConstraint(['macho_id'], ['macho.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('observacion')
+    op.drop_table('macho')
+    op.drop_table('hembra')
+    op.drop_table('camada')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
+    op.drop_table('cruza')
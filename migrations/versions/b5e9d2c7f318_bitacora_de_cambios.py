@@ -0,0 +1,33 @@
+"""bitácora de cambios
+
+Revision ID: b5e9d2c7f318
+Revises: 7d1c4b9e2a60
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e9d2c7f318'
+down_revision = '7d1c4b9e2a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cambio',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=20), nullable=False),
+    sa.Column('datos', sa.Text(), nullable=False),
+    sa.Column('fecha', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sqlite_autoincrement=True
+    )
+    op.create_index(op.f('ix_cambio_fecha'), 'cambio', ['fecha'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_cambio_fecha'), table_name='cambio')
+    op.drop_table('cambio')
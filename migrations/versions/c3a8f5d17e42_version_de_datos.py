@@ -0,0 +1,29 @@
+"""version de datos
+
+Revision ID: c3a8f5d17e42
+Revises: 9b4e7c1a2d56
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f5d17e42'
+down_revision = '9b4e7c1a2d56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    version_datos = op.create_table('version_datos',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(version_datos, [{'id': 1, 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('version_datos')
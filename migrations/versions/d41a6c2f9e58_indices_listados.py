@@ -0,0 +1,26 @@
+"""indices listados
+
+Revision ID: d41a6c2f9e58
+Revises: 5b7d0e93c4a1
+Create Date: 2026-10-18 11:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a6c2f9e58'
+down_revision = '5b7d0e93c4a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_cruza_fecha_cruza', 'cruza', ['fecha_cruza'], unique=False)
+    op.create_index(op.f('ix_camada_cruza_id'), 'camada', ['cruza_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_camada_cruza_id'), table_name='camada')
+    op.drop_index('ix_cruza_fecha_cruza', table_name='cruza')
@@ -0,0 +1,52 @@
+"""busqueda de observaciones
+
+Revision ID: e7f3b8a1c605
+Revises: d41a6c2f9e58
+Create Date: 2026-10-18 13:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7f3b8a1c605'
+down_revision = 'd41a6c2f9e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Índice de texto completo (FTS5) sobre observacion.observacion. Es una tabla de
+    # contenido externo: guarda sólo el índice y lo mantienen los triggers.
+    op.execute("""
+        CREATE VIRTUAL TABLE observacion_fts USING fts5(
+            observacion, content='observacion', content_rowid='id', tokenize='unicode61'
+        )
+    """)
+    op.execute("INSERT INTO observacion_fts(observacion_fts) VALUES ('rebuild')")
+    op.execute("""
+        CREATE TRIGGER observacion_fts_insert AFTER INSERT ON observacion BEGIN
+            INSERT INTO observacion_fts(rowid, observacion) VALUES (new.id, new.observacion);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER observacion_fts_delete AFTER DELETE ON observacion BEGIN
+            INSERT INTO observacion_fts(observacion_fts, rowid, observacion)
+            VALUES ('delete', old.id, old.observacion);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER observacion_fts_update AFTER UPDATE OF observacion ON observacion BEGIN
+            INSERT INTO observacion_fts(observacion_fts, rowid, observacion)
+            VALUES ('delete', old.id, old.observacion);
+            INSERT INTO observacion_fts(rowid, observacion) VALUES (new.id, new.observacion);
+        END
+    """)
+
+
+def downgrade():
+    op.execute("DROP TRIGGER observacion_fts_update")
+    op.execute("DROP TRIGGER observacion_fts_delete")
+    op.execute("DROP TRIGGER observacion_fts_insert")
+    op.execute("DROP TABLE observacion_fts")
@@ -0,0 +1,52 @@
+"""registro de cepas
+
+Revision ID: f2b6a9c4d813
+Revises: c3a8f5d17e42
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b6a9c4d813'
+down_revision = 'c3a8f5d17e42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    cepa = op.create_table('cepa',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=20), nullable=False),
+    sa.Column('prefijo', sa.String(length=5), nullable=False),
+    sa.Column('edad_destete', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('nombre'),
+    sa.UniqueConstraint('prefijo')
+    )
+    # Las tres cepas que estaban fijas en el código, con el destete a los 28 días
+    op.bulk_insert(cepa, [
+        {'id': 1, 'nombre': 'C57B6/J', 'prefijo': 'A', 'edad_destete': 28},
+        {'id': 2, 'nombre': 'CD45.1', 'prefijo': 'B', 'edad_destete': 28},
+        {'id': 3, 'nombre': 'RAG1+/-', 'prefijo': 'C', 'edad_destete': 28},
+    ])
+
+    # Los prefijos pueden tener más de una letra
+    with op.batch_alter_table('caja', schema=None) as batch_op:
+        batch_op.alter_column('letra', existing_type=sa.String(length=1), type_=sa.String(length=5),
+                              existing_nullable=False)
+    with op.batch_alter_table('reserva_caja', schema=None) as batch_op:
+        batch_op.alter_column('letra', existing_type=sa.String(length=1), type_=sa.String(length=5),
+                              existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('reserva_caja', schema=None) as batch_op:
+        batch_op.alter_column('letra', existing_type=sa.String(length=5), type_=sa.String(length=1),
+                              existing_nullable=False)
+    with op.batch_alter_table('caja', schema=None) as batch_op:
+        batch_op.alter_column('letra', existing_type=sa.String(length=5), type_=sa.String(length=1),
+                              existing_nullable=False)
+    op.drop_table('cepa')